@@ -1,9 +1,74 @@
-from django.contrib import admin
+from django import forms
+from django.conf import settings
+from django.contrib import admin, messages
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
-from .models import User, Appointment
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections
+from django.db.models import Q
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path
+from django.utils import timezone
+from django.utils.functional import cached_property
+from .search import matching_ids
+from .provisioning import IMPORT_COLUMNS, import_users, read_csv
+from .models import User, Appointment, DoctorSchedule, ScheduleException, Medicine, StockBatch, Order, OrderItem, Job
+
+_options = getattr(settings, 'ADMIN_CHANGELIST', {})
+
+
+def estimated_row_count(queryset):
+    """Rows in the queryset's table as of the last ANALYZE, or None."""
+    connection = connections[queryset.db]
+    if connection.vendor != 'sqlite':
+        return None
+    try:
+        with connection.cursor() as cursor:
+            # Each index has a row whose stat starts with its entry count; a
+            # partial index covers only some rows, so take the largest
+            cursor.execute('SELECT MAX(CAST(stat AS INTEGER)) FROM sqlite_stat1 WHERE tbl = %s',
+                           [queryset.model._meta.db_table])
+            row = cursor.fetchone()
+    except DatabaseError:
+        # No sqlite_stat1 until ANALYZE has run once
+        return None
+    return row[0]
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Changelist paginator that never counts a whole large table. Unfiltered
+    lists report the estimate from SQLite's statistics; filtered ones stop
+    counting at COUNT_LIMIT rows, so pages past it are reached by narrowing
+    the filters.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimated_row_count(queryset)
+            if estimate is not None:
+                return estimate
+        return queryset.order_by()[:_options.get('COUNT_LIMIT', 10000)].count()
+
+
+class LargeTableAdminMixin:
+    paginator = EstimatedCountPaginator
+    # Skips the second, unfiltered COUNT(*) behind "N results (M total)"
+    show_full_result_count = False
+    show_facets = admin.ShowFacets.NEVER
+
+
+class ImportUsersForm(forms.Form):
+    csv_file = forms.FileField(label='CSV file')
+    dry_run = forms.BooleanField(required=False, help_text='Only check the file for errors')
 
 @admin.register(User)
-class UserAdmin(BaseUserAdmin):
+class UserAdmin(LargeTableAdminMixin, BaseUserAdmin):
+    change_list_template = 'admin/api/user/change_list.html'
+    # Rejected rows shown on the import page
+    max_import_errors = 200
     list_display = ('uiu_id', 'username', 'email', 'role',
                     'first_name', 'last_name', 'is_active')
     list_filter = ('role', 'is_active', 'is_staff')
@@ -24,10 +89,119 @@ class UserAdmin(BaseUserAdmin):
         }),
     )
 
+    def get_urls(self):
+        return [
+            path('import/', self.admin_site.admin_view(self.import_users_view),
+                 name='api_user_import'),
+        ] + super().get_urls()
+
+    def import_users_view(self, request):
+        if not self.has_add_permission(request):
+            return redirect('admin:api_user_changelist')
+        form = ImportUsersForm(request.POST or None, request.FILES or None)
+        result = None
+        if request.method == 'POST' and form.is_valid():
+            try:
+                rows = read_csv(form.cleaned_data['csv_file'].read())
+            except (UnicodeDecodeError, ValueError) as e:
+                form.add_error('csv_file', str(e))
+            else:
+                dry_run = form.cleaned_data['dry_run']
+                result = import_users(rows, dry_run=dry_run)
+                verb = 'would be created' if dry_run else 'created'
+                self.message_user(
+                    request, f'{result.created} of {result.rows} users {verb}, '
+                    f'{len(result.errors)} rows rejected',
+                    messages.WARNING if result.errors else messages.SUCCESS)
+                if not result.errors and not dry_run:
+                    return redirect('admin:api_user_changelist')
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Import users',
+            'form': form,
+            'columns': IMPORT_COLUMNS,
+            'result': result,
+            'errors': result.errors[:self.max_import_errors] if result else (),
+        }
+        return TemplateResponse(request, 'admin/api/user/import_users.html', context)
+
 @admin.register(Appointment)
-class AppointmentAdmin(admin.ModelAdmin):
+class AppointmentAdmin(LargeTableAdminMixin, admin.ModelAdmin):
+    change_list_template = 'admin/api/appointment/change_list.html'
     list_display = ('id', 'patient', 'doctor', 'date', 'time', 'status', 'emergency', 'created_at')
+    # Each served by an index: appt_status_date_idx, appt_emergency_idx
+    # (for emergencies) and appt_date_time_idx
     list_filter = ('status', 'emergency', 'date')
-    search_fields = ('patient__uiu_id', 'patient__first_name', 'doctor__first_name', 'reason')
-    ordering = ('-date', '-created_at')
+    list_select_related = ('patient', 'doctor')
+    raw_id_fields = ('patient', 'doctor', 'claimed_by')
+    # Matched through the user admin and the full-text index, see
+    # get_search_results
+    search_fields = ('patient__uiu_id', 'patient__first_name', 'doctor__first_name', 'reason', 'notes')
+    # The order of appt_date_time_idx, as in the API's appointment list
+    ordering = ('-date', '-time', 'id')
     date_hierarchy = 'date'
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        # Find the people in the much smaller user table first, so their
+        # appointments come from the patient and doctor indexes rather than
+        # a join and LIKE over every appointment
+        users, _ = self.admin_site.get_model_admin(User).get_search_results(
+            request, User.objects.all(), search_term)
+        users = users.values('pk')
+        return queryset.filter(Q(patient__in=users) | Q(doctor__in=users) |
+                               Q(pk__in=matching_ids(search_term))), False
+
+@admin.register(DoctorSchedule)
+class DoctorScheduleAdmin(admin.ModelAdmin):
+    list_display = ('doctor', 'weekday', 'start_time', 'end_time', 'slot_minutes')
+    list_filter = ('weekday',)
+    list_select_related = ('doctor',)
+    search_fields = ('doctor__uiu_id', 'doctor__first_name')
+
+@admin.register(ScheduleException)
+class ScheduleExceptionAdmin(admin.ModelAdmin):
+    list_display = ('doctor', 'date', 'start_time', 'end_time', 'reason')
+    list_filter = ('date',)
+    list_select_related = ('doctor',)
+    search_fields = ('doctor__uiu_id', 'doctor__first_name', 'reason')
+
+class StockBatchInline(admin.TabularInline):
+    model = StockBatch
+    extra = 0
+
+@admin.register(Medicine)
+class MedicineAdmin(admin.ModelAdmin):
+    list_display = ('name', 'generic_name', 'form', 'strength', 'unit_price', 'is_active')
+    list_filter = ('form', 'is_active')
+    search_fields = ('name', 'generic_name')
+    inlines = [StockBatchInline]
+
+class OrderItemInline(admin.TabularInline):
+    model = OrderItem
+    extra = 0
+    raw_id_fields = ('medicine', 'batch')
+
+@admin.register(Order)
+class OrderAdmin(admin.ModelAdmin):
+    list_display = ('id', 'patient', 'status', 'total', 'created_at')
+    list_filter = ('status',)
+    list_select_related = ('patient',)
+    search_fields = ('patient__uiu_id',)
+    raw_id_fields = ('patient',)
+    inlines = [OrderItemInline]
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'status', 'attempts', 'max_attempts', 'run_at', 'locked_by')
+    list_filter = ('status', 'kind')
+    readonly_fields = ('attempts', 'locked_by', 'locked_until', 'last_error', 'created_at', 'updated_at')
+    actions = ['retry']
+
+    @admin.action(description='Retry selected jobs now')
+    def retry(self, request, queryset):
+        count = queryset.exclude(status='running').update(
+            status='queued', attempts=0, run_at=timezone.now(), locked_until=None)
+        self.message_user(request, f'{count} jobs queued again')
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        # Job handlers first: the signal receivers enqueue their jobs
+        from . import notifications, signals  # noqa: F401
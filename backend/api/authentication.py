@@ -0,0 +1,148 @@
+import copy
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import caches
+from django.utils.crypto import constant_time_compare
+from django.utils.translation import gettext_lazy as _
+from rest_framework.authentication import BaseAuthentication, get_authorization_header
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .caching import TTLCache
+
+
+class UserCache:
+    """
+    Two-level cache of user rows keyed by primary key: an in-process LRU in
+    front of an optional shared Django cache. Entries are dropped by the
+    User save/delete signals, so the TTL only bounds staleness for changes
+    made through queryset.update() or by other workers.
+    """
+    key_prefix = 'api:auth-user:'
+
+    def __init__(self, max_size=10000, timeout=60, cache_alias=None):
+        self.timeout = timeout
+        self.cache_alias = cache_alias
+        self.local = TTLCache(max_size=max_size, ttl=timeout)
+
+    @property
+    def shared(self):
+        return caches[self.cache_alias] if self.cache_alias else None
+
+    def get(self, pk):
+        pk = str(pk)
+        user = self.local.get(pk)
+        if user is None and self.shared is not None:
+            user = self.shared.get(f'{self.key_prefix}{pk}')
+            if user is not None:
+                self.local.set(pk, user)
+        # Hand out copies so a view mutating request.user can't leak into
+        # other requests sharing the cached instance
+        return copy.copy(user) if user is not None else None
+
+    def set(self, pk, user):
+        pk = str(pk)
+        self.local.set(pk, user)
+        if self.shared is not None:
+            self.shared.set(f'{self.key_prefix}{pk}', user, self.timeout)
+
+    def invalidate(self, pk):
+        pk = str(pk)
+        self.local.delete(pk)
+        if self.shared is not None:
+            self.shared.delete(f'{self.key_prefix}{pk}')
+
+    def clear(self):
+        self.local.clear()
+
+
+_options = getattr(settings, 'AUTH_USER_CACHE', {})
+user_cache = UserCache(
+    max_size=_options.get('MAX_SIZE', 10000),
+    timeout=_options.get('TIMEOUT', 60),
+    cache_alias=_options.get('CACHE_ALIAS'),
+)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that resolves the token's user through `user_cache`
+    instead of querying the user table on every request.
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(
+                _("Token contained no recognizable user identification")
+            ) from e
+
+        user = user_cache.get(user_id)
+        if user is None:
+            try:
+                user = self.user_model.objects.get(**{api_settings.USER_ID_FIELD: user_id})
+            except self.user_model.DoesNotExist as e:
+                raise AuthenticationFailed(
+                    _("User not found"), code="user_not_found"
+                ) from e
+            user_cache.set(user_id, user)
+            user = copy.copy(user)
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(
+                api_settings.REVOKE_TOKEN_CLAIM
+            ) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(
+                    _("The user's password has been changed."), code="password_changed"
+                )
+
+        return user
+
+
+def authenticate_stream_request(request):
+    """
+    Resolve the user of a plain Django request from its Bearer header or a
+    `token` query parameter. Returns None when neither holds a valid token.
+    """
+    authenticator = CachedJWTAuthentication()
+    raw_token = request.GET.get('token')
+    if not raw_token:
+        header = authenticator.get_header(request)
+        raw_token = authenticator.get_raw_token(header) if header else None
+    if not raw_token:
+        return None
+    try:
+        return authenticator.get_user(authenticator.get_validated_token(raw_token))
+    except (InvalidToken, AuthenticationFailed):
+        return None
+
+
+# request.auth of a request let in by MetricsTokenAuthentication
+METRICS_SCRAPER = 'metrics-scraper'
+
+
+class MetricsTokenAuthentication(BaseAuthentication):
+    """
+    Accepts `Authorization: Bearer <settings.METRICS['TOKEN']>` from a
+    metrics scraper, as an anonymous user with request.auth set to
+    METRICS_SCRAPER. Other headers are left to the classes after it.
+    """
+
+    def authenticate(self, request):
+        token = getattr(settings, 'METRICS', {}).get('TOKEN')
+        header = get_authorization_header(request).split()
+        if not token or len(header) != 2 or header[0] != b'Bearer':
+            return None
+        if not constant_time_compare(header[1], token.encode()):
+            return None
+        return AnonymousUser(), METRICS_SCRAPER
+
+    def authenticate_header(self, request):
+        return 'Bearer realm="api"'
@@ -0,0 +1,108 @@
+import datetime
+from collections import defaultdict
+
+from django.utils import timezone
+
+from .models import Appointment, DoctorSchedule, ScheduleException
+
+TIME_FORMATS = ('%I:%M %p', '%H:%M', '%H:%M:%S')
+DISPLAY_FORMAT = '%I:%M %p'
+
+
+def parse_slot_time(value):
+    for fmt in TIME_FORMATS:
+        try:
+            return datetime.datetime.strptime(value.strip(), fmt).time()
+        except ValueError:
+            continue
+    return None
+
+
+def _schedule_slots(schedule):
+    start = datetime.datetime.combine(datetime.date.min, schedule.start_time)
+    end = datetime.datetime.combine(datetime.date.min, schedule.end_time)
+    step = datetime.timedelta(minutes=schedule.slot_minutes)
+    while start + step <= end:
+        yield start.time(), (start + step).time()
+        start += step
+
+
+def _is_blocked(start, end, exceptions):
+    for exception in exceptions:
+        if exception.start_time is None or exception.end_time is None:
+            return True
+        if start < exception.end_time and exception.start_time < end:
+            return True
+    return False
+
+
+def is_past(date, start, now=None):
+    """Whether a slot has already started, as of `now` in the local timezone."""
+    now = now or timezone.localtime()
+    return date < now.date() or (date == now.date() and start <= now.time())
+
+
+def get_free_slots(doctor, date_from, date_to):
+    """
+    Return the doctor's open slots between two dates (inclusive) as a list of
+    (date, start, end) tuples in chronological order.
+    """
+    schedules = defaultdict(list)
+    for schedule in DoctorSchedule.objects.filter(doctor=doctor):
+        schedules[schedule.weekday].append(schedule)
+    if not schedules:
+        return []
+
+    exceptions = defaultdict(list)
+    for exception in ScheduleException.objects.filter(
+            doctor=doctor, date__range=(date_from, date_to)):
+        exceptions[exception.date].append(exception)
+
+    booked = set(
+        Appointment.objects
+        .filter(doctor=doctor, date__range=(date_from, date_to),
+                slot_start__isnull=False)
+        .exclude(status='cancelled')
+        .values_list('date', 'slot_start')
+    )
+
+    now = timezone.localtime()
+    slots = []
+    day = date_from
+    while day <= date_to:
+        for schedule in schedules.get(day.weekday(), ()):
+            for start, end in _schedule_slots(schedule):
+                if (day, start) in booked:
+                    continue
+                if is_past(day, start, now):
+                    continue
+                if _is_blocked(start, end, exceptions.get(day, ())):
+                    continue
+                slots.append((day, start, end))
+        day += datetime.timedelta(days=1)
+    return slots
+
+
+def is_bookable(doctor, date, start):
+    """
+    Check that a start time lines up with one of the doctor's working slots.
+    Doctors without a published schedule accept any time.
+    """
+    schedules = list(DoctorSchedule.objects.filter(doctor=doctor, weekday=date.weekday()))
+    if not schedules:
+        return not DoctorSchedule.objects.filter(doctor=doctor).exists()
+    exceptions = list(ScheduleException.objects.filter(doctor=doctor, date=date))
+    for schedule in schedules:
+        for slot_start, slot_end in _schedule_slots(schedule):
+            if slot_start == start:
+                return not _is_blocked(slot_start, slot_end, exceptions)
+    return False
+
+
+def format_slot(date, start, end):
+    return {
+        'date': date.isoformat(),
+        'time': start.strftime(DISPLAY_FORMAT),
+        'start': start.strftime('%H:%M'),
+        'end': end.strftime('%H:%M'),
+    }
@@ -0,0 +1,23 @@
+from django.contrib.auth.backends import ModelBackend
+
+from .models import User
+
+
+class UIUIDBackend(ModelBackend):
+    """
+    Authenticates with a UIU ID and password in a single user lookup, rather
+    than resolving the username first and letting ModelBackend query again.
+    """
+
+    def authenticate(self, request, uiu_id=None, password=None, **kwargs):
+        if uiu_id is None or password is None:
+            return None
+        try:
+            user = User._default_manager.get(uiu_id=uiu_id)
+        except User.DoesNotExist:
+            # Run the hasher anyway so unknown IDs take as long as bad passwords
+            User().set_password(password)
+            return None
+        if user.check_password(password) and self.user_can_authenticate(user):
+            return user
+        return None
@@ -0,0 +1,126 @@
+import calendar
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+from .exports import USER_COLUMNS, user_rows
+from .models import User
+
+_options = getattr(settings, 'RESPONSE_CACHE', {})
+
+
+def make_etag(*parts):
+    return quote_etag(hashlib.md5(repr(parts).encode()).hexdigest())
+
+
+def collection_validators(queryset, fields=('updated_at',), *parts):
+    """
+    ETag and Last-Modified for the rows of `queryset`, from the newest of
+    `fields` and the row count (so deletions change the ETag too). Returns
+    None when the queryset is empty.
+    """
+    stats = queryset.order_by().aggregate(
+        count=Count('pk'), **{f'max_{index}': Max(field) for index, field in enumerate(fields)})
+    if not stats['count']:
+        return None
+    stamps = [stats[f'max_{index}'] for index in range(len(fields))]
+    last_modified = max(stamp for stamp in stamps if stamp is not None)
+    return make_etag(*parts, *stamps, stats['count']), last_modified
+
+
+def page_validators(rows, *parts):
+    """
+    ETag for one page of a list, from `rows` of (pk, timestamps...) for the
+    rows actually served, so it costs nothing beyond fetching the page. Rows
+    joining or leaving the page change it as well as edits. No Last-Modified:
+    a row leaving the page can bring in an older one, which it would miss.
+    Returns None for an empty page.
+    """
+    if not rows:
+        return None
+    return make_etag(*parts, [tuple(row) for row in rows]), None
+
+
+def conditional_response(request, validators, respond):
+    """
+    304 Not Modified when the request's If-None-Match or If-Modified-Since
+    still match `validators`, otherwise `respond()`, with the validators
+    and Cache-Control set on a 200.
+    """
+    etag, last_modified = validators
+    timestamp = calendar.timegm(last_modified.utctimetuple()) if last_modified else None
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is None:
+        response = respond()
+        if response.status_code != 200:
+            return response
+    response['ETag'] = etag
+    if timestamp is not None:
+        response['Last-Modified'] = http_date(timestamp)
+    # Responses depend on the caller, so only the browser may keep them,
+    # and it has to revalidate each time
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+class ConditionalGetMixin:
+    """
+    Answer GET with 304 Not Modified when the client's If-None-Match or
+    If-Modified-Since still match `get_validators()`, before the view
+    queries or serializes anything else.
+    """
+
+    def get_validators(self, request):
+        """Return (etag, last_modified) for the requested resource, or None."""
+        raise NotImplementedError
+
+    def get(self, request, *args, **kwargs):
+        validators = self.get_validators(request)
+        if validators is None:
+            return super().get(request, *args, **kwargs)
+        return conditional_response(request, validators,
+                                    lambda: super(ConditionalGetMixin, self).get(request, *args, **kwargs))
+
+
+class CachedCollection:
+    """
+    A list response kept in the Django cache with its validators, so repeat
+    requests cost neither a query nor serialization. `invalidate()` is
+    called from model signals; `timeout` bounds staleness for changes that
+    bypass them.
+    """
+
+    def __init__(self, key, get_queryset, build_rows, fields=('updated_at',)):
+        self.key = key
+        self.get_queryset = get_queryset
+        self.build_rows = build_rows
+        self.fields = fields
+
+    @property
+    def cache(self):
+        return caches[_options.get('CACHE_ALIAS', 'default')]
+
+    def get(self):
+        """Return (etag, last_modified, rows)."""
+        entry = self.cache.get(self.key)
+        if entry is None:
+            queryset = self.get_queryset()
+            etag, last_modified = collection_validators(queryset, self.fields, self.key) or (
+                make_etag(self.key), None)
+            entry = (etag, last_modified, list(self.build_rows(queryset)))
+            self.cache.set(self.key, entry, _options.get('TIMEOUT', 300))
+        return entry
+
+    def invalidate(self):
+        self.cache.delete(self.key)
+
+
+doctor_list = CachedCollection(
+    'api:doctor-list',
+    lambda: User.objects.filter(role='STAFF'),
+    lambda queryset: [dict(zip(USER_COLUMNS, row)) for row in user_rows(queryset)],
+)
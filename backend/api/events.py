@@ -0,0 +1,126 @@
+import asyncio
+import json
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+_options = getattr(settings, 'EVENTS', {})
+HEARTBEAT_SECONDS = _options.get('HEARTBEAT_SECONDS', 15)
+QUEUE_SIZE = _options.get('QUEUE_SIZE', 100)
+
+
+class Subscription:
+    """
+    One open event stream. Events are handed over from any thread onto the
+    subscriber's event loop; a slow client that fills its queue loses its
+    oldest events rather than holding up the publisher.
+    """
+
+    def __init__(self, broker, user_id, maxsize=QUEUE_SIZE):
+        self.broker = broker
+        self.user_id = user_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=maxsize)
+
+    def deliver(self, event):
+        self.loop.call_soon_threadsafe(self._put, event)
+
+    def _put(self, event):
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(event)
+
+    async def get(self, timeout=None):
+        """Wait for the next event; returns None if `timeout` passes first."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class InProcessBroker:
+    """
+    Pub/sub within one process. Idle subscribers cost one queue and one
+    parked task each, so a single ASGI worker can hold thousands of them.
+    """
+
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id):
+        subscription = Subscription(self, user_id)
+        with self._lock:
+            self._subscribers[user_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.user_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.user_id]
+
+    def publish(self, user_ids, event):
+        """Send `event` to every open stream of `user_ids`. Safe from any thread."""
+        with self._lock:
+            targets = [subscription for user_id in set(user_ids)
+                       for subscription in self._subscribers.get(user_id, ())]
+        for subscription in targets:
+            subscription.deliver(event)
+
+    def connection_count(self):
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+
+class RedisBroker(InProcessBroker):
+    """
+    Fans events out across worker processes through Redis pub/sub. Each
+    worker keeps its local subscribers and relays messages from the shared
+    channel to them. Requires the `redis` package.
+    """
+    channel = 'uiu-healthcare:events'
+
+    def __init__(self, url=None):
+        super().__init__()
+        try:
+            import redis
+        except ImportError:
+            raise ImproperlyConfigured('RedisBroker requires the "redis" package.')
+        self.client = redis.Redis.from_url(url or _options.get('REDIS_URL', 'redis://localhost:6379/0'))
+        self._listener = None
+
+    def subscribe(self, user_id):
+        if self._listener is None:
+            self._start_listener()
+        return super().subscribe(user_id)
+
+    def publish(self, user_ids, event):
+        self.client.publish(self.channel, json.dumps({'user_ids': list(user_ids), 'event': event}))
+
+    def _start_listener(self):
+        with self._lock:
+            if self._listener is not None:
+                return
+            pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(**{self.channel: self._relay})
+            self._listener = pubsub.run_in_thread(sleep_time=1.0, daemon=True)
+
+    def _relay(self, message):
+        payload = json.loads(message['data'])
+        super().publish(payload['user_ids'], payload['event'])
+
+
+broker = import_string(_options.get('BACKEND', 'api.events.InProcessBroker'))()
+
+
+def format_sse(event):
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
@@ -0,0 +1,96 @@
+import csv
+import json
+
+from django.http import StreamingHttpResponse
+from rest_framework.fields import DateTimeField
+
+CHUNK_SIZE = 2000
+
+_datetime_field = DateTimeField()
+
+
+def _display_name(first_name, last_name, username):
+    return f"{first_name} {last_name}".strip() or username
+
+
+def _iso(value):
+    return _datetime_field.to_representation(value) if value is not None else None
+
+
+APPOINTMENT_COLUMNS = ('id', 'patient_id', 'patient_name', 'doctor_id', 'doctor_name',
+                       'date', 'time', 'status', 'reason', 'emergency', 'notes',
+                       'created_at', 'updated_at')
+
+APPOINTMENT_VALUES = ('id', 'patient__uiu_id', 'patient__first_name', 'patient__last_name',
+                      'patient__username', 'doctor__uiu_id', 'doctor__first_name',
+                      'doctor__last_name', 'doctor__username', 'date', 'time', 'status',
+                      'reason', 'emergency', 'notes', 'created_at', 'updated_at')
+
+
+def appointment_row(values):
+    """Turn one APPOINTMENT_VALUES tuple into AppointmentSerializer-shaped values."""
+    (pk, patient_id, patient_first, patient_last, patient_username, doctor_id,
+     doctor_first, doctor_last, doctor_username, date, time, status, reason,
+     emergency, notes, created_at, updated_at) = values
+    return (pk, patient_id, _display_name(patient_first, patient_last, patient_username),
+            doctor_id, _display_name(doctor_first, doctor_last, doctor_username),
+            date.isoformat(), time, status, reason, emergency, notes,
+            _iso(created_at), _iso(updated_at))
+
+
+def appointment_rows(queryset):
+    """Yield AppointmentSerializer-shaped tuples straight from DB rows."""
+    rows = queryset.values_list(*APPOINTMENT_VALUES).iterator(chunk_size=CHUNK_SIZE)
+    return map(appointment_row, rows)
+
+
+USER_COLUMNS = ('id', 'uiuId', 'name', 'email', 'role', 'phone', 'department',
+                'created_at')
+
+USER_VALUES = ('id', 'uiu_id', 'first_name', 'last_name', 'username', 'email', 'role',
+               'phone', 'department', 'created_at')
+
+
+def user_row(values):
+    """Turn one USER_VALUES tuple into UserSerializer-shaped values."""
+    pk, uiu_id, first_name, last_name, username, email, role, phone, department, created_at = values
+    return (pk, uiu_id, _display_name(first_name, last_name, username), email,
+            role.lower(), phone, department, _iso(created_at))
+
+
+def user_rows(queryset):
+    """Yield UserSerializer-shaped tuples straight from DB rows."""
+    rows = queryset.values_list(*USER_VALUES).iterator(chunk_size=CHUNK_SIZE)
+    return map(user_row, rows)
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def _csv_lines(columns, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def _ndjson_lines(columns, rows):
+    for row in rows:
+        yield json.dumps(dict(zip(columns, row)), ensure_ascii=False) + '\n'
+
+
+def stream_export(export_format, name, columns, rows):
+    """
+    Stream `rows` as CSV or NDJSON. Rows are produced lazily from a chunked
+    DB iterator, so memory use does not grow with the size of the export.
+    """
+    if export_format == 'csv':
+        lines, content_type = _csv_lines(columns, rows), 'text/csv; charset=utf-8'
+    else:
+        lines, content_type = _ndjson_lines(columns, rows), 'application/x-ndjson; charset=utf-8'
+        export_format = 'ndjson'
+    response = StreamingHttpResponse(lines, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{name}.{export_format}"'
+    return response
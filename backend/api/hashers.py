@@ -0,0 +1,17 @@
+from django.conf import settings
+from django.contrib.auth.hashers import Argon2PasswordHasher
+
+_options = getattr(settings, 'PASSWORD_HASHING', {})
+
+
+class TunedArgon2PasswordHasher(Argon2PasswordHasher):
+    """
+    Argon2id with the work factor taken from settings.PASSWORD_HASHING.
+    The defaults follow the OWASP baseline (19 MiB, 2 passes, 1 lane):
+    single-lane hashes don't fight each other for cores when a burst of
+    logins arrives at once. Changing the parameters makes Django re-hash
+    each password on its owner's next login.
+    """
+    time_cost = _options.get('ARGON2_TIME_COST', 2)
+    memory_cost = _options.get('ARGON2_MEMORY_COST', 19456)
+    parallelism = _options.get('ARGON2_PARALLELISM', 1)
@@ -0,0 +1,186 @@
+import contextlib
+import datetime
+import functools
+import json
+import threading
+import time
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.crypto import salted_hmac
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+_options = getattr(settings, 'IDEMPOTENCY', {})
+TTL = datetime.timedelta(hours=_options.get('TTL_HOURS', 24))
+WAIT_SECONDS = _options.get('WAIT_SECONDS', 10)
+LOCK_SECONDS = _options.get('LOCK_SECONDS', 30)
+POLL_SECONDS = 0.1
+
+HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+
+# (scope, key) -> Event set when the request running it in this process ends
+_running = {}
+_running_lock = threading.Lock()
+
+
+def fingerprint(request):
+    body = json.dumps(request.data, sort_keys=True, default=str)
+    return salted_hmac('api.idempotency', f'{request.method} {request.path} {body}',
+                       algorithm='sha256').hexdigest()
+
+
+def claim(scope, key, request_fingerprint):
+    """
+    Take `key` for a new run and return the lock token, or None when
+    another request holds it or has already finished. Expired keys, and
+    keys whose request died holding the lock, are taken over with a
+    conditional UPDATE so only one retry wins.
+    """
+    now = timezone.now()
+    locked_until = now + datetime.timedelta(seconds=LOCK_SECONDS)
+    stale = Q(expires_at__lte=now) | Q(fingerprint=request_fingerprint, status_code__isnull=True,
+                                       locked_until__lte=now)
+    if IdempotencyKey.objects.filter(stale, scope=scope, key=key).update(
+            fingerprint=request_fingerprint, status_code=None, response=None,
+            locked_until=locked_until, expires_at=now + TTL):
+        return locked_until
+    try:
+        with transaction.atomic():
+            IdempotencyKey.objects.create(scope=scope, key=key, fingerprint=request_fingerprint,
+                                          locked_until=locked_until, expires_at=now + TTL)
+    except IntegrityError:
+        return None
+    return locked_until
+
+
+@contextlib.contextmanager
+def running(scope, key):
+    event = threading.Event()
+    with _running_lock:
+        _running[scope, key] = event
+    try:
+        yield
+    finally:
+        with _running_lock:
+            _running.pop((scope, key), None)
+        event.set()
+
+
+def wait(scope, key, timeout):
+    # Woken as soon as a request in this process finishes; requests in
+    # other processes are polled
+    with _running_lock:
+        event = _running.get((scope, key))
+    if event is None:
+        time.sleep(timeout)
+    else:
+        event.wait(timeout)
+
+
+def replay(record):
+    response = Response(record.response, status=record.status_code)
+    response[REPLAYED_HEADER] = 'true'
+    return response
+
+
+def execute(scope, key, locked_until, handler, stored_data):
+    owned = IdempotencyKey.objects.filter(scope=scope, key=key, locked_until=locked_until,
+                                          status_code__isnull=True)
+    with running(scope, key):
+        try:
+            response = handler()
+        except Exception:
+            owned.delete()
+            raise
+        # Server errors and throttling are worth retrying, so they free the key
+        if response.status_code >= 500 or response.status_code == status.HTTP_429_TOO_MANY_REQUESTS:
+            owned.delete()
+        else:
+            owned.update(status_code=response.status_code, response=stored_data(response.data),
+                         locked_until=None)
+    return response
+
+
+def run_once(request, scope, key, handler, stored_data=lambda data: data, replayed=replay):
+    """
+    Run `handler` for the first request with `key` in `scope` and replay
+    its response to retries, which never reach the view. A duplicate that
+    arrives while the first is still running waits for it, up to
+    WAIT_SECONDS, rather than running alongside it. Only `stored_data` of
+    the response body is kept, and `replayed` turns the record back into
+    a response.
+    """
+    request_fingerprint = fingerprint(request)
+    deadline = time.monotonic() + WAIT_SECONDS
+    while True:
+        locked_until = claim(scope, key, request_fingerprint)
+        if locked_until is not None:
+            return execute(scope, key, locked_until, handler, stored_data)
+
+        record = IdempotencyKey.objects.filter(scope=scope, key=key).first()
+        if record is None:
+            # The first request failed and let go of the key; try again
+            continue
+        if record.fingerprint != request_fingerprint:
+            return Response(
+                {'error': f'{HEADER} was already used for a different request'},
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY
+            )
+        if record.status_code is not None:
+            return replayed(record)
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            response = Response(
+                {'error': f'A request with this {HEADER} is still in progress'},
+                status=status.HTTP_409_CONFLICT
+            )
+            response['Retry-After'] = '1'
+            return response
+        wait(scope, key, min(POLL_SECONDS, remaining))
+
+
+class IdempotentPostMixin:
+    """
+    Honour an Idempotency-Key header on POST: the first request with a key
+    runs, retries get its response back. Keys are scoped to the view's
+    `idempotency_scope` and the user, and expire after TTL_HOURS.
+    """
+    idempotency_scope = None
+
+    def post(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if key is None:
+            return super().post(request, *args, **kwargs)
+        if not key.strip() or len(key) > MAX_KEY_LENGTH:
+            return Response(
+                {'error': f'{HEADER} must be 1 to {MAX_KEY_LENGTH} characters'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        scope = f'{self.idempotency_scope}:{request.user.pk or "anonymous"}'
+        return run_once(request, scope, key,
+                        functools.partial(self.run_post, request, *args, **kwargs),
+                        self.get_stored_data, self.replay)
+
+    def get_stored_data(self, data):
+        """The part of a response body kept for replays, for TTL_HOURS."""
+        return data
+
+    def replay(self, record):
+        return replay(record)
+
+    def run_post(self, request, *args, **kwargs):
+        # Validation errors are raised rather than returned; turn them into
+        # their response here so they are kept and replayed like any other
+        # client error
+        try:
+            return super().post(request, *args, **kwargs)
+        except APIException as exc:
+            return self.handle_exception(exc)
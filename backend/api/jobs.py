@@ -0,0 +1,132 @@
+import datetime
+import logging
+import os
+import random
+import socket
+import traceback
+import uuid
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger('api.jobs')
+
+_options = getattr(settings, 'JOBS', {})
+LEASE_SECONDS = _options.get('LEASE_SECONDS', 60)
+MAX_ATTEMPTS = _options.get('MAX_ATTEMPTS', 5)
+BACKOFF_SECONDS = _options.get('BACKOFF_SECONDS', 30)
+MAX_BACKOFF_SECONDS = _options.get('MAX_BACKOFF_SECONDS', 3600)
+
+# kind -> callable taking the job's payload as keyword arguments
+handlers = {}
+
+
+def handler(kind):
+    """Register the decorated function to run jobs of `kind`."""
+    def register(fn):
+        handlers[kind] = fn
+        return fn
+    return register
+
+
+def enqueue(kind, run_at=None, max_attempts=None, **payload):
+    """
+    Queue a job. The row is written in the caller's transaction, so a job
+    for a change that rolls back is never run.
+    """
+    return enqueue_many(kind, [payload], run_at, max_attempts)[0]
+
+
+def enqueue_many(kind, payloads, run_at=None, max_attempts=None):
+    if kind not in handlers:
+        raise ValueError(f'No job handler registered for {kind!r}')
+    return Job.objects.bulk_create(
+        Job(kind=kind, payload=payload, run_at=run_at or timezone.now(),
+            max_attempts=max_attempts or MAX_ATTEMPTS)
+        for payload in payloads)
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+
+
+def claimable(now):
+    return Job.objects.filter(
+        Q(status='queued', run_at__lte=now) | Q(status='running', locked_until__lt=now))
+
+
+def claim(worker, limit, lease_seconds=LEASE_SECONDS):
+    """
+    Lease up to `limit` due jobs to `worker` and return them. Rows are
+    picked with FOR UPDATE SKIP LOCKED where the database has it; on SQLite
+    the IMMEDIATE transaction holds the write lock instead. Either way the
+    UPDATE only takes rows that are still claimable, so two workers never
+    hold the same job. Jobs whose lease lapsed (a crashed worker) count as
+    due again.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(claimable(now).select_for_update(skip_locked=True)
+                   .order_by('run_at', 'id').values_list('pk', flat=True)[:limit])
+        if not ids:
+            return []
+        claimable(now).filter(pk__in=ids).update(
+            status='running', locked_by=worker, attempts=F('attempts') + 1,
+            locked_until=now + datetime.timedelta(seconds=lease_seconds), updated_at=now)
+        return list(Job.objects.filter(pk__in=ids, status='running', locked_by=worker)
+                    .order_by('run_at', 'id'))
+
+
+def backoff(attempts):
+    """Seconds before retry number `attempts`: exponential, capped, jittered."""
+    delay = min(MAX_BACKOFF_SECONDS, BACKOFF_SECONDS * 2 ** (attempts - 1))
+    return delay * random.uniform(0.8, 1.2)
+
+
+def run(job):
+    """
+    Run one claimed job and record the outcome. Returns True on success.
+    Updates are conditional on the lease, so a worker that overran it
+    can't clobber the job after someone else has claimed it.
+    """
+    leased = Job.objects.filter(pk=job.pk, status='running', locked_by=job.locked_by)
+    # Restart the lease clock: jobs late in a batch may have waited a while
+    if not leased.update(locked_until=timezone.now() + datetime.timedelta(seconds=LEASE_SECONDS)):
+        return False
+    try:
+        fn = handlers[job.kind]
+    except KeyError:
+        leased.update(status='failed', last_error=f'No handler for {job.kind!r}',
+                      locked_until=None, updated_at=timezone.now())
+        return False
+
+    try:
+        fn(**job.payload)
+    except Exception:
+        error = traceback.format_exc()
+        now = timezone.now()
+        if job.attempts >= job.max_attempts:
+            logger.error('Job %s (%s) failed for good after %d attempts',
+                         job.pk, job.kind, job.attempts)
+            leased.update(status='failed', last_error=error, locked_until=None, updated_at=now)
+        else:
+            logger.warning('Job %s (%s) failed, attempt %d of %d',
+                           job.pk, job.kind, job.attempts, job.max_attempts)
+            leased.update(status='queued', last_error=error, locked_until=None, updated_at=now,
+                          run_at=now + datetime.timedelta(seconds=backoff(job.attempts)))
+        return False
+
+    leased.delete()
+    return True
+
+
+def run_due(worker, limit):
+    """Claim and run one batch. Returns how many jobs were claimed."""
+    jobs = claim(worker, limit)
+    for job in jobs:
+        run(job)
+    return len(jobs)
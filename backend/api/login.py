@@ -0,0 +1,109 @@
+import atexit
+import functools
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import close_old_connections, connections
+from django.utils import timezone
+
+from .models import User
+
+logger = logging.getLogger('api.login')
+
+_options = getattr(settings, 'LOGIN_THROTTLING', {})
+
+# Password hashing is CPU bound and releases the GIL, so a small pool sized
+# to the cores lets several logins hash in parallel while capping how much
+# CPU a burst of sign-ins can take from the rest of the site
+login_executor = ThreadPoolExecutor(
+    max_workers=_options.get('HASH_WORKERS', 4), thread_name_prefix='login')
+
+
+def run_in_pool(view, executor):
+    """
+    Wrap a sync view so that, under ASGI, it runs in `executor` instead of
+    the one thread Django shares between all sync views. WSGI requests keep
+    running on their own worker thread.
+    """
+    def call(request, *args, **kwargs):
+        close_old_connections()
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            close_old_connections()
+
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if isinstance(request, ASGIRequest):
+            run = sync_to_async(call, thread_sensitive=False, executor=executor)
+        else:
+            run = sync_to_async(view)
+        return await run(request, *args, **kwargs)
+    return wrapper
+
+
+class LastLoginRecorder:
+    """
+    Buffers last_login timestamps and writes them with one bulk UPDATE,
+    instead of one UPDATE per sign-in. A timer flushes the buffer `interval`
+    seconds after its first entry, so timestamps are never older than that
+    in the database even when nobody else signs in; a full buffer is
+    flushed at once. A killed process loses at most `interval` seconds.
+    """
+
+    def __init__(self, interval=5.0, max_pending=500):
+        self.interval = interval
+        self.max_pending = max_pending
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def record(self, user):
+        now = timezone.now()
+        user.last_login = now
+        with self._lock:
+            self._pending[user.pk] = now
+            full = len(self._pending) >= self.max_pending
+            if not full and self._timer is None:
+                self._timer = threading.Timer(self.interval, self._flush_on_timer)
+                self._timer.daemon = True
+                self._timer.start()
+        if full:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if pending:
+            User.objects.bulk_update(
+                [User(pk=pk, last_login=moment) for pk, moment in pending.items()],
+                ['last_login'], batch_size=500)
+
+    def _flush_on_timer(self):
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('Writing last_login timestamps failed')
+        finally:
+            connections.close_all()
+
+
+last_login_recorder = LastLoginRecorder(
+    interval=_options.get('LAST_LOGIN_FLUSH_SECONDS', 5.0),
+    max_pending=_options.get('LAST_LOGIN_MAX_PENDING', 500),
+)
+
+
+@atexit.register
+def _flush_last_login():
+    try:
+        last_login_recorder.flush()
+    except Exception:
+        pass
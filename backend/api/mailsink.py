@@ -0,0 +1,96 @@
+import email
+import email.policy
+import socketserver
+import threading
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(f'{line}\r\n'.encode())
+
+    def handle(self):
+        sink = self.server.sink
+        self.reply('220 mailsink ready')
+        sender, recipients = None, []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode('utf-8', 'replace').strip()
+            verb = command[:4].upper()
+            if verb in ('HELO', 'EHLO'):
+                self.reply('250 mailsink')
+            elif verb == 'MAIL':
+                sender, recipients = command.split(':', 1)[1].strip(), []
+                self.reply('250 OK')
+            elif verb == 'RCPT':
+                recipients.append(command.split(':', 1)[1].strip())
+                self.reply('250 OK')
+            elif verb == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                lines = []
+                for raw in iter(self.rfile.readline, b''):
+                    if raw in (b'.\r\n', b'.\n'):
+                        break
+                    # Undo dot-stuffing
+                    lines.append(raw[1:] if raw.startswith(b'..') else raw)
+                message = email.message_from_bytes(b''.join(lines), policy=email.policy.default)
+                sink.deliver(sender, recipients, message)
+                self.reply('250 OK: queued')
+            elif verb == 'RSET':
+                sender, recipients = None, []
+                self.reply('250 OK')
+            elif verb == 'NOOP':
+                self.reply('250 OK')
+            elif verb == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('502 Command not implemented')
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class MailSink:
+    """
+    A minimal SMTP server that accepts every message and keeps it in memory,
+    standing in for a mail server in tests and local development (see the
+    mailsink command). Run with `with MailSink() as sink:` and point
+    EMAIL_HOST/EMAIL_PORT at sink.host/sink.port; received messages collect
+    in `sink.messages`. Port 0 picks a free port.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, on_message=None):
+        self.messages = []
+        self.on_message = on_message
+        self.server = _Server((host, port), _SMTPHandler)
+        self.server.sink = self
+        self.host, self.port = self.server.server_address[:2]
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def deliver(self, sender, recipients, message):
+        with self._lock:
+            self.messages.append(message)
+        if self.on_message is not None:
+            self.on_message(sender, recipients, message)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.provisioning import IMPORT_COLUMNS, import_users, read_csv
+
+
+class Command(BaseCommand):
+    help = (f"Creates users from a CSV file with the columns {', '.join(IMPORT_COLUMNS)} "
+            "(phone is optional). Roles follow the UIU ID prefix, as for sign-ups.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_file')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Processes hashing passwords (default: one per CPU)')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Validate the file without creating anyone')
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['csv_file'], newline='', encoding='utf-8-sig') as file:
+                rows = read_csv(file)
+        except (OSError, UnicodeDecodeError, ValueError) as e:
+            raise CommandError(str(e))
+
+        result = import_users(rows, workers=options['workers'],
+                              batch_size=options['batch_size'], dry_run=options['dry_run'])
+        for error in result.errors:
+            self.stderr.write(str(error))
+
+        verb = 'Would create' if options['dry_run'] else 'Created'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {result.created} of {result.rows} users, {len(result.errors)} rows rejected'))
@@ -0,0 +1,28 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.mailsink import MailSink
+
+
+class Command(BaseCommand):
+    help = ("Runs a local SMTP stand-in on EMAIL_HOST:EMAIL_PORT that prints every "
+            "message it receives instead of delivering it.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default=settings.EMAIL_HOST)
+        parser.add_argument('--port', type=int, default=settings.EMAIL_PORT)
+
+    def handle(self, *args, **options):
+        def show(sender, recipients, message):
+            self.stdout.write(f'--- From {sender} to {", ".join(recipients)}')
+            self.stdout.write(message.as_string())
+
+        with MailSink(options['host'], options['port'], on_message=show) as sink:
+            self.stdout.write(self.style.SUCCESS(f'Listening on {sink.host}:{sink.port}'))
+            try:
+                while True:
+                    time.sleep(3600)
+            except KeyboardInterrupt:
+                pass
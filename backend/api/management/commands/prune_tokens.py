@@ -0,0 +1,54 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+
+
+class Command(BaseCommand):
+    help = ("Deletes expired outstanding and blacklisted refresh tokens in small "
+            "batches so the token tables stay bounded. Safe to run from cron.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--sleep', type=float, default=0.0,
+                            help='Seconds to pause between batches to yield to writers')
+
+    @property
+    def delete_sql(self):
+        table = connection.ops.quote_name(OutstandingToken._meta.db_table)
+        return f'DELETE FROM {table} WHERE id BETWEEN %s AND %s AND expires_at <= %s'
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        cutoff = timezone.now()
+        last_id = 0
+        outstanding = blacklisted = 0
+
+        # Walk the primary key so each batch is an index range, not a rescan
+        while True:
+            ids = list(
+                OutstandingToken.objects
+                .filter(id__gt=last_id, expires_at__lte=cutoff)
+                .order_by('id')
+                .values_list('id', flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            expired = OutstandingToken.objects.filter(
+                id__range=(ids[0], ids[-1]), expires_at__lte=cutoff)
+            with transaction.atomic():
+                blacklisted += BlacklistedToken.objects.filter(token__in=expired).delete()[0]
+                # The blacklist rows are gone, so skip the cascade collector
+                # and issue a single DELETE for the batch
+                with connection.cursor() as cursor:
+                    cursor.execute(self.delete_sql, [
+                        ids[0], ids[-1], connection.ops.adapt_datetimefield_value(cutoff)])
+                    outstanding += cursor.rowcount
+            last_id = ids[-1]
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Pruned {outstanding} outstanding and {blacklisted} blacklisted tokens'))
@@ -0,0 +1,17 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.models import AppointmentTombstone
+from api.sync import TOMBSTONE_RETENTION_DAYS
+
+
+class Command(BaseCommand):
+    help = ("Deletes appointment tombstones older than the delta-sync retention. "
+            "Clients holding older watermarks are told to resync.")
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - datetime.timedelta(days=TOMBSTONE_RETENTION_DAYS)
+        deleted, _ = AppointmentTombstone.objects.filter(deleted_at__lt=cutoff).delete()
+        self.stdout.write(self.style.SUCCESS(f'Pruned {deleted} tombstones'))
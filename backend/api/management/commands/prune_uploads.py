@@ -0,0 +1,20 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.models import RecordUpload
+from api.records import UPLOAD_EXPIRY_HOURS, discard_upload
+
+
+class Command(BaseCommand):
+    help = "Deletes medical record uploads that were abandoned before finishing, with their part files."
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - datetime.timedelta(hours=UPLOAD_EXPIRY_HOURS)
+        stale = RecordUpload.objects.filter(updated_at__lt=cutoff)
+        count = 0
+        for upload in stale.iterator():
+            discard_upload(upload)
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f'Pruned {count} abandoned uploads'))
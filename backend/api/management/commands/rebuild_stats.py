@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from api.stats import rebuild_stats
+
+
+class Command(BaseCommand):
+    help = "Recomputes the appointment statistics rollup from the appointments table."
+
+    def handle(self, *args, **options):
+        buckets = rebuild_stats()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {buckets} statistics buckets'))
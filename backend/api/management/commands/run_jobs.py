@@ -0,0 +1,45 @@
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from api.jobs import run_due, worker_name
+
+
+class Command(BaseCommand):
+    help = ("Runs queued background jobs (emails and notifications). Start as many "
+            "workers as needed; each claims its own batches.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=20)
+        parser.add_argument('--sleep', type=float, default=1.0,
+                            help='Seconds to wait before polling again when no job is due')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit once no job is due instead of polling')
+
+    def handle(self, *args, **options):
+        worker = worker_name()
+        stopping = False
+
+        def stop(signum, frame):
+            nonlocal stopping
+            stopping = True
+
+        # Finish the batch in hand on SIGTERM/SIGINT rather than abandoning
+        # it to lease expiry
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        self.stdout.write(f'Worker {worker} started')
+        processed = 0
+        while not stopping:
+            close_old_connections()
+            claimed = run_due(worker, options['batch_size'])
+            processed += claimed
+            if claimed:
+                continue
+            if options['once']:
+                break
+            time.sleep(options['sleep'])
+        self.stdout.write(self.style.SUCCESS(f'Worker {worker} stopped after {processed} jobs'))
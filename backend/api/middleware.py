@@ -0,0 +1,73 @@
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from .metrics import (QueryStats, current_queries, request_db_duration, request_duration,
+                      request_queries, response_size)
+
+logger = logging.getLogger('api.metrics')
+
+_options = getattr(settings, 'METRICS', {})
+
+
+class MetricsMiddleware:
+    """
+    Records latency, query count, query time and response size per URL name
+    into the histograms in api.metrics, and logs a warning when a view runs
+    more queries than its budget in settings.METRICS['QUERY_BUDGETS'].
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = _options.get('ENABLED', True)
+        self.query_budgets = _options.get('QUERY_BUDGETS', {})
+        self.default_budget = _options.get('DEFAULT_QUERY_BUDGET')
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.enabled:
+            return self.get_response(request)
+        stats = QueryStats()
+        token = current_queries.set(stats)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_queries.reset(token)
+        self.record(request, response, stats, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        if not self.enabled:
+            return await self.get_response(request)
+        stats = QueryStats()
+        token = current_queries.set(stats)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_queries.reset(token)
+        self.record(request, response, stats, time.perf_counter() - start)
+        return response
+
+    def record(self, request, response, stats, elapsed):
+        match = request.resolver_match
+        view = (match.view_name or match._func_path) if match else '<unmatched>'
+        labels = (view, request.method, str(response.status_code))
+        request_duration.observe(labels, elapsed)
+        request_queries.observe(labels, stats.count)
+        request_db_duration.observe(labels, stats.duration)
+        if not response.streaming:
+            response_size.observe(labels, len(response.content))
+
+        budget = self.query_budgets.get(view, self.default_budget)
+        if budget is not None and stats.count > budget:
+            logger.warning('%s %s (%s) ran %d queries, over its budget of %d',
+                           request.method, request.path, view, stats.count, budget)
@@ -0,0 +1,98 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:42
+
+import datetime
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_slot_start(apps, schema_editor):
+    Appointment = apps.get_model('api', 'Appointment')
+    taken = set()
+    # Oldest booking keeps the slot if legacy rows were double booked
+    for appointment in Appointment.objects.exclude(status='cancelled').order_by('created_at', 'id'):
+        slot_start = None
+        for fmt in ('%I:%M %p', '%H:%M', '%H:%M:%S'):
+            try:
+                slot_start = datetime.datetime.strptime(appointment.time.strip(), fmt).time()
+                break
+            except ValueError:
+                continue
+        key = (appointment.doctor_id, appointment.date, slot_start)
+        if slot_start is None or key in taken:
+            continue
+        taken.add(key)
+        Appointment.objects.filter(pk=appointment.pk).update(slot_start=slot_start)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_appointment_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DoctorSchedule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('weekday', models.PositiveSmallIntegerField(choices=[(0, 'Monday'), (1, 'Tuesday'), (2, 'Wednesday'), (3, 'Thursday'), (4, 'Friday'), (5, 'Saturday'), (6, 'Sunday')])),
+                ('start_time', models.TimeField()),
+                ('end_time', models.TimeField()),
+                ('slot_minutes', models.PositiveSmallIntegerField(default=30)),
+            ],
+            options={
+                'ordering': ['doctor', 'weekday', 'start_time'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ScheduleException',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('start_time', models.TimeField(blank=True, null=True)),
+                ('end_time', models.TimeField(blank=True, null=True)),
+                ('reason', models.CharField(blank=True, max_length=255)),
+            ],
+            options={
+                'ordering': ['date', 'start_time'],
+            },
+        ),
+        migrations.AddField(
+            model_name='appointment',
+            name='slot_start',
+            field=models.TimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_slot_start, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='appointment',
+            constraint=models.UniqueConstraint(condition=models.Q(('slot_start__isnull', False), models.Q(('status', 'cancelled'), _negated=True)), fields=('doctor', 'date', 'slot_start'), name='appt_unique_active_slot'),
+        ),
+        migrations.AddField(
+            model_name='doctorschedule',
+            name='doctor',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='schedules', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='scheduleexception',
+            name='doctor',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='schedule_exceptions', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddConstraint(
+            model_name='doctorschedule',
+            constraint=models.UniqueConstraint(fields=('doctor', 'weekday', 'start_time'), name='schedule_unique_block'),
+        ),
+        migrations.AddConstraint(
+            model_name='doctorschedule',
+            constraint=models.CheckConstraint(condition=models.Q(('end_time__gt', models.F('start_time'))), name='schedule_end_after_start'),
+        ),
+        migrations.AddConstraint(
+            model_name='doctorschedule',
+            constraint=models.CheckConstraint(condition=models.Q(('slot_minutes__gt', 0)), name='schedule_slot_minutes_positive'),
+        ),
+        migrations.AddIndex(
+            model_name='scheduleexception',
+            index=models.Index(fields=['doctor', 'date'], name='schedule_exc_doctor_date_idx'),
+        ),
+    ]
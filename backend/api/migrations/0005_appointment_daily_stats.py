@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:46
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def populate_stats(apps, schema_editor):
+    Appointment = apps.get_model('api', 'Appointment')
+    AppointmentDailyStat = apps.get_model('api', 'AppointmentDailyStat')
+    rows = (
+        Appointment.objects.order_by()
+        .values('date', 'doctor_id', 'status')
+        .annotate(total=Count('id'))
+    )
+    AppointmentDailyStat.objects.bulk_create(
+        [AppointmentDailyStat(date=row['date'], doctor_id=row['doctor_id'],
+                              status=row['status'], count=row['total'])
+         for row in rows],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_doctor_availability'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AppointmentDailyStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('confirmed', 'Confirmed'), ('completed', 'Completed'), ('cancelled', 'Cancelled')], max_length=20)),
+                ('count', models.IntegerField(default=0)),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='appointment_stats', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['date', 'doctor', 'status'],
+                'indexes': [models.Index(fields=['doctor', 'date'], name='stat_doctor_date_idx')],
+                'constraints': [models.UniqueConstraint(fields=('date', 'doctor', 'status'), name='stat_unique_bucket')],
+            },
+        ),
+        migrations.RunPython(populate_stats, migrations.RunPython.noop),
+    ]
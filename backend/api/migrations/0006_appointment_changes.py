@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_appointment_daily_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AppointmentTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('appointment_id', models.BigIntegerField()),
+                ('patient_id', models.BigIntegerField()),
+                ('doctor_id', models.BigIntegerField()),
+                ('deleted_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'ordering': ['deleted_at', 'id'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['updated_at'], name='appt_updated_at_idx'),
+        ),
+    ]
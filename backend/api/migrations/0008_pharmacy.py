@@ -0,0 +1,105 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:12
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_medical_records'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Medicine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200, unique=True)),
+                ('generic_name', models.CharField(blank=True, max_length=200)),
+                ('form', models.CharField(choices=[('tablet', 'Tablet'), ('capsule', 'Capsule'), ('syrup', 'Syrup'), ('injection', 'Injection'), ('ointment', 'Ointment'), ('other', 'Other')], default='tablet', max_length=20)),
+                ('strength', models.CharField(blank=True, max_length=50)),
+                ('unit_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Order',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('placed', 'Placed'), ('fulfilled', 'Fulfilled'), ('cancelled', 'Cancelled')], default='placed', max_length=20)),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pharmacy_orders', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at', 'id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='StockBatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('batch_number', models.CharField(max_length=50)),
+                ('quantity', models.PositiveIntegerField()),
+                ('expiry_date', models.DateField()),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('medicine', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='batches', to='api.medicine')),
+            ],
+            options={
+                'ordering': ['expiry_date', 'id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='OrderItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField()),
+                ('unit_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('medicine', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='order_items', to='api.medicine')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='api.order')),
+                ('batch', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='order_items', to='api.stockbatch')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='MedicineDailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('quantity', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('medicine', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='api.medicine')),
+            ],
+            options={
+                'ordering': ['date', 'medicine'],
+                'constraints': [models.UniqueConstraint(fields=('date', 'medicine'), name='sales_unique_bucket')],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['patient', '-created_at', 'id'], name='order_patient_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['-created_at', 'id'], name='order_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockbatch',
+            index=models.Index(fields=['medicine', 'expiry_date', 'id'], name='batch_medicine_expiry_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='stockbatch',
+            constraint=models.UniqueConstraint(fields=('medicine', 'batch_number'), name='batch_unique_number'),
+        ),
+        migrations.AddConstraint(
+            model_name='stockbatch',
+            constraint=models.CheckConstraint(condition=models.Q(('quantity__gte', 0)), name='batch_quantity_non_negative'),
+        ),
+    ]
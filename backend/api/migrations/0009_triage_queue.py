@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:15
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_pharmacy'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointment',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='appointment',
+            name='claimed_by',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='claimed_appointments', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='appointment',
+            name='triage_rank',
+            field=models.GeneratedField(db_persist=True, expression=models.Case(models.When(models.Q(('claimed_by__isnull', True), ('status__in', ('pending', 'confirmed'))), then=models.Case(models.When(emergency=True, then=models.Value(0)), default=models.Value(1))), default=None), output_field=models.PositiveSmallIntegerField(null=True)),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(condition=models.Q(('triage_rank__isnull', False)), fields=['date', 'triage_rank', 'created_at', 'slot_start'], name='appt_triage_queue_idx'),
+        ),
+    ]
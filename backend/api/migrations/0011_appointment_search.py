@@ -0,0 +1,68 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:33
+
+import api.models
+import django.db.models.deletion
+from django.db import migrations, models
+
+# External-content FTS5 table: it indexes reason and notes but reads the
+# text back from api_appointment. Porter stemming lets "headaches" match
+# "headache"; the prefix indexes serve search-as-you-type queries.
+CREATE_SEARCH = [
+    """
+    CREATE VIRTUAL TABLE api_appointment_search USING fts5(
+        reason, notes, content='api_appointment', content_rowid='id',
+        tokenize='porter unicode61 remove_diacritics 2', prefix='2 3')
+    """,
+    """
+    CREATE TRIGGER api_appointment_search_insert AFTER INSERT ON api_appointment BEGIN
+        INSERT INTO api_appointment_search(rowid, reason, notes)
+        VALUES (new.id, new.reason, new.notes);
+    END
+    """,
+    """
+    CREATE TRIGGER api_appointment_search_delete AFTER DELETE ON api_appointment BEGIN
+        INSERT INTO api_appointment_search(api_appointment_search, rowid, reason, notes)
+        VALUES ('delete', old.id, old.reason, old.notes);
+    END
+    """,
+    """
+    CREATE TRIGGER api_appointment_search_update AFTER UPDATE OF reason, notes ON api_appointment BEGIN
+        INSERT INTO api_appointment_search(api_appointment_search, rowid, reason, notes)
+        VALUES ('delete', old.id, old.reason, old.notes);
+        INSERT INTO api_appointment_search(rowid, reason, notes)
+        VALUES (new.id, new.reason, new.notes);
+    END
+    """,
+    # Index the appointments that already exist
+    "INSERT INTO api_appointment_search(api_appointment_search) VALUES ('rebuild')",
+]
+
+DROP_SEARCH = [
+    'DROP TRIGGER api_appointment_search_update',
+    'DROP TRIGGER api_appointment_search_delete',
+    'DROP TRIGGER api_appointment_search_insert',
+    'DROP TABLE api_appointment_search',
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_jobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AppointmentSearch',
+            fields=[
+                ('appointment', models.OneToOneField(db_column='rowid', on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_entry', serialize=False, to='api.appointment')),
+                ('document', api.models.FullTextField(db_column='api_appointment_search')),
+                ('rank', models.FloatField()),
+            ],
+            options={
+                'db_table': 'api_appointment_search',
+                'managed': False,
+            },
+        ),
+        migrations.RunSQL(CREATE_SEARCH, DROP_SEARCH),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_idempotency_keys'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recordupload',
+            name='sha256',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+    ]
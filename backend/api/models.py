@@ -1,4 +1,8 @@
+import uuid
+
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import AbstractUser
 
 # User model
@@ -23,6 +27,7 @@ class User(AbstractUser):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     avatar = models.URLField(blank=True, null=True)
+    email_verified = models.BooleanField(default=False)
 
     groups = models.ManyToManyField(
         'auth.Group',
@@ -44,13 +49,38 @@ class User(AbstractUser):
     def __str__(self):
         return f"{self.uiu_id} - {self.get_full_name()}"
 
+    @property
+    def name(self):
+        return self.get_full_name() or self.username
+
     class Meta:
         db_table = 'api_user'
         verbose_name = 'User'
         verbose_name_plural = 'Users'
+        indexes = [
+            # The admin changelist order, alone and under its role filter
+            models.Index(fields=['-created_at'], name='user_created_idx'),
+            models.Index(fields=['role', '-created_at'], name='user_role_created_idx'),
+        ]
 
 # Appointments model
 
+# Appointments in these states wait in the triage queue until claimed
+QUEUE_STATUSES = ('pending', 'confirmed')
+
+
+class AppointmentQuerySet(models.QuerySet):
+    def for_user(self, user):
+        # Students see their own bookings, staff see their patients, admins see all
+        if user.role == 'STUDENT':
+            return self.filter(patient=user)
+        elif user.role == 'STAFF':
+            return self.filter(doctor=user)
+        return self
+
+    def with_users(self):
+        return self.select_related('patient', 'doctor')
+
 
 class Appointment(models.Model):
     STATUS_CHOICES = (
@@ -71,11 +101,457 @@ class Appointment(models.Model):
     reason = models.TextField()
     emergency = models.BooleanField(default=False)
     notes = models.TextField(blank=True, null=True)
+    # Parsed start of the booked slot; `time` keeps the display string
+    slot_start = models.TimeField(blank=True, null=True)
+    # Set when a staff member takes the case from the triage queue
+    claimed_by = models.ForeignKey(
+        User, on_delete=models.SET_NULL, blank=True, null=True,
+        related_name='claimed_appointments')
+    claimed_at = models.DateTimeField(blank=True, null=True)
+    # Position class in the triage queue, kept by the database: 0 for
+    # emergencies, 1 for routine cases, NULL once the case leaves the queue
+    triage_rank = models.GeneratedField(
+        expression=models.Case(
+            models.When(models.Q(status__in=QUEUE_STATUSES, claimed_by__isnull=True),
+                        then=models.Case(
+                            models.When(emergency=True, then=models.Value(0)),
+                            default=models.Value(1))),
+            default=None),
+        output_field=models.PositiveSmallIntegerField(null=True),
+        db_persist=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = AppointmentQuerySet.as_manager()
+
     class Meta:
         ordering = ['-date', '-time']
+        indexes = [
+            models.Index(fields=['patient', '-date', '-time'],
+                         name='appt_patient_date_idx'),
+            models.Index(fields=['doctor', '-date', '-time'],
+                         name='appt_doctor_date_idx'),
+            models.Index(fields=['status', 'date'], name='appt_status_date_idx'),
+            models.Index(fields=['-date', '-time'], name='appt_date_time_idx'),
+            models.Index(fields=['-date', '-time'], name='appt_emergency_idx',
+                         condition=models.Q(emergency=True)),
+            models.Index(fields=['updated_at'], name='appt_updated_at_idx'),
+            # The triage queue: emergencies first, then the longest waiting
+            models.Index(fields=['date', 'triage_rank', 'created_at', 'slot_start'],
+                         name='appt_triage_queue_idx',
+                         condition=models.Q(triage_rank__isnull=False)),
+        ]
+        constraints = [
+            # A doctor's slot can only be held by one live appointment
+            models.UniqueConstraint(
+                fields=['doctor', 'date', 'slot_start'],
+                condition=models.Q(slot_start__isnull=False) & ~models.Q(status='cancelled'),
+                name='appt_unique_active_slot'),
+        ]
 
     def __str__(self):
         return f"{self.patient.name} - {self.doctor.name} - {self.date}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the rollup bucket the row was loaded in (see api.stats)
+        if {'date', 'doctor_id', 'status'}.issubset(field_names):
+            instance._loaded_stat_key = instance.stat_key
+        return instance
+
+    @property
+    def stat_key(self):
+        return (self.date, self.doctor_id, self.status)
+
+
+class AppointmentTombstone(models.Model):
+    # Left behind by deleted appointments so delta-sync clients can drop
+    # them. Plain ids rather than foreign keys: the users may be gone too.
+    appointment_id = models.BigIntegerField()
+    patient_id = models.BigIntegerField()
+    doctor_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        ordering = ['deleted_at', 'id']
+
+    def __str__(self):
+        return f"Appointment {self.appointment_id} deleted at {self.deleted_at}"
+
+
+class FullTextField(models.TextField):
+    # The hidden column of an FTS5 table, named after the table itself
+    pass
+
+
+@FullTextField.register_lookup
+class Match(models.Lookup):
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} MATCH {rhs}', [*lhs_params, *rhs_params]
+
+
+class AppointmentSearch(models.Model):
+    # SQLite FTS5 index over appointment reasons and notes. The table and
+    # the triggers that keep it in step with api_appointment come from
+    # migration 0011; query it through api.search.
+    appointment = models.OneToOneField(
+        Appointment, on_delete=models.DO_NOTHING, primary_key=True,
+        db_column='rowid', related_name='search_entry')
+    document = FullTextField(db_column='api_appointment_search')
+    # bm25 score of the current MATCH, lower is better
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = 'api_appointment_search'
+
+
+class AppointmentDailyStat(models.Model):
+    # Incremental rollup of appointment counts, maintained by api.signals
+    date = models.DateField()
+    doctor = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='appointment_stats')
+    status = models.CharField(max_length=20, choices=Appointment.STATUS_CHOICES)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        ordering = ['date', 'doctor', 'status']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['date', 'doctor', 'status'], name='stat_unique_bucket'),
+        ]
+        indexes = [
+            models.Index(fields=['doctor', 'date'], name='stat_doctor_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.date} - {self.doctor_id} - {self.status}: {self.count}"
+
+
+# Doctor availability
+
+
+class DoctorSchedule(models.Model):
+    WEEKDAY_CHOICES = (
+        (0, 'Monday'),
+        (1, 'Tuesday'),
+        (2, 'Wednesday'),
+        (3, 'Thursday'),
+        (4, 'Friday'),
+        (5, 'Saturday'),
+        (6, 'Sunday'),
+    )
+
+    doctor = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='schedules')
+    weekday = models.PositiveSmallIntegerField(choices=WEEKDAY_CHOICES)
+    start_time = models.TimeField()
+    end_time = models.TimeField()
+    slot_minutes = models.PositiveSmallIntegerField(default=30)
+
+    class Meta:
+        ordering = ['doctor', 'weekday', 'start_time']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['doctor', 'weekday', 'start_time'],
+                name='schedule_unique_block'),
+            models.CheckConstraint(
+                condition=models.Q(end_time__gt=models.F('start_time')),
+                name='schedule_end_after_start'),
+            models.CheckConstraint(
+                condition=models.Q(slot_minutes__gt=0),
+                name='schedule_slot_minutes_positive'),
+        ]
+
+    def __str__(self):
+        return f"{self.doctor.uiu_id} - {self.get_weekday_display()} {self.start_time}-{self.end_time}"
+
+
+class ScheduleException(models.Model):
+    doctor = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='schedule_exceptions')
+    date = models.DateField()
+    # Leave both times empty to block the whole day
+    start_time = models.TimeField(blank=True, null=True)
+    end_time = models.TimeField(blank=True, null=True)
+    reason = models.CharField(max_length=255, blank=True)
+
+    class Meta:
+        ordering = ['date', 'start_time']
+        indexes = [
+            models.Index(fields=['doctor', 'date'], name='schedule_exc_doctor_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.doctor.uiu_id} - {self.date}"
+
+
+# Medical records
+
+
+class RecordBlob(models.Model):
+    """One stored file, shared by every record whose content hashes the same."""
+    sha256 = models.CharField(max_length=64, unique=True)
+    size = models.BigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.sha256
+
+
+class MedicalRecordQuerySet(models.QuerySet):
+    def for_user(self, user):
+        # Students see their own records, staff see records of patients they
+        # have appointments with (or uploaded themselves), admins see all
+        if user.role == 'STUDENT':
+            return self.filter(patient=user)
+        elif user.role == 'STAFF':
+            patients = Appointment.objects.filter(doctor=user).values('patient_id')
+            return self.filter(models.Q(patient__in=patients) | models.Q(uploaded_by=user))
+        return self
+
+
+class MedicalRecord(models.Model):
+    TYPE_CHOICES = (
+        ('lab_report', 'Lab Report'),
+        ('prescription', 'Prescription'),
+        ('scan', 'Scan'),
+        ('other', 'Other'),
+    )
+
+    patient = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='medical_records')
+    uploaded_by = models.ForeignKey(
+        User, on_delete=models.SET_NULL, null=True, related_name='uploaded_records')
+    blob = models.ForeignKey(RecordBlob, on_delete=models.PROTECT, related_name='records')
+    title = models.CharField(max_length=200)
+    record_type = models.CharField(max_length=20, choices=TYPE_CHOICES, default='other')
+    description = models.TextField(blank=True)
+    record_date = models.DateField(blank=True, null=True)
+    file_name = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = MedicalRecordQuerySet.as_manager()
+
+    class Meta:
+        ordering = ['-created_at', 'id']
+        indexes = [
+            models.Index(fields=['patient', '-created_at', 'id'], name='record_patient_created_idx'),
+            models.Index(fields=['-created_at', 'id'], name='record_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.patient.uiu_id} - {self.title}"
+
+
+class RecordUpload(models.Model):
+    """
+    An upload in progress. Chunks are appended to a part file on disk and
+    `received` tracks how many bytes have landed, so an interrupted upload
+    resumes from there. Finished uploads become a MedicalRecord.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    patient = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='record_uploads')
+    uploaded_by = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='started_uploads')
+    title = models.CharField(max_length=200)
+    record_type = models.CharField(max_length=20, choices=MedicalRecord.TYPE_CHOICES, default='other')
+    description = models.TextField(blank=True)
+    record_date = models.DateField(blank=True, null=True)
+    file_name = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100)
+    size = models.BigIntegerField()
+    received = models.BigIntegerField(default=0)
+    # Set while one request is writing a chunk, so two can't interleave
+    locked_until = models.DateTimeField(blank=True, null=True)
+    # Hash of the completed file, noted before it moves to blob storage so
+    # a finish interrupted after the move can still find it
+    sha256 = models.CharField(max_length=64, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.file_name} ({self.received}/{self.size})"
+
+
+# Pharmacy
+
+
+class Medicine(models.Model):
+    FORM_CHOICES = (
+        ('tablet', 'Tablet'),
+        ('capsule', 'Capsule'),
+        ('syrup', 'Syrup'),
+        ('injection', 'Injection'),
+        ('ointment', 'Ointment'),
+        ('other', 'Other'),
+    )
+
+    name = models.CharField(max_length=200, unique=True)
+    generic_name = models.CharField(max_length=200, blank=True)
+    form = models.CharField(max_length=20, choices=FORM_CHOICES, default='tablet')
+    strength = models.CharField(max_length=50, blank=True)
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2)
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['name']
+
+    def __str__(self):
+        return f"{self.name} {self.strength}".strip()
+
+
+class StockBatch(models.Model):
+    medicine = models.ForeignKey(
+        Medicine, on_delete=models.CASCADE, related_name='batches')
+    batch_number = models.CharField(max_length=50)
+    quantity = models.PositiveIntegerField()
+    expiry_date = models.DateField()
+    received_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['expiry_date', 'id']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['medicine', 'batch_number'], name='batch_unique_number'),
+            # Backstop for the conditional decrement in api.pharmacy
+            models.CheckConstraint(
+                condition=models.Q(quantity__gte=0), name='batch_quantity_non_negative'),
+        ]
+        indexes = [
+            models.Index(fields=['medicine', 'expiry_date', 'id'], name='batch_medicine_expiry_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.medicine.name} #{self.batch_number}"
+
+
+class Order(models.Model):
+    STATUS_CHOICES = (
+        ('placed', 'Placed'),
+        ('fulfilled', 'Fulfilled'),
+        ('cancelled', 'Cancelled'),
+    )
+
+    patient = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='pharmacy_orders')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='placed')
+    total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at', 'id']
+        indexes = [
+            models.Index(fields=['patient', '-created_at', 'id'], name='order_patient_created_idx'),
+            models.Index(fields=['-created_at', 'id'], name='order_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"Order {self.pk} - {self.patient.uiu_id}"
+
+
+class OrderItem(models.Model):
+    """The units one order took from one stock batch."""
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
+    medicine = models.ForeignKey(Medicine, on_delete=models.PROTECT, related_name='order_items')
+    batch = models.ForeignKey(StockBatch, on_delete=models.PROTECT, related_name='order_items')
+    quantity = models.PositiveIntegerField()
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2)
+
+    def __str__(self):
+        return f"{self.quantity} x {self.medicine.name}"
+
+
+class MedicineDailySales(models.Model):
+    """Units sold and revenue per medicine per day, kept up to date by api.pharmacy."""
+    date = models.DateField()
+    medicine = models.ForeignKey(
+        Medicine, on_delete=models.CASCADE, related_name='daily_sales')
+    quantity = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        ordering = ['date', 'medicine']
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'medicine'], name='sales_unique_bucket'),
+        ]
+
+    def __str__(self):
+        return f"{self.date} - {self.medicine.name}: {self.quantity}"
+
+
+# Background jobs
+
+
+class Job(models.Model):
+    """
+    A unit of background work, run by the run_jobs worker (see api.jobs).
+    Successful jobs are deleted; failed ones stay for inspection.
+    """
+    STATUS_CHOICES = (
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('failed', 'Failed'),
+    )
+
+    kind = models.CharField(max_length=50)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    # Held by a worker until this time; a lapsed lease is claimed again
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_until = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['run_at', 'id']
+        indexes = [
+            models.Index(fields=['run_at', 'id'], name='job_ready_idx',
+                         condition=models.Q(status='queued')),
+            models.Index(fields=['locked_until'], name='job_lease_idx',
+                         condition=models.Q(status='running')),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.pk} ({self.status})"
+
+
+class IdempotencyKey(models.Model):
+    """
+    A client's Idempotency-Key for one POST endpoint and the response to
+    replay when the request is retried (see api.idempotency).
+    """
+    scope = models.CharField(max_length=100)
+    key = models.CharField(max_length=255)
+    # HMAC of the request, so a key reused for a different request is refused
+    fingerprint = models.CharField(max_length=64)
+    # NULL while the first request is still running
+    status_code = models.PositiveSmallIntegerField(blank=True, null=True)
+    response = models.JSONField(blank=True, null=True, encoder=DjangoJSONEncoder)
+    # Held by the running request; a lapsed lock lets a retry take over
+    locked_until = models.DateTimeField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['scope', 'key'], name='idempotency_unique_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.scope} {self.key} ({self.status_code or 'running'})"
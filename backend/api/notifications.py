@@ -0,0 +1,71 @@
+import datetime
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.contrib.auth.tokens import default_token_generator
+from django.core import signing
+from django.core.mail import send_mail
+from django.template.loader import render_to_string
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+
+from .jobs import handler
+from .models import Appointment, User
+
+_options = getattr(settings, 'ACCOUNT_EMAILS', {})
+FRONTEND_URL = _options.get('FRONTEND_URL', 'http://localhost:5173')
+VERIFICATION_MAX_AGE = datetime.timedelta(days=_options.get('VERIFICATION_MAX_AGE_DAYS', 3))
+
+_verification_salt = 'api.notifications.verify-email'
+
+
+def frontend_link(path, **params):
+    return f'{FRONTEND_URL.rstrip("/")}{path}?{urlencode(params)}'
+
+
+def verification_token(user):
+    # Tied to the address, so changing it invalidates links sent earlier
+    return signing.dumps({'id': user.pk, 'email': user.email}, salt=_verification_salt)
+
+
+def check_verification_token(token):
+    """The user a verification token was issued to, or None."""
+    try:
+        data = signing.loads(token, salt=_verification_salt, max_age=VERIFICATION_MAX_AGE)
+    except signing.BadSignature:
+        return None
+    return User.objects.filter(pk=data['id'], email=data['email']).first()
+
+
+def send(template, subject, user, **context):
+    body = render_to_string(f'emails/{template}.txt', {'user': user, **context})
+    send_mail(subject, body, None, [user.email])
+
+
+@handler('email.verify')
+def send_verification_email(user_id):
+    user = User.objects.filter(pk=user_id, email_verified=False).exclude(email='').first()
+    if user is None:
+        return
+    link = frontend_link('/verify-email', token=verification_token(user), email=user.email)
+    send('verify_email', 'Verify your UIU Healthcare email', user, link=link)
+
+
+@handler('email.password_reset')
+def send_password_reset_email(user_id):
+    user = User.objects.filter(pk=user_id, is_active=True).exclude(email='').first()
+    if user is None:
+        return
+    link = frontend_link('/reset-password', uid=urlsafe_base64_encode(force_bytes(user.pk)),
+                         token=default_token_generator.make_token(user))
+    send('password_reset', 'Reset your UIU Healthcare password', user, link=link)
+
+
+@handler('email.appointment_status')
+def send_appointment_status_email(appointment_id, status, previous_status):
+    appointment = Appointment.objects.with_users().filter(pk=appointment_id).first()
+    # Skip changes superseded before the job ran; the later one has its own job
+    if appointment is None or appointment.status != status or not appointment.patient.email:
+        return
+    send('appointment_status', f'Your appointment is {appointment.get_status_display().lower()}',
+         appointment.patient, appointment=appointment, previous_status=previous_status)
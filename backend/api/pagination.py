@@ -0,0 +1,154 @@
+import json
+from base64 import b64decode, b64encode
+from functools import reduce
+from operator import or_
+
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetCursorPagination(BasePagination):
+    """
+    Cursor pagination over a composite ordering.
+
+    The cursor holds the ordering values of the row at the page edge, so each
+    page is a single indexed range query no matter how deep the client pages,
+    and rows sharing a date or time can never be skipped or repeated.
+    """
+    ordering = ('-id',)
+    page_size = 50
+    max_page_size = 500
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.fields = [queryset.model._meta.get_field(name.lstrip('-'))
+                       for name in self.ordering]
+        # Views paging through values_list() tuples name the columns they
+        # fetched, in order, as `pagination_columns`
+        columns = getattr(view, 'pagination_columns', None)
+        self.columns = [columns.index(field.name) for field in self.fields] if columns else None
+
+        position, reverse = self.decode_cursor(request)
+        ordering = self.get_ordering(reverse)
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(self.get_position_filter(ordering, position))
+
+        # Fetch one extra row to find out whether there is another page
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if reverse:
+            self.page.reverse()
+            self.has_next = position is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = position is not None
+        return self.page
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if size <= 0:
+            return self.page_size
+        return min(size, self.max_page_size)
+
+    def get_ordering(self, reverse):
+        if not reverse:
+            return list(self.ordering)
+        return [name[1:] if name.startswith('-') else f'-{name}'
+                for name in self.ordering]
+
+    def get_position_filter(self, ordering, position):
+        # (a, b, c) after (x, y, z) => a > x OR (a = x AND b > y) OR ...
+        clauses = []
+        for index, name in enumerate(ordering):
+            field = name.lstrip('-')
+            lookup = 'lt' if name.startswith('-') else 'gt'
+            equal = {f.name: value for f, value in zip(self.fields[:index], position)}
+            clauses.append(Q(**equal, **{f'{field}__{lookup}': position[index]}))
+        return reduce(or_, clauses)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None, False
+        try:
+            data = json.loads(b64decode(encoded.encode('ascii')).decode('utf-8'))
+            position = [field.to_python(value)
+                        for field, value in zip(self.fields, data['p'], strict=True)]
+            return position, bool(data.get('r'))
+        except Exception:
+            raise ValidationError({self.cursor_query_param: self.invalid_cursor_message})
+
+    def get_position(self, row):
+        """The ordering values of `row`: a model, a values() dict or a tuple."""
+        if self.columns is not None:
+            values = [row[index] for index in self.columns]
+        elif isinstance(row, dict):
+            values = [row[field.name] for field in self.fields]
+        else:
+            values = [getattr(row, field.attname) for field in self.fields]
+        # Dates and times in full, microseconds included, for to_python()
+        return [value.isoformat() if hasattr(value, 'isoformat') else value
+                for value in values]
+
+    def encode_cursor(self, row, reverse):
+        position = self.get_position(row)
+        data = {'p': position, 'r': 1} if reverse else {'p': position}
+        encoded = b64encode(json.dumps(data, separators=(',', ':')).encode('utf-8'))
+        return replace_query_param(self.base_url, self.cursor_query_param,
+                                   encoded.decode('ascii'))
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class AppointmentCursorPagination(KeysetCursorPagination):
+    ordering = ('-date', '-time', 'id')
+
+
+class MedicalRecordCursorPagination(KeysetCursorPagination):
+    ordering = ('-created_at', 'id')
+
+
+class OrderCursorPagination(KeysetCursorPagination):
+    ordering = ('-created_at', 'id')
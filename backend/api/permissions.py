@@ -0,0 +1,48 @@
+from django.conf import settings
+from rest_framework.permissions import BasePermission
+
+from .authentication import METRICS_SCRAPER
+
+
+def can_update_appointment(user, patient_id, doctor_id, claimed_by_id):
+    """
+    Whether `user` may change an appointment's status: students their own
+    bookings, staff those they are the doctor for or have claimed from the
+    triage queue, admins any.
+    """
+    if user.role == 'STUDENT':
+        return patient_id == user.id
+    if user.role == 'STAFF':
+        return user.id in (doctor_id, claimed_by_id)
+    return True
+
+
+class IsAdminRole(BasePermission):
+    message = 'Only administrators can perform this action.'
+
+    def has_permission(self, request, view):
+        user = request.user
+        return bool(user and user.is_authenticated and user.role == 'ADMIN')
+
+
+class IsStaffRole(BasePermission):
+    message = 'Only clinic staff can perform this action.'
+
+    def has_permission(self, request, view):
+        user = request.user
+        return bool(user and user.is_authenticated and user.role in ('STAFF', 'ADMIN'))
+
+
+class CanViewMetrics(BasePermission):
+    """
+    Admins, scrapers holding settings.METRICS['TOKEN'], and, only if it is
+    set, anything connecting from settings.METRICS['ALLOWED_IPS']. Behind a
+    local reverse proxy every request comes from the proxy's address, so
+    the allow-list is empty unless configured.
+    """
+
+    def has_permission(self, request, view):
+        allowed_ips = getattr(settings, 'METRICS', {}).get('ALLOWED_IPS', ())
+        return (request.auth == METRICS_SCRAPER or
+                request.META.get('REMOTE_ADDR') in allowed_ips or
+                IsAdminRole().has_permission(request, view))
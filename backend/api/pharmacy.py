@@ -0,0 +1,149 @@
+import datetime
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q, Sum
+from django.utils import timezone
+
+from .models import Medicine, MedicineDailySales, Order, OrderItem, StockBatch
+
+
+class OrderError(ValueError):
+    pass
+
+
+class InsufficientStock(OrderError):
+    def __init__(self, medicine, requested, available):
+        super().__init__(f'Only {available} of {medicine.name} in stock, {requested} requested')
+        self.medicine = medicine
+        self.requested = requested
+        self.available = available
+
+
+def sellable_batches(medicine_ids, today=None):
+    today = today or timezone.localdate()
+    return StockBatch.objects.filter(
+        medicine_id__in=medicine_ids, expiry_date__gt=today, quantity__gt=0)
+
+
+def with_stock(queryset, today=None):
+    """Annotate medicines with the units in unexpired batches."""
+    today = today or timezone.localdate()
+    return queryset.annotate(stock=Sum(
+        'batches__quantity', filter=Q(batches__expiry_date__gt=today), default=0))
+
+
+def take_stock(batch_id, wanted):
+    """
+    Take up to `wanted` units from one batch and return how many were taken.
+    The decrement is a single conditional UPDATE, so two orders can never
+    both take the same units; a lost race just re-reads what is left.
+    """
+    batches = StockBatch.objects.filter(pk=batch_id)
+    while True:
+        available = batches.values_list('quantity', flat=True).first() or 0
+        take = min(available, wanted)
+        if take == 0:
+            return 0
+        if batches.filter(quantity__gte=take).update(quantity=F('quantity') - take):
+            return take
+
+
+def apply_sales_delta(date, medicine_id, quantity, revenue):
+    buckets = MedicineDailySales.objects.filter(date=date, medicine_id=medicine_id)
+    if buckets.update(quantity=F('quantity') + quantity, revenue=F('revenue') + revenue):
+        return
+    try:
+        with transaction.atomic():
+            MedicineDailySales.objects.create(
+                date=date, medicine_id=medicine_id, quantity=quantity, revenue=revenue)
+    except IntegrityError:
+        # Another order created the bucket first
+        buckets.update(quantity=F('quantity') + quantity, revenue=F('revenue') + revenue)
+
+
+def place_order(patient, lines):
+    """
+    Create an order for `lines`, a {medicine_id: quantity} mapping, taking
+    stock from the batches that expire first. Raises InsufficientStock (and
+    rolls everything back) if any line can't be filled in full.
+    """
+    medicines = Medicine.objects.in_bulk(lines.keys())
+    missing = [pk for pk in lines if pk not in medicines or not medicines[pk].is_active]
+    if missing:
+        raise OrderError(f'Unknown or discontinued medicine: {missing[0]}')
+
+    batch_ids = defaultdict(list)
+    for batch_id, medicine_id in (sellable_batches(lines.keys())
+                                  .order_by('expiry_date', 'id').values_list('id', 'medicine_id')):
+        batch_ids[medicine_id].append(batch_id)
+
+    with transaction.atomic():
+        order = Order.objects.create(patient=patient)
+        items = []
+        for medicine_id, quantity in lines.items():
+            medicine = medicines[medicine_id]
+            remaining = quantity
+            for batch_id in batch_ids[medicine_id]:
+                taken = take_stock(batch_id, remaining)
+                if taken:
+                    items.append(OrderItem(order=order, medicine=medicine, batch_id=batch_id,
+                                           quantity=taken, unit_price=medicine.unit_price))
+                    remaining -= taken
+                if not remaining:
+                    break
+            if remaining:
+                raise InsufficientStock(medicine, quantity, quantity - remaining)
+
+        OrderItem.objects.bulk_create(items)
+        order.total = sum((item.unit_price * item.quantity for item in items), Decimal('0'))
+        order.save(update_fields=['total'])
+        today = timezone.localdate()
+        for medicine_id, quantity in lines.items():
+            apply_sales_delta(today, medicine_id, quantity, medicines[medicine_id].unit_price * quantity)
+    return order
+
+
+def cancel_order(order):
+    """Put the order's units back into their batches and reverse its sales."""
+    with transaction.atomic():
+        if not Order.objects.filter(pk=order.pk, status='placed').update(
+                status='cancelled', updated_at=timezone.now()):
+            raise OrderError('Only placed orders can be cancelled')
+        sold_on = timezone.localdate(order.created_at)
+        for item in order.items.all():
+            StockBatch.objects.filter(pk=item.batch_id).update(quantity=F('quantity') + item.quantity)
+            apply_sales_delta(sold_on, item.medicine_id, -item.quantity, -item.unit_price * item.quantity)
+    order.status = 'cancelled'
+    return order
+
+
+def _money(value):
+    return str(Decimal(value or 0).quantize(Decimal('0.01')))
+
+
+def get_sales(date_from, date_to):
+    """Daily totals and per-medicine totals from the sales rollup."""
+    buckets = MedicineDailySales.objects.filter(date__range=(date_from, date_to))
+    days = {row['date']: row for row in buckets.values('date').annotate(
+        quantity=Sum('quantity'), revenue=Sum('revenue')).order_by()}
+    medicines = (buckets.values('medicine_id', 'medicine__name')
+                 .annotate(quantity=Sum('quantity'), revenue=Sum('revenue'))
+                 .order_by('-quantity', 'medicine__name'))
+    series = []
+    day = date_from
+    while day <= date_to:
+        row = days.get(day)
+        series.append({'date': day.isoformat(),
+                       'quantity': row['quantity'] if row else 0,
+                       'revenue': _money(row['revenue'] if row else 0)})
+        day += datetime.timedelta(days=1)
+    return {
+        'from': date_from.isoformat(),
+        'to': date_to.isoformat(),
+        'days': series,
+        'medicines': [{'medicine_id': row['medicine_id'], 'name': row['medicine__name'],
+                       'quantity': row['quantity'], 'revenue': _money(row['revenue'])}
+                      for row in medicines if row['quantity']],
+    }
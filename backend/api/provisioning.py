@@ -0,0 +1,202 @@
+import csv
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.password_validation import validate_password
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+
+from .conditional import doctor_list
+from .models import User
+
+IMPORT_COLUMNS = ('uiu_id', 'name', 'email', 'password', 'phone')
+REQUIRED_COLUMNS = ('uiu_id', 'name', 'email', 'password')
+
+
+def role_for_uiu_id(uiu_id):
+    """The role a UIU ID signs up with, from its prefix."""
+    if uiu_id.startswith('011'):
+        return 'STUDENT'
+    elif uiu_id.startswith('STAFF') or uiu_id.startswith('DOC'):
+        return 'STAFF'
+    elif uiu_id.startswith('ADMIN') or uiu_id == 'admin':
+        return 'ADMIN'
+    return 'STUDENT'
+
+
+def split_name(full_name):
+    name_parts = full_name.strip().split(' ', 1)
+    return name_parts[0], name_parts[1] if len(name_parts) > 1 else ''
+
+
+@dataclass
+class RowError:
+    line: int
+    uiu_id: str
+    message: str
+
+    def __str__(self):
+        return f'line {self.line} ({self.uiu_id or "no UIU ID"}): {self.message}'
+
+
+@dataclass
+class ImportResult:
+    rows: int = 0
+    created: int = 0
+    errors: list = field(default_factory=list)
+
+
+def read_csv(file):
+    """
+    Parse an upload or open file of users. Returns (line, row) pairs, with
+    `line` the CSV line number for error reports.
+    """
+    if isinstance(file, bytes):
+        file = io.StringIO(file.decode('utf-8-sig'))
+    reader = csv.DictReader(file)
+    missing = [column for column in REQUIRED_COLUMNS if column not in (reader.fieldnames or ())]
+    if missing:
+        raise ValueError(f'CSV is missing columns: {", ".join(missing)}')
+    return [(reader.line_num, {key: (value or '').strip() for key, value in row.items() if key})
+            for row in reader]
+
+
+def build_user(row):
+    """
+    Validate one row apart from its password and return an unsaved User.
+    The password is checked by check_and_hash(), in the process pool.
+    """
+    first_name, last_name = split_name(row['name'])
+    user = User(
+        username=row['uiu_id'],
+        uiu_id=row['uiu_id'],
+        email=row['email'],
+        first_name=first_name,
+        last_name=last_name,
+        phone=row.get('phone', ''),
+        role=role_for_uiu_id(row['uiu_id']),
+    )
+    messages = [f'{column} is required' for column in REQUIRED_COLUMNS if not row.get(column)]
+    if messages:
+        raise ValidationError(messages)
+    try:
+        # Uniqueness is checked by the caller against all rows at once
+        user.full_clean(exclude=('password',), validate_unique=False, validate_constraints=False)
+    except ValidationError as e:
+        messages.extend(f'{name}: {message}' for name, errors in e.message_dict.items()
+                        for message in errors)
+    if messages:
+        raise ValidationError(messages)
+    return user
+
+
+def _setup_worker():
+    # Spawned (rather than forked) workers start without Django configured
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+    django.setup()
+
+
+def check_and_hash(item):
+    """
+    Run the password validators for a (password, user) pair and hash the
+    password. Returns (hash, None), or (None, messages) if it was rejected.
+    """
+    password, user = item
+    try:
+        validate_password(password, user)
+    except ValidationError as e:
+        return None, e.messages
+    return make_password(password), None
+
+
+def hash_passwords(items, workers=None):
+    """
+    check_and_hash() every (password, user) pair, spread across `workers`
+    processes; both steps are CPU-bound, so threads wouldn't help.
+    """
+    if workers == 1 or len(items) < 2:
+        return [check_and_hash(item) for item in items]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_setup_worker) as pool:
+        chunksize = max(1, len(items) // ((workers or os.cpu_count() or 1) * 4))
+        return list(pool.map(check_and_hash, items, chunksize=chunksize))
+
+
+def insert_users(users, batch_size):
+    """
+    Insert `users` (a list of (line, User) pairs) in batches and return the
+    errors. A batch that hits a UIU ID registered since validation is
+    retried row by row so only the clashing users are left out.
+    """
+    errors = []
+    for start in range(0, len(users), batch_size):
+        batch = users[start:start + batch_size]
+        try:
+            with transaction.atomic():
+                User.objects.bulk_create([user for _, user in batch])
+            continue
+        except IntegrityError:
+            pass
+        for line, user in batch:
+            try:
+                with transaction.atomic():
+                    user.save(force_insert=True)
+            except IntegrityError:
+                user.pk = None
+                errors.append(RowError(line, user.uiu_id, 'This UIU ID is already registered.'))
+    return errors
+
+
+def import_users(rows, workers=None, batch_size=1000, dry_run=False):
+    """
+    Create users from (line, row) pairs as read by read_csv(). Rows that
+    fail validation are reported in the result and skipped; the rest are
+    created. Passwords are validated and hashed in a process pool, so a
+    dry run doesn't check them.
+    """
+    result = ImportResult(rows=len(rows))
+    # Usernames are UIU IDs for registered users, so both must be free
+    taken = set()
+    for uiu_id, username in User.objects.values_list('uiu_id', 'username'):
+        taken.add(uiu_id)
+        taken.add(username)
+
+    valid = []
+    for line, row in rows:
+        uiu_id = row.get('uiu_id', '')
+        if uiu_id in taken:
+            result.errors.append(RowError(line, uiu_id, 'This UIU ID is already registered.'))
+            continue
+        try:
+            user = build_user(row)
+        except ValidationError as e:
+            result.errors.append(RowError(line, uiu_id, ' '.join(e.messages)))
+            continue
+        taken.add(uiu_id)
+        valid.append((line, user, row['password']))
+
+    if dry_run or not valid:
+        # For a dry run, the number of users that would be created
+        result.created = len(valid)
+        return result
+
+    hashed = hash_passwords([(password, user) for _, user, password in valid], workers)
+    users = []
+    for (line, user, _), (encoded, messages) in zip(valid, hashed):
+        if messages:
+            result.errors.append(RowError(line, user.uiu_id, ' '.join(messages)))
+            continue
+        user.password = encoded
+        users.append((line, user))
+    failed = insert_users(users, batch_size)
+    result.errors.extend(failed)
+    result.errors.sort(key=lambda error: error.line)
+    result.created = len(users) - len(failed)
+
+    # bulk_create sends no post_save, which would drop the cached list
+    if any(user.role == 'STAFF' for _, user in users):
+        doctor_list.invalidate()
+    return result
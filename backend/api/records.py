@@ -0,0 +1,211 @@
+import datetime
+import hashlib
+import os
+import re
+from pathlib import Path
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import MedicalRecord, RecordBlob, RecordUpload
+
+_options = getattr(settings, 'MEDICAL_RECORDS', {})
+STORAGE_ROOT = Path(_options.get('ROOT', settings.BASE_DIR / 'media' / 'records'))
+MAX_FILE_BYTES = _options.get('MAX_FILE_BYTES', 200 * 1024 * 1024)
+MAX_CHUNK_BYTES = _options.get('MAX_CHUNK_BYTES', 8 * 1024 * 1024)
+# How long one request may hold an upload while writing a chunk
+LOCK_SECONDS = _options.get('LOCK_SECONDS', 120)
+UPLOAD_EXPIRY_HOURS = _options.get('UPLOAD_EXPIRY_HOURS', 24)
+BLOCK_SIZE = 64 * 1024
+
+_CONTENT_RANGE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class UploadError(ValueError):
+    def __init__(self, message, offset=None):
+        super().__init__(message)
+        self.offset = offset
+
+
+class UploadConflict(UploadError):
+    pass
+
+
+class RangeNotSatisfiable(ValueError):
+    pass
+
+
+def blob_path(sha256):
+    return STORAGE_ROOT / 'blobs' / sha256[:2] / sha256
+
+
+def part_path(upload):
+    return STORAGE_ROOT / 'uploads' / f'{upload.pk}.part'
+
+
+def upload_status(upload):
+    return {
+        'id': str(upload.pk),
+        'offset': upload.received,
+        'size': upload.size,
+        'max_chunk_size': MAX_CHUNK_BYTES,
+    }
+
+
+def parse_content_range(header, size):
+    """Read `Content-Range: bytes start-end/total` as (start, length)."""
+    match = _CONTENT_RANGE.match(header or '')
+    if not match:
+        raise UploadError('Content-Range must look like "bytes start-end/total"')
+    start, end, total = (int(value) for value in match.groups())
+    if total != size or end < start or end >= size:
+        raise UploadError(f'Content-Range does not fit an upload of {size} bytes')
+    if end - start + 1 > MAX_CHUNK_BYTES:
+        raise UploadError(f'Chunks may be at most {MAX_CHUNK_BYTES} bytes')
+    return start, end - start + 1
+
+
+def write_chunk(upload, stream, start, length):
+    """
+    Copy `length` bytes from `stream` into the part file at `start`, which
+    must be where the upload left off. The bytes only count once all of
+    them have arrived; a cut-off chunk is resent from the same offset.
+    """
+    now = timezone.now()
+    claimed = (
+        RecordUpload.objects
+        .filter(pk=upload.pk, received=start)
+        .filter(Q(locked_until__isnull=True) | Q(locked_until__lt=now))
+        .update(locked_until=now + datetime.timedelta(seconds=LOCK_SECONDS))
+    )
+    if not claimed:
+        upload.refresh_from_db(fields=['received'])
+        raise UploadConflict(f'Expected a chunk starting at byte {upload.received}', upload.received)
+
+    path = part_path(upload)
+    written = 0
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'r+b' if path.exists() else 'wb') as part:
+            part.seek(start)
+            part.truncate()
+            while written < length:
+                block = stream.read(min(BLOCK_SIZE, length - written))
+                if not block:
+                    break
+                part.write(block)
+                written += len(block)
+    finally:
+        upload.received = start + length if written == length else start
+        RecordUpload.objects.filter(pk=upload.pk).update(
+            received=upload.received, locked_until=None, updated_at=timezone.now())
+    if written != length:
+        raise UploadError(f'Chunk ended after {written} of {length} bytes', start)
+
+
+def _hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as part:
+        for block in iter(lambda: part.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _get_blob(sha256, size):
+    try:
+        with transaction.atomic():
+            return RecordBlob.objects.get_or_create(sha256=sha256, defaults={'size': size})[0]
+    except IntegrityError:
+        # An upload of the same content finished alongside this one
+        return RecordBlob.objects.get(sha256=sha256)
+
+
+def finish_upload(upload):
+    """
+    Hash the completed part file and turn the upload into a MedicalRecord.
+    Content already on disk is reused rather than stored twice. Safe to
+    call again after a failure part-way, and by two requests at once: only
+    one of them gets the record, the other an UploadConflict.
+    """
+    path = part_path(upload)
+    if not upload.sha256:
+        try:
+            upload.sha256 = _hash_file(path)
+        except FileNotFoundError:
+            # A finisher running alongside noted the hash before moving the
+            # part file away
+            stored = RecordUpload.objects.filter(pk=upload.pk).values_list('sha256', flat=True)
+            if not stored.exists():
+                raise UploadConflict('This upload has already been finished', upload.size)
+            upload.sha256 = stored.first()
+            if not upload.sha256:
+                raise UploadError('The uploaded data was lost; start a new upload')
+        else:
+            RecordUpload.objects.filter(pk=upload.pk).update(sha256=upload.sha256)
+
+    target = blob_path(upload.sha256)
+    try:
+        if target.exists():
+            path.unlink(missing_ok=True)
+        else:
+            target.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(path, target)
+    except FileNotFoundError:
+        # Already moved by another finisher, or lost; the blob decides which
+        pass
+    if not target.exists():
+        raise UploadError('The uploaded data was lost; start a new upload')
+
+    blob = _get_blob(upload.sha256, upload.size)
+    with transaction.atomic():
+        if not RecordUpload.objects.filter(pk=upload.pk).delete()[0]:
+            raise UploadConflict('This upload has already been finished', upload.size)
+        record = MedicalRecord.objects.create(
+            patient_id=upload.patient_id, uploaded_by_id=upload.uploaded_by_id, blob=blob,
+            title=upload.title, record_type=upload.record_type, description=upload.description,
+            record_date=upload.record_date, file_name=upload.file_name,
+            content_type=upload.content_type)
+    return record
+
+
+def discard_upload(upload):
+    part_path(upload).unlink(missing_ok=True)
+    upload.delete()
+
+
+def parse_range(header, size):
+    """
+    Read a single `Range: bytes=...` as (start, length). Returns None when
+    the whole file should be sent, which includes multi-range requests.
+    """
+    if not header:
+        return None
+    match = _RANGE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if first == '':
+        # bytes=-N is the last N bytes
+        length = min(int(last), size)
+        if length == 0:
+            raise RangeNotSatisfiable()
+        return size - length, length
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        raise RangeNotSatisfiable()
+    return start, end - start + 1
+
+
+def iter_range(path, start, length):
+    with open(path, 'rb') as blob:
+        blob.seek(start)
+        while length > 0:
+            block = blob.read(min(BLOCK_SIZE, length))
+            if not block:
+                break
+            length -= len(block)
+            yield block
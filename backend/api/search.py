@@ -0,0 +1,41 @@
+import re
+
+from django.db.models import F
+
+from .models import AppointmentSearch
+
+_word = re.compile(r'\w+')
+
+
+def match_expression(text):
+    """
+    The FTS5 query for words a user typed, or None if there are none. Every
+    word has to appear, the last one as a prefix so results keep up with
+    typing. Quoting each word keeps FTS5 operators and column filters in
+    the input from being interpreted.
+    """
+    words = _word.findall(text)
+    if not words:
+        return None
+    return ' '.join(f'"{word}"' for word in words) + '*'
+
+
+def search(queryset, text):
+    """
+    Narrow an Appointment queryset to rows whose reason or notes match
+    `text`, best matches first.
+    """
+    expression = match_expression(text)
+    if expression is None:
+        return queryset.none()
+    return (queryset.filter(search_entry__document__match=expression)
+            .annotate(rank=F('search_entry__rank'))
+            .order_by('rank', '-date', '-id'))
+
+
+def matching_ids(text):
+    """Subquery of the ids of appointments matching `text`, for pk__in."""
+    expression = match_expression(text)
+    if expression is None:
+        return AppointmentSearch.objects.none().values('appointment_id')
+    return AppointmentSearch.objects.filter(document__match=expression).values('appointment_id')
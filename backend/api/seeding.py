@@ -0,0 +1,220 @@
+import datetime
+import random
+from dataclasses import dataclass
+
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .conditional import doctor_list
+from .models import Appointment, DoctorSchedule, User
+from .stats import rebuild_stats
+
+FIRST_NAMES = (
+    'Abdullah', 'Afsana', 'Anika', 'Arif', 'Ayesha', 'Farhan', 'Fatema', 'Habib', 'Imran',
+    'Jannat', 'Kamrul', 'Lamia', 'Mahmud', 'Maliha', 'Mehedi', 'Nabila', 'Nafis', 'Nusrat',
+    'Rafiq', 'Raisa', 'Rakib', 'Sabbir', 'Sadia', 'Shakil', 'Sumaiya', 'Tahmid', 'Tanvir',
+    'Tasnim', 'Yasin', 'Zarin',
+)
+LAST_NAMES = (
+    'Ahmed', 'Akter', 'Alam', 'Chowdhury', 'Das', 'Haque', 'Hasan', 'Hossain', 'Islam',
+    'Kabir', 'Karim', 'Khan', 'Mahmud', 'Miah', 'Rahman', 'Roy', 'Sarkar', 'Sultana',
+    'Talukder', 'Uddin',
+)
+DEPARTMENTS = ('CSE', 'EEE', 'Civil', 'BBA', 'Economics', 'English', 'Pharmacy', 'MSJ', 'Data Science')
+BLOOD_GROUPS = ('A+', 'A-', 'B+', 'B-', 'O+', 'O-', 'AB+', 'AB-')
+REASONS = (
+    'Fever and headache', 'Seasonal flu', 'Stomach pain', 'Follow-up visit', 'Skin rash',
+    'Sore throat', 'Back pain', 'Eye irritation', 'Allergy', 'Sports injury',
+    'Dizziness', 'Vaccination', 'Medical certificate', 'Toothache', 'Chest congestion',
+)
+# How appointments end up, before and after today
+PAST_STATUS_WEIGHTS = {'completed': 72, 'cancelled': 14, 'confirmed': 8, 'pending': 6}
+FUTURE_STATUS_WEIGHTS = {'pending': 55, 'confirmed': 38, 'cancelled': 7}
+EMERGENCY_RATE = 0.03
+# Share of published slots that get booked
+SLOT_OCCUPANCY = 0.85
+# The campus clinic is open Sunday to Thursday
+WORKDAYS = (6, 0, 1, 2, 3)
+SHIFTS = ((datetime.time(9), datetime.time(13)), (datetime.time(14), datetime.time(17)))
+SLOT_MINUTES = 20
+# Share of staff who see patients; the rest are nurses and pharmacists
+DOCTOR_SHARE = 0.75
+DEFAULT_PASSWORD = 'campus-pass-123'
+
+APPOINTMENT_COLUMNS = ('patient_id', 'doctor_id', 'date', 'time', 'status', 'reason',
+                       'emergency', 'notes', 'slot_start', 'created_at', 'updated_at')
+
+
+@dataclass
+class Campus:
+    students: list
+    doctors: list
+    staff: list
+    admins: list
+    appointments: int
+    first_date: datetime.date
+    last_date: datetime.date
+
+
+def student_ids(count, rng):
+    """UIU IDs like 0112231234: 011, intake year, trimester, serial."""
+    cohorts = [(year, trimester) for year in range(18, 26) for trimester in (1, 2, 3)]
+    per_cohort = -(-count // len(cohorts))
+    ids = [f'011{year:02d}{trimester}{serial:04d}'
+           for year, trimester in cohorts for serial in range(1, per_cohort + 1)]
+    return rng.sample(ids, count)
+
+
+def _person(rng, uiu_id, role, password, now):
+    first_name = rng.choice(FIRST_NAMES)
+    last_name = rng.choice(LAST_NAMES)
+    return User(
+        username=uiu_id, uiu_id=uiu_id, role=role, password=password,
+        first_name=first_name, last_name=last_name,
+        email=f'{uiu_id.lower()}@uiu.ac.bd',
+        phone=f'01{rng.randint(3, 9)}{rng.randint(0, 99999999):08d}',
+        department=rng.choice(DEPARTMENTS) if role == 'STUDENT' else 'Medical Center',
+        blood_group=rng.choice(BLOOD_GROUPS),
+        is_staff=role == 'ADMIN', email_verified=True, date_joined=now,
+    )
+
+
+def create_users(rng, students, staff, admins=3, password=DEFAULT_PASSWORD, batch_size=2000):
+    """Create the campus population. Everyone shares one password hash."""
+    now = timezone.now()
+    encoded = make_password(password)
+    doctors = round(staff * DOCTOR_SHARE)
+    people = ([_person(rng, uiu_id, 'STUDENT', encoded, now) for uiu_id in student_ids(students, rng)] +
+              [_person(rng, f'DOC{n:03d}', 'STAFF', encoded, now) for n in range(1, doctors + 1)] +
+              [_person(rng, f'STAFF{n:03d}', 'STAFF', encoded, now) for n in range(1, staff - doctors + 1)] +
+              [_person(rng, f'ADMIN{n:02d}', 'ADMIN', encoded, now) for n in range(1, admins + 1)])
+
+    existing = set(User.objects.values_list('uiu_id', flat=True))
+    clashes = existing.intersection(person.uiu_id for person in people)
+    if clashes:
+        raise ValueError(f'{len(clashes)} generated UIU IDs already exist, e.g. {min(clashes)}; '
+                         f'seed an empty database')
+
+    User.objects.bulk_create(people, batch_size=batch_size)
+    by_role = {'STUDENT': [], 'DOC': [], 'STAFF': [], 'ADMIN': []}
+    for person in people:
+        by_role['DOC' if person.uiu_id.startswith('DOC') else person.role].append(person.pk)
+    return by_role['STUDENT'], by_role['DOC'], by_role['STAFF'], by_role['ADMIN']
+
+
+def day_slots():
+    slots = []
+    for start, end in SHIFTS:
+        moment = datetime.datetime.combine(datetime.date.min, start)
+        while (moment + datetime.timedelta(minutes=SLOT_MINUTES)).time() <= end:
+            slots.append(moment.time())
+            moment += datetime.timedelta(minutes=SLOT_MINUTES)
+    return slots
+
+
+def create_schedules(doctors):
+    DoctorSchedule.objects.bulk_create(
+        DoctorSchedule(doctor_id=doctor, weekday=weekday, start_time=start, end_time=end,
+                       slot_minutes=SLOT_MINUTES)
+        for doctor in doctors for weekday in WORKDAYS for start, end in SHIFTS)
+
+
+def workdays_back(last_date, count):
+    """The `count` clinic days up to and including last_date, newest first."""
+    days = []
+    day = last_date
+    while len(days) < count:
+        if day.weekday() in WORKDAYS:
+            days.append(day)
+        day -= datetime.timedelta(days=1)
+    return days
+
+
+def appointment_rows(rng, students, doctors, count, future_days, today):
+    """
+    Yield `count` appointment rows filling the doctors' slots day by day,
+    backwards from `future_days` ahead. Frequent visitors are favoured, as
+    in a real clinic, and each slot holds at most one appointment.
+    """
+    slots = day_slots()
+    per_day = len(doctors) * len(slots) * SLOT_OCCUPANCY
+    # A little spare in case random occupancy falls short
+    days = workdays_back(today + datetime.timedelta(days=future_days), int(count / per_day * 1.05) + 1)
+    ops = connection.ops
+    adapt_date, adapt_time = ops.adapt_datefield_value, ops.adapt_timefield_value
+    adapt_datetime = ops.adapt_datetimefield_value
+    slot_values = [(adapt_time(slot), slot.strftime('%I:%M %p'), slot) for slot in slots]
+    past, future = (list(weights.items()) for weights in (PAST_STATUS_WEIGHTS, FUTURE_STATUS_WEIGHTS))
+    tz = timezone.get_current_timezone()
+    now = timezone.now()
+
+    produced = 0
+    for day in days:
+        statuses, weights = zip(*(past if day < today else future))
+        date_value = adapt_date(day)
+        for doctor in doctors:
+            for slot_value, display, slot in slot_values:
+                if rng.random() >= SLOT_OCCUPANCY:
+                    continue
+                status = rng.choices(statuses, weights)[0]
+                starts = datetime.datetime.combine(day, slot, tz)
+                booked = min(now, starts - datetime.timedelta(
+                    days=rng.randint(0, 14), minutes=rng.randint(0, 600)))
+                updated = min(now, starts + datetime.timedelta(minutes=30)) if status == 'completed' else booked
+                yield (
+                    students[int(len(students) * rng.random() ** 2)], doctor, date_value, display,
+                    status, rng.choice(REASONS), rng.random() < EMERGENCY_RATE, None,
+                    slot_value, adapt_datetime(booked), adapt_datetime(updated),
+                )
+                produced += 1
+                if produced == count:
+                    return
+
+
+def insert_appointments(rows, batch_size=20000, progress=None):
+    """
+    Load appointment tuples with executemany, skipping the ORM's per-row
+    work. Signals don't fire, so callers rebuild derived tables afterwards.
+    """
+    quote = connection.ops.quote_name
+    sql = (f'INSERT INTO {quote(Appointment._meta.db_table)} '
+           f'({", ".join(quote(column) for column in APPOINTMENT_COLUMNS)}) '
+           f'VALUES ({", ".join(["%s"] * len(APPOINTMENT_COLUMNS))})')
+    total = 0
+    batch = []
+    with connection.cursor() as cursor:
+        for row in rows:
+            batch.append(row)
+            if len(batch) == batch_size:
+                with transaction.atomic():
+                    cursor.executemany(sql, batch)
+                total += len(batch)
+                batch = []
+                if progress:
+                    progress(total)
+        if batch:
+            with transaction.atomic():
+                cursor.executemany(sql, batch)
+            total += len(batch)
+    return total
+
+
+def seed_campus(students=30000, staff=200, appointments=2_000_000, seed=42, future_days=14,
+                progress=None):
+    """
+    Fill an empty database with a reproducible campus: the same `seed`
+    gives the same people and appointments. Returns a Campus summary.
+    """
+    rng = random.Random(seed)
+    today = timezone.localdate()
+    student_pks, doctors, other_staff, admins = create_users(rng, students, staff)
+    create_schedules(doctors)
+    created = insert_appointments(
+        appointment_rows(rng, student_pks, doctors, appointments, future_days, today),
+        progress=progress)
+    rebuild_stats()
+    doctor_list.invalidate()
+    first_date, last_date = (Appointment.objects.order_by(order).values_list('date', flat=True).first()
+                             for order in ('date', '-date'))
+    return Campus(student_pks, doctors, other_staff, admins, created, first_date, last_date)
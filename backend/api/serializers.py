@@ -1,6 +1,13 @@
 from rest_framework import serializers
 from django.contrib.auth.password_validation import validate_password
-from .models import User, Appointment
+from django.contrib.auth.tokens import default_token_generator
+from django.utils.encoding import force_str
+from django.utils.http import urlsafe_base64_decode
+from django.db import IntegrityError, transaction
+from .availability import is_bookable, is_past, parse_slot_time
+from .models import User, Appointment, MedicalRecord, RecordUpload, Medicine, StockBatch, Order, OrderItem
+from .provisioning import role_for_uiu_id, split_name
+from .records import MAX_FILE_BYTES
 
 class RegisterSerializer(serializers.ModelSerializer):
     password = serializers.CharField(
@@ -34,25 +41,13 @@ class RegisterSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         validated_data.pop('confirmPassword')
 
-        # Split name into first_name and last_name
-        full_name = validated_data.pop('name')
-        name_parts = full_name.strip().split(' ', 1)
-        first_name = name_parts[0]
-        last_name = name_parts[1] if len(name_parts) > 1 else ''
+        first_name, last_name = split_name(validated_data.pop('name'))
 
         # Use uiu_id as username
         username = validated_data['uiu_id']
 
         # Determine role from UIU ID
-        uiu_id = validated_data['uiu_id']
-        if uiu_id.startswith('011'):
-            role = 'STUDENT'
-        elif uiu_id.startswith('STAFF') or uiu_id.startswith('DOC'):
-            role = 'STAFF'
-        elif uiu_id.startswith('ADMIN') or uiu_id == 'admin':
-            role = 'ADMIN'
-        else:
-            role = 'STUDENT'
+        role = role_for_uiu_id(validated_data['uiu_id'])
 
         user = User.objects.create_user(
             username=username,
@@ -68,6 +63,37 @@ class RegisterSerializer(serializers.ModelSerializer):
         return user
 
 
+class PasswordResetRequestSerializer(serializers.Serializer):
+    email = serializers.EmailField()
+
+
+class PasswordResetConfirmSerializer(serializers.Serializer):
+    uid = serializers.CharField()
+    token = serializers.CharField()
+    password = serializers.CharField(write_only=True)
+    confirmPassword = serializers.CharField(write_only=True)
+
+    def validate(self, attrs):
+        try:
+            pk = force_str(urlsafe_base64_decode(attrs['uid']))
+            user = User.objects.get(pk=pk, is_active=True)
+        except (ValueError, OverflowError, User.DoesNotExist):
+            user = None
+        if user is None or not default_token_generator.check_token(user, attrs['token']):
+            raise serializers.ValidationError(
+                {"token": "This reset link is invalid or has expired."})
+        if attrs['password'] != attrs['confirmPassword']:
+            raise serializers.ValidationError(
+                {"password": "Password fields didn't match."})
+        validate_password(attrs['password'], user)
+        attrs['user'] = user
+        return attrs
+
+
+class VerifyEmailSerializer(serializers.Serializer):
+    token = serializers.CharField()
+
+
 class UserSerializer(serializers.ModelSerializer):
     name = serializers.SerializerMethodField()
     uiuId = serializers.CharField(source='uiu_id', read_only=True)
@@ -111,18 +137,147 @@ class BookAppointmentSerializer(serializers.ModelSerializer):
 
     def validate_doctor_id(self, value):
         try:
-            doctor = User.objects.get(uiu_id=value, role='staff')
+            doctor = User.objects.get(uiu_id=value, role='STAFF')
             return doctor
         except User.DoesNotExist:
             raise serializers.ValidationError("Invalid doctor ID")
 
+    def validate(self, attrs):
+        slot_start = parse_slot_time(attrs['time'])
+        if slot_start is None:
+            raise serializers.ValidationError(
+                {"time": "Time must look like '09:30 AM' or '09:30'."})
+
+        # Same cut-off as the availability listing, which hides started slots
+        if is_past(attrs['date'], slot_start):
+            raise serializers.ValidationError(
+                {"date": "Appointments can't be booked in the past."})
+
+        if not is_bookable(attrs['doctor_id'], attrs['date'], slot_start):
+            raise serializers.ValidationError(
+                {"time": "The doctor is not available at this time."})
+
+        attrs['slot_start'] = slot_start
+        return attrs
+
     def create(self, validated_data):
         doctor = validated_data.pop('doctor_id')
         validated_data['doctor'] = doctor
         validated_data['patient'] = self.context['request'].user
-        return super().create(validated_data)
+
+        # The partial unique constraint on (doctor, date, slot_start) decides
+        # which of two concurrent bookings for the same slot wins
+        try:
+            with transaction.atomic():
+                return super().create(validated_data)
+        except IntegrityError:
+            raise serializers.ValidationError(
+                {"time": ["This slot has already been booked."]})
 
 
 class UpdateAppointmentStatusSerializer(serializers.Serializer):
     status = serializers.ChoiceField(
         choices=['pending', 'confirmed', 'completed', 'cancelled'])
+
+
+class BulkAppointmentStatusSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), allow_empty=False, max_length=500)
+    status = serializers.ChoiceField(
+        choices=['pending', 'confirmed', 'completed', 'cancelled'])
+
+
+class MedicalRecordSerializer(serializers.ModelSerializer):
+    patient_id = serializers.CharField(source='patient.uiu_id', read_only=True)
+    uploaded_by = serializers.CharField(source='uploaded_by.uiu_id', read_only=True, default=None)
+    size = serializers.IntegerField(source='blob.size', read_only=True)
+    sha256 = serializers.CharField(source='blob.sha256', read_only=True)
+
+    class Meta:
+        model = MedicalRecord
+        fields = ('id', 'patient_id', 'title', 'record_type', 'description', 'record_date',
+                  'file_name', 'content_type', 'size', 'sha256', 'uploaded_by',
+                  'created_at', 'updated_at')
+        read_only_fields = fields
+
+
+class RecordUploadSerializer(serializers.ModelSerializer):
+    # Staff and admins upload on behalf of a patient; students upload their own
+    patient_id = serializers.CharField(write_only=True, required=False)
+
+    class Meta:
+        model = RecordUpload
+        fields = ('patient_id', 'title', 'record_type', 'description', 'record_date',
+                  'file_name', 'content_type', 'size')
+
+    def validate_size(self, value):
+        if not 0 < value <= MAX_FILE_BYTES:
+            raise serializers.ValidationError(f"Files must be between 1 and {MAX_FILE_BYTES} bytes.")
+        return value
+
+    def validate(self, attrs):
+        user = self.context['request'].user
+        patient_id = attrs.pop('patient_id', None)
+        if user.role == 'STUDENT':
+            attrs['patient'] = user
+        elif not patient_id:
+            raise serializers.ValidationError({"patient_id": "This field is required."})
+        else:
+            try:
+                attrs['patient'] = User.objects.get(uiu_id=patient_id)
+            except User.DoesNotExist:
+                raise serializers.ValidationError({"patient_id": "Invalid patient ID"})
+        attrs['uploaded_by'] = user
+        return attrs
+
+
+class MedicineSerializer(serializers.ModelSerializer):
+    stock = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Medicine
+        fields = ('id', 'name', 'generic_name', 'form', 'strength', 'unit_price',
+                  'is_active', 'stock')
+
+
+class StockBatchSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = StockBatch
+        fields = ('id', 'batch_number', 'quantity', 'expiry_date', 'received_at')
+        read_only_fields = ('id', 'received_at')
+
+
+class OrderItemSerializer(serializers.ModelSerializer):
+    medicine_id = serializers.IntegerField(read_only=True)
+    medicine_name = serializers.CharField(source='medicine.name', read_only=True)
+    batch_number = serializers.CharField(source='batch.batch_number', read_only=True)
+
+    class Meta:
+        model = OrderItem
+        fields = ('medicine_id', 'medicine_name', 'batch_number', 'quantity', 'unit_price')
+
+
+class OrderSerializer(serializers.ModelSerializer):
+    patient_id = serializers.CharField(source='patient.uiu_id', read_only=True)
+    items = OrderItemSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = Order
+        fields = ('id', 'patient_id', 'status', 'total', 'items', 'created_at', 'updated_at')
+        read_only_fields = fields
+
+
+class OrderLineSerializer(serializers.Serializer):
+    medicine_id = serializers.IntegerField(min_value=1)
+    quantity = serializers.IntegerField(min_value=1, max_value=1000)
+
+
+class PlaceOrderSerializer(serializers.Serializer):
+    items = OrderLineSerializer(many=True, allow_empty=False, max_length=50)
+
+    def validate_items(self, value):
+        # Merge repeated medicines into one line
+        lines = {}
+        for line in value:
+            lines[line['medicine_id']] = lines.get(line['medicine_id'], 0) + line['quantity']
+        return lines
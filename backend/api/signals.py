@@ -0,0 +1,90 @@
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import Signal, receiver
+
+from .authentication import user_cache
+from .conditional import doctor_list
+from .events import broker
+from .jobs import enqueue_many
+from .metrics import install_query_recorder
+from .models import Appointment, AppointmentTombstone, User
+from .stats import move_stat
+
+# Sent by the status-changing views with `changes`, a list of dicts built by
+# status_change(); receivers should defer side effects to transaction commit
+appointment_status_changed = Signal()
+
+
+def status_change(pk, patient_id, doctor_id, date, time, status, previous_status):
+    return {
+        'id': pk,
+        'patient_id': patient_id,
+        'doctor_id': doctor_id,
+        'date': date.isoformat(),
+        'time': time,
+        'status': status,
+        'previous_status': previous_status,
+    }
+
+
+connection_created.connect(install_query_recorder)
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    user_cache.invalidate(instance.pk)
+    # Role changes move users in and out of the list, so any save counts
+    doctor_list.invalidate()
+
+
+@receiver(pre_save, sender=Appointment)
+def remember_appointment_stat_key(sender, instance, raw, **kwargs):
+    # Instances not loaded through the ORM don't know their stored bucket
+    if raw or instance._state.adding or hasattr(instance, '_loaded_stat_key'):
+        return
+    stored = (Appointment.objects.filter(pk=instance.pk)
+              .values_list('date', 'doctor_id', 'status').first())
+    instance._loaded_stat_key = tuple(stored) if stored else None
+
+
+@receiver(post_save, sender=Appointment)
+def update_appointment_stats(sender, instance, created, raw, **kwargs):
+    if raw:
+        return
+    old_key = None if created else instance._loaded_stat_key
+    move_stat(old_key, instance.stat_key)
+    instance._loaded_stat_key = instance.stat_key
+
+
+@receiver(post_delete, sender=Appointment)
+def remove_appointment_stats(sender, instance, **kwargs):
+    move_stat(getattr(instance, '_loaded_stat_key', instance.stat_key), None)
+
+
+@receiver(post_delete, sender=Appointment)
+def record_appointment_tombstone(sender, instance, **kwargs):
+    AppointmentTombstone.objects.create(
+        appointment_id=instance.pk, patient_id=instance.patient_id,
+        doctor_id=instance.doctor_id)
+
+
+@receiver(appointment_status_changed)
+def publish_status_events(sender, changes, **kwargs):
+    def publish():
+        for change in changes:
+            event = {'type': 'appointment.status',
+                     **{key: value for key, value in change.items()
+                        if key not in ('patient_id', 'doctor_id')}}
+            broker.publish((change['patient_id'], change['doctor_id']), event)
+    transaction.on_commit(publish)
+
+
+@receiver(appointment_status_changed)
+def queue_status_emails(sender, changes, **kwargs):
+    # Written in the same transaction as the change, so it can't be lost
+    # or sent for a change that rolled back
+    enqueue_many('email.appointment_status', [
+        {'appointment_id': change['id'], 'status': change['status'],
+         'previous_status': change['previous_status']}
+        for change in changes])
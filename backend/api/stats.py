@@ -0,0 +1,119 @@
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+
+from .models import Appointment, AppointmentDailyStat
+
+STATUSES = [value for value, _ in Appointment.STATUS_CHOICES]
+
+
+def apply_stat_delta(date, doctor_id, status, delta):
+    """Add `delta` to one (date, doctor, status) rollup bucket."""
+    buckets = AppointmentDailyStat.objects.filter(
+        date=date, doctor_id=doctor_id, status=status)
+    if delta < 0:
+        # Only ever takes from an existing bucket: a missing one went with
+        # its doctor, whose appointments are being deleted too. Emptied
+        # buckets are dropped, as rebuild_stats() never writes them
+        buckets.update(count=F('count') + delta)
+        buckets.filter(count__lte=0).delete()
+        return
+    if buckets.update(count=F('count') + delta):
+        return
+    try:
+        with transaction.atomic():
+            AppointmentDailyStat.objects.create(
+                date=date, doctor_id=doctor_id, status=status, count=delta)
+    except IntegrityError:
+        # Another request created the bucket first
+        buckets.update(count=F('count') + delta)
+
+
+def move_stat(old_key, new_key):
+    if old_key == new_key:
+        return
+    if old_key is not None:
+        apply_stat_delta(*old_key, -1)
+    if new_key is not None:
+        apply_stat_delta(*new_key, 1)
+
+
+def apply_stat_changes(changes):
+    """Apply many (old_key, new_key) moves with one update per bucket."""
+    deltas = Counter()
+    for old_key, new_key in changes:
+        if old_key != new_key:
+            deltas[old_key] -= 1
+            deltas[new_key] += 1
+    for key, delta in deltas.items():
+        if key is not None and delta:
+            apply_stat_delta(*key, delta)
+
+
+@transaction.atomic
+def rebuild_stats():
+    AppointmentDailyStat.objects.all().delete()
+    rows = (
+        Appointment.objects.order_by()
+        .values('date', 'doctor_id', 'status')
+        .annotate(total=Count('id'))
+    )
+    AppointmentDailyStat.objects.bulk_create(
+        (AppointmentDailyStat(date=row['date'], doctor_id=row['doctor_id'],
+                              status=row['status'], count=row['total'])
+         for row in rows.iterator(chunk_size=5000)),
+        batch_size=1000,
+    )
+    return AppointmentDailyStat.objects.count()
+
+
+def get_stats(user, date_from, date_to):
+    """
+    Per-day, per-status and per-doctor appointment counts visible to `user`.
+
+    Staff and admins read the rollup table, so the cost grows with the number
+    of days and doctors rather than appointments. Students have no rollup
+    dimension of their own and are counted straight from their (indexed)
+    appointments.
+    """
+    if user.role == 'STUDENT':
+        rows = Appointment.objects.filter(patient=user)
+        total = Count('id')
+    else:
+        rows = AppointmentDailyStat.objects.all()
+        if user.role == 'STAFF':
+            rows = rows.filter(doctor=user)
+        total = Sum('count')
+    rows = rows.filter(date__range=(date_from, date_to)).order_by()
+
+    by_status = dict.fromkeys(STATUSES, 0)
+    days = {}
+    for row in rows.values('date', 'status').annotate(total=total).order_by('date'):
+        day = days.setdefault(row['date'], {'date': row['date'].isoformat(), 'total': 0,
+                                            **dict.fromkeys(STATUSES, 0)})
+        day[row['status']] += row['total']
+        day['total'] += row['total']
+        by_status[row['status']] += row['total']
+
+    by_doctor = [
+        {
+            'doctor_id': row['doctor__uiu_id'],
+            'doctor_name': (f"{row['doctor__first_name']} {row['doctor__last_name']}".strip()
+                            or row['doctor__username']),
+            'total': row['total'],
+        }
+        for row in rows.values('doctor__uiu_id', 'doctor__first_name',
+                               'doctor__last_name', 'doctor__username')
+        .annotate(total=total).order_by('-total')
+        if row['total']
+    ]
+
+    return {
+        'from': date_from.isoformat(),
+        'to': date_to.isoformat(),
+        'total': sum(by_status.values()),
+        'by_status': by_status,
+        'by_day': [day for day in days.values() if day['total']],
+        'by_doctor': by_doctor,
+    }
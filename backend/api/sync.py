@@ -0,0 +1,110 @@
+import datetime
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Appointment, AppointmentTombstone
+
+_options = getattr(settings, 'APPOINTMENT_SYNC', {})
+# Rows touched in the last few seconds are sent again on the next poll, so a
+# transaction that commits after a later one is still picked up
+SETTLE_SECONDS = _options.get('SETTLE_SECONDS', 5)
+# Watermarks older than this may have missed pruned tombstones
+TOMBSTONE_RETENTION_DAYS = _options.get('TOMBSTONE_RETENTION_DAYS', 30)
+
+
+class WatermarkError(ValueError):
+    pass
+
+
+class WatermarkExpired(WatermarkError):
+    pass
+
+
+def encode_watermark(changed, deleted):
+    data = {
+        'c': [changed[0].isoformat(), changed[1]] if changed else None,
+        'd': [deleted[0].isoformat(), deleted[1]] if deleted else None,
+    }
+    return urlsafe_b64encode(json.dumps(data, separators=(',', ':')).encode()).decode()
+
+
+def _decode_position(position):
+    if position is None:
+        return None
+    moment = datetime.datetime.fromisoformat(position[0])
+    if timezone.is_naive(moment):
+        raise WatermarkError('Watermark timestamps must carry a timezone')
+    return moment, int(position[1])
+
+
+def decode_watermark(token):
+    if not token:
+        return None, None
+    horizon = timezone.now() - datetime.timedelta(days=TOMBSTONE_RETENTION_DAYS)
+    try:
+        data = json.loads(urlsafe_b64decode(token.encode()))
+        changed, deleted = _decode_position(data['c']), _decode_position(data['d'])
+        expired = any(position[0] < horizon for position in (changed, deleted) if position)
+    except Exception:
+        raise WatermarkError('Invalid watermark')
+    if expired:
+        raise WatermarkExpired('Watermark has expired; fetch the full list again')
+    return changed, deleted
+
+
+def _after(position, field):
+    if position is None:
+        return Q()
+    moment, pk = position
+    return Q(**{f'{field}__gt': moment}) | Q(**{field: moment, 'id__gt': pk})
+
+
+def _settled(position, last, has_more):
+    """Pick the next position for one stream of changes."""
+    if has_more:
+        return last
+    # Caught up: step back to the settle horizon so in-flight rows are
+    # delivered next time, but never behind where the client already was
+    horizon = (timezone.now() - datetime.timedelta(seconds=SETTLE_SECONDS), 0)
+    candidates = [p for p in (position, min(last, horizon) if last else horizon) if p]
+    return max(candidates)
+
+
+def get_changes(user, token, limit):
+    """
+    Appointments visible to `user` that changed or were deleted after the
+    watermark `token`. Both streams are walked in (timestamp, id) order on
+    indexed columns, `limit` rows at a time.
+    """
+    changed_position, deleted_position = decode_watermark(token)
+
+    changed = list(
+        Appointment.objects.for_user(user).with_users()
+        .filter(_after(changed_position, 'updated_at'))
+        .order_by('updated_at', 'id')[:limit + 1]
+    )
+    tombstones = AppointmentTombstone.objects.filter(_after(deleted_position, 'deleted_at'))
+    if user.role == 'STUDENT':
+        tombstones = tombstones.filter(patient_id=user.id)
+    elif user.role == 'STAFF':
+        tombstones = tombstones.filter(doctor_id=user.id)
+    deleted = list(tombstones.order_by('deleted_at', 'id')
+                   .values_list('deleted_at', 'id', 'appointment_id')[:limit + 1])
+
+    changed_more, deleted_more = len(changed) > limit, len(deleted) > limit
+    changed, deleted = changed[:limit], deleted[:limit]
+    last_changed = (changed[-1].updated_at, changed[-1].id) if changed else None
+    last_deleted = deleted[-1][:2] if deleted else None
+
+    return {
+        'changed': changed,
+        'deleted': [appointment_id for _, _, appointment_id in deleted],
+        'has_more': changed_more or deleted_more,
+        'watermark': encode_watermark(
+            _settled(changed_position, last_changed, changed_more),
+            _settled(deleted_position, last_deleted, deleted_more)),
+    }
@@ -1,3 +1,1649 @@
-from django.test import TestCase
+import asyncio
+import csv
+import datetime
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from base64 import urlsafe_b64encode
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
 
-# Create your tests here.
+from unittest import mock
+from urllib.parse import parse_qs, urlsplit
+
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, connections
+from django.db.models import Count, QuerySet, Sum
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken as BaseRefreshToken
+
+from . import jobs, throttling
+from .authentication import user_cache
+from .caching import TTLCache
+from .admin import estimated_row_count
+from .events import broker, format_sse
+from .exports import APPOINTMENT_COLUMNS
+from .login import LastLoginRecorder
+from .mailsink import MailSink
+from .models import (User, Appointment, AppointmentDailyStat, DoctorSchedule, IdempotencyKey, Job,
+                     MedicalRecord, Medicine, MedicineDailySales, OrderItem, RecordBlob, RecordUpload,
+                     StockBatch)
+from .pagination import AppointmentCursorPagination
+from .routers import ReadOnlyRouter, read_only
+from . import provisioning, records, seeding, sync
+from .pharmacy import InsufficientStock, place_order
+from .provisioning import import_users, read_csv
+from .triage import claim_next, waiting
+from .tokens import RefreshToken, blacklist_filter
+from .views import AppointmentListView, BookAppointmentView
+
+
+class AppointmentQueryPlanTests(TestCase):
+    """
+    Every branch of AppointmentListView.get_queryset must be served by an
+    index, both for the lookup and for the (-date, -time, id) page ordering.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = User.objects.create_user(
+            username='0111', uiu_id='0111', role='STUDENT')
+        cls.doctor = User.objects.create_user(
+            username='DOC1', uiu_id='DOC1', role='STAFF')
+        cls.admin = User.objects.create_user(
+            username='ADMIN1', uiu_id='ADMIN1', role='ADMIN')
+        Appointment.objects.bulk_create([
+            Appointment(patient=cls.student, doctor=cls.doctor,
+                        date=datetime.date(2025, 1, 1) + datetime.timedelta(days=i % 30),
+                        time=f'{9 + i % 8:02d}:00', reason='Checkup',
+                        emergency=i % 10 == 0,
+                        status=('pending', 'confirmed', 'completed')[i % 3])
+            for i in range(300)
+        ])
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def get_plan(self, user, params=None):
+        view = AppointmentListView()
+        request = Request(APIRequestFactory().get('/api/appointments/', params or {}))
+        request.user = user
+        view.request = request
+        view.format_kwarg = None
+        queryset = view.filter_queryset(view.get_queryset())
+        queryset = queryset.order_by(*AppointmentCursorPagination.ordering)
+        return queryset[:AppointmentCursorPagination.page_size + 1].explain()
+
+    def assertIndexed(self, plan):
+        table = Appointment._meta.db_table
+        for line in plan.splitlines():
+            detail = line.split(maxsplit=3)[-1]
+            self.assertFalse(detail == f'SCAN {table}',
+                             f'Full table scan on {table}:\n{plan}')
+            self.assertNotIn('TEMP B-TREE FOR ORDER BY', detail,
+                             f'Ordering not served by an index:\n{plan}')
+
+    def test_student_branch(self):
+        self.assertIndexed(self.get_plan(self.student))
+
+    def test_staff_branch(self):
+        self.assertIndexed(self.get_plan(self.doctor))
+
+    def test_admin_branch(self):
+        self.assertIndexed(self.get_plan(self.admin))
+
+    def test_admin_emergency_filter(self):
+        self.assertIndexed(self.get_plan(self.admin, {'emergency': 'true'}))
+
+    def test_admin_date_filter(self):
+        self.assertIndexed(self.get_plan(self.admin, {'date': '2025-01-05'}))
+
+
+class AppointmentSearchTests(TestCase):
+    """
+    The full-text index follows inserts, edits and deletes, and searches
+    are scoped like the appointment list.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = User.objects.create_user(username='0111', uiu_id='0111', role='STUDENT')
+        cls.other = User.objects.create_user(username='0112', uiu_id='0112', role='STUDENT')
+        cls.doctor = User.objects.create_user(username='DOC1', uiu_id='DOC1', role='STAFF')
+        cls.admin = User.objects.create_superuser(
+            username='ADMIN1', uiu_id='ADMIN1', role='ADMIN', password='x')
+        day = datetime.date(2025, 1, 5)
+        cls.fever = Appointment.objects.create(
+            patient=cls.student, doctor=cls.doctor, date=day, time='09:00 AM',
+            reason='Fever and headaches', notes='High fever for three days, fever persists')
+        cls.rash = Appointment.objects.create(
+            patient=cls.student, doctor=cls.doctor, date=day, time='10:00 AM',
+            reason='Skin rash', notes='Mild fever')
+        cls.others = Appointment.objects.create(
+            patient=cls.other, doctor=cls.doctor, date=day, time='11:00 AM',
+            reason='Fever')
+
+    def search(self, user, q, **params):
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.get('/api/appointments/search/', {'q': q, **params})
+        self.assertEqual(response.status_code, 200)
+        return [row['id'] for row in response.json()['results']]
+
+    def test_results_are_ranked_and_scoped(self):
+        self.assertEqual(self.search(self.student, 'fever'), [self.fever.pk, self.rash.pk])
+        self.assertEqual(self.search(self.other, 'fever'), [self.others.pk])
+        self.assertCountEqual(self.search(self.admin, 'fever'),
+                              [self.fever.pk, self.rash.pk, self.others.pk])
+
+    def test_stemming_prefixes_and_operators(self):
+        self.assertEqual(self.search(self.student, 'headache'), [self.fever.pk])
+        self.assertEqual(self.search(self.student, 'ski'), [self.rash.pk])
+        # FTS5 syntax in the input is treated as plain words
+        self.assertEqual(self.search(self.student, 'rash "fever'), [self.rash.pk])
+
+    def test_index_follows_edits_and_deletes(self):
+        Appointment.objects.filter(pk=self.rash.pk).update(notes='Eczema flare-up')
+        self.assertEqual(self.search(self.student, 'fever'), [self.fever.pk])
+        self.assertEqual(self.search(self.student, 'eczema'), [self.rash.pk])
+        self.fever.delete()
+        self.assertEqual(self.search(self.student, 'fever'), [])
+
+    def test_query_is_required(self):
+        client = APIClient()
+        client.force_authenticate(self.student)
+        response = client.get('/api/appointments/search/', {'q': ' '})
+        self.assertEqual(response.status_code, 400)
+
+    def test_admin_changelist_search(self):
+        self.client.force_login(self.admin)
+        response = self.client.get('/admin/api/appointment/', {'q': 'headaches'})
+        self.assertEqual([row.pk for row in response.context['cl'].result_list], [self.fever.pk])
+        response = self.client.get('/admin/api/appointment/', {'q': '0112'})
+        self.assertEqual([row.pk for row in response.context['cl'].result_list], [self.others.pk])
+
+
+class ConditionalGetTests(TestCase):
+    """
+    Appointment lists and details answer revalidation with 304 Not Modified
+    until something they show changes, without aggregating the whole table.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = User.objects.create_user(username='0111', uiu_id='0111', role='STUDENT')
+        cls.doctor = User.objects.create_user(username='DOC1', uiu_id='DOC1', role='STAFF')
+        cls.appointments = Appointment.objects.bulk_create(
+            Appointment(patient=cls.student, doctor=cls.doctor,
+                        date=datetime.date(2025, 1, 1 + i), time='09:00 AM', reason='Checkup')
+            for i in range(3))
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.student)
+
+    def revalidate(self, url, etag):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    def test_list_page_revalidates(self):
+        with CaptureQueriesContext(connection) as queries:
+            first = self.client.get('/api/appointments/')
+        self.assertEqual(first.status_code, 200)
+        self.assertFalse([query for query in queries if 'COUNT(' in query['sql'] or
+                          'MAX(' in query['sql']])
+        self.assertEqual(self.revalidate('/api/appointments/', first['ETag']).status_code, 304)
+
+        # An edited row, or a renamed patient shown on the page, is a new ETag
+        appointment = self.appointments[0]
+        appointment.notes = 'Bring reports'
+        appointment.save()
+        second = self.revalidate('/api/appointments/', first['ETag'])
+        self.assertEqual(second.status_code, 200)
+        self.assertNotEqual(second['ETag'], first['ETag'])
+        self.student.first_name = 'Ana'
+        self.student.save()
+        self.assertEqual(self.revalidate('/api/appointments/', second['ETag']).status_code, 200)
+
+    def test_list_etag_follows_rows_leaving_the_page(self):
+        first = self.client.get('/api/appointments/', {'page_size': 2})
+        self.appointments[-1].delete()
+        response = self.revalidate('/api/appointments/?page_size=2', first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 2)
+
+    def test_detail_revalidates(self):
+        url = f'/api/appointments/{self.appointments[0].pk}/'
+        first = self.client.get(url)
+        self.assertEqual(self.revalidate(url, first['ETag']).status_code, 304)
+        Appointment.objects.filter(pk=self.appointments[0].pk).update(
+            status='confirmed', updated_at=timezone.now())
+        self.assertEqual(self.revalidate(url, first['ETag']).status_code, 200)
+
+
+class KeysetPaginationTests(TestCase):
+    """
+    Cursor pages walk the (-date, -time, id) ordering without skipping or
+    repeating rows, whatever shape the paged rows come in.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = User.objects.create_user(username='0111', uiu_id='0111', role='STUDENT')
+        doctors = [User.objects.create_user(username=f'DOC{i}', uiu_id=f'DOC{i}', role='STAFF')
+                   for i in range(3)]
+        # Every slot is booked with three doctors, so pages split ties
+        Appointment.objects.bulk_create(
+            Appointment(patient=cls.student, doctor=doctor, date=datetime.date(2025, 1, 1 + day),
+                        time=time, reason='Checkup')
+            for day in range(2) for time in ('09:00 AM', '10:00 AM') for doctor in doctors)
+        cls.expected = list(Appointment.objects.order_by('-date', '-time', 'id')
+                            .values_list('id', flat=True))
+
+    def walk(self, queryset, read_id, view=None):
+        paginator, url, ids = AppointmentCursorPagination(), '/api/appointments/?page_size=5', []
+        while url:
+            request = Request(APIRequestFactory().get(url))
+            ids += [read_id(row) for row in paginator.paginate_queryset(queryset, request, view)]
+            url = paginator.get_next_link()
+        return ids
+
+    def test_pages_over_values_and_values_list(self):
+        queryset = Appointment.objects.all()
+        self.assertEqual(self.walk(queryset, lambda row: row.pk), self.expected)
+        self.assertEqual(self.walk(queryset.values('id', 'date', 'time'), lambda row: row['id']),
+                         self.expected)
+        view = mock.Mock(pagination_columns=('time', 'id', 'date'))
+        self.assertEqual(self.walk(queryset.values_list('time', 'id', 'date'), lambda row: row[1],
+                                   view), self.expected)
+
+    def test_forward_and_back_through_the_api(self):
+        client = APIClient()
+        client.force_authenticate(self.student)
+        pages, url = [], '/api/appointments/?page_size=5'
+        while url:
+            body = client.get(url).json()
+            pages.append(body)
+            url = body['next']
+        self.assertEqual([len(page['results']) for page in pages], [5, 5, 2])
+        self.assertEqual([row['id'] for page in pages for row in page['results']], self.expected)
+        self.assertIsNone(pages[0]['previous'])
+
+        # Back from the last page gives the same pages again
+        previous = pages[-1]['previous']
+        for page in reversed(pages[:-1]):
+            body = client.get(previous).json()
+            self.assertEqual(body['results'], page['results'])
+            previous = body['previous']
+        self.assertIsNone(previous)
+
+    def test_tampered_cursor_is_rejected(self):
+        client = APIClient()
+        client.force_authenticate(self.student)
+        forged = urlsafe_b64encode(b'{"p":["2025-01-01"]}').decode()
+        for cursor in ('not-base64!', forged, urlsafe_b64encode(b'{"p":["x","y",1]}').decode()):
+            response = client.get('/api/appointments/', {'cursor': cursor})
+            self.assertEqual(response.status_code, 400, cursor)
+            self.assertEqual(response.json(), {'cursor': 'Invalid cursor'})
+
+
+class BulkAppointmentStatusTests(TestCase):
+    """
+    Batch status changes follow the same permissions as single updates,
+    and every requested id gets its own result.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = User.objects.create_user(username='0111', uiu_id='0111', role='STUDENT')
+        cls.other = User.objects.create_user(username='0112', uiu_id='0112', role='STUDENT')
+        cls.doctor = User.objects.create_user(username='DOC1', uiu_id='DOC1', role='STAFF')
+        cls.colleague = User.objects.create_user(username='DOC2', uiu_id='DOC2', role='STAFF')
+        day = datetime.date(2030, 1, 6)
+
+        def book(patient, doctor, time, **fields):
+            return Appointment.objects.create(patient=patient, doctor=doctor, date=day,
+                                              time=time, reason='Checkup', **fields)
+        cls.own = book(cls.student, cls.doctor, '09:00 AM')
+        cls.confirmed = book(cls.other, cls.doctor, '10:00 AM', status='confirmed')
+        cls.claimed = book(cls.student, cls.colleague, '09:00 AM', claimed_by=cls.doctor)
+        cls.colleagues = book(cls.other, cls.colleague, '10:00 AM')
+
+    def bulk(self, user, ids, new_status='confirmed'):
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.post('/api/appointments/bulk-status/',
+                               {'ids': ids, 'status': new_status}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_partial_permission_and_unknown_ids(self):
+        result = self.bulk(self.doctor, [self.own.pk, self.confirmed.pk, self.claimed.pk,
+                                         self.colleagues.pk, 999999, self.own.pk])
+        self.assertEqual(result['updated'], 2)
+        self.assertEqual(result['results'], [
+            {'id': self.own.pk, 'result': 'updated'},
+            {'id': self.confirmed.pk, 'result': 'unchanged'},
+            {'id': self.claimed.pk, 'result': 'updated'},
+            {'id': self.colleagues.pk, 'result': 'forbidden'},
+            {'id': 999999, 'result': 'not_found'},
+        ])
+        self.assertEqual(
+            dict(Appointment.objects.values_list('pk', 'status')),
+            {self.own.pk: 'confirmed', self.confirmed.pk: 'confirmed',
+             self.claimed.pk: 'confirmed', self.colleagues.pk: 'pending'})
+
+    def test_students_only_change_their_own(self):
+        result = self.bulk(self.student, [self.own.pk, self.colleagues.pk], 'cancelled')
+        self.assertEqual([row['result'] for row in result['results']], ['updated', 'forbidden'])
+
+    def test_single_and_bulk_updates_agree(self):
+        client = APIClient()
+        client.force_authenticate(self.doctor)
+        for appointment, allowed in ((self.claimed, True), (self.colleagues, False)):
+            single = client.patch(f'/api/appointments/{appointment.pk}/status/',
+                                  {'status': 'completed'}, format='json')
+            self.assertEqual(single.status_code, 200 if allowed else 403)
+            [row] = self.bulk(self.doctor, [appointment.pk], 'cancelled')['results']
+            self.assertEqual(row['result'], 'updated' if allowed else 'forbidden')
+
+    def test_status_change_rolls_back_with_its_notification(self):
+        client = APIClient()
+        client.force_authenticate(self.doctor)
+        with mock.patch('api.signals.enqueue_many', side_effect=RuntimeError('queue down')):
+            with self.assertRaises(RuntimeError):
+                client.patch(f'/api/appointments/{self.own.pk}/status/',
+                             {'status': 'confirmed'}, format='json')
+        self.own.refresh_from_db()
+        self.assertEqual(self.own.status, 'pending')
+
+        client.force_authenticate(self.student)
+        response = client.post(f'/api/appointments/{self.own.pk}/cancel/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(Job.objects.filter(kind='email.appointment_status',
+                                           payload__appointment_id=self.own.pk).exists())
+
+
+class UserCacheTests(TestCase):
+    """
+    JWT requests resolve their user from the cache, and saving or deleting
+    the user drops the cached copy at once.
+    """
+
+    def setUp(self):
+        user_cache.clear()
+        self.user = User.objects.create_user(username='0111', uiu_id='0111', role='STUDENT')
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+
+    def user_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/appointments/')
+        return response, [query for query in queries
+                          if f'FROM "{User._meta.db_table}"' in query['sql']]
+
+    def test_repeat_requests_skip_the_user_table(self):
+        response, queries = self.user_queries()
+        self.assertEqual((response.status_code, len(queries)), (200, 1))
+        response, queries = self.user_queries()
+        self.assertEqual((response.status_code, queries), (200, []))
+
+    def test_save_and_delete_invalidate(self):
+        self.user_queries()
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.user_queries()[0].status_code, 401)
+
+        self.user.is_active = True
+        self.user.save()
+        self.user_queries()
+        self.user.delete()
+        self.assertEqual(self.user_queries()[0].status_code, 401)
+
+    def test_callers_get_their_own_copy(self):
+        user_cache.set(self.user.pk, self.user)
+        user_cache.get(self.user.pk).first_name = 'Changed'
+        self.assertEqual(user_cache.get(self.user.pk).first_name, '')
+
+    def test_entries_expire(self):
+        now = [0.0]
+        cache = TTLCache(max_size=2, ttl=10, timer=lambda: now[0])
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.set('c', 3)
+        self.assertIsNone(cache.get('a'))
+        now[0] = 10
+        self.assertIsNone(cache.get('b'))
+
+
+class AppointmentStatsTests(TestCase):
+    """
+    The daily rollup follows every way appointments change, and /api/stats/
+    reports it for each role.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = User.objects.create_user(username='0111', uiu_id='0111', role='STUDENT')
+        cls.other = User.objects.create_user(username='0112', uiu_id='0112', role='STUDENT')
+        cls.doctor = User.objects.create_user(username='DOC1', uiu_id='DOC1', role='STAFF',
+                                              first_name='Rina', last_name='Das')
+        cls.colleague = User.objects.create_user(username='DOC2', uiu_id='DOC2', role='STAFF')
+        cls.admin = User.objects.create_user(username='ADMIN1', uiu_id='ADMIN1', role='ADMIN')
+        cls.day = datetime.date(2030, 1, 6)
+
+    def book(self, patient, doctor, time, day=None, **fields):
+        return Appointment.objects.create(patient=patient, doctor=doctor, date=day or self.day,
+                                          time=time, reason='Checkup', **fields)
+
+    def rollup(self):
+        return set(AppointmentDailyStat.objects.filter(count__gt=0)
+                   .values_list('date', 'doctor_id', 'status', 'count'))
+
+    def stats(self, user, **params):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client.get('/api/stats/', {'from': '2030-01-01', 'to': '2030-01-31', **params})
+
+    def test_rollup_matches_a_rebuild(self):
+        first = self.book(self.student, self.doctor, '09:00 AM')
+        moved = self.book(self.other, self.doctor, '10:00 AM')
+        self.book(self.other, self.colleague, '09:00 AM', status='confirmed')
+        removed = self.book(self.student, self.colleague, '10:00 AM')
+
+        first.status = 'confirmed'
+        first.save()
+        moved.date = self.day + datetime.timedelta(days=1)
+        moved.save()
+        removed.delete()
+        client = APIClient()
+        client.force_authenticate(self.doctor)
+        client.post('/api/appointments/bulk-status/',
+                    {'ids': [first.pk, moved.pk], 'status': 'completed'}, format='json')
+
+        incremental = self.rollup()
+        call_command('rebuild_stats', stdout=StringIO())
+        self.assertEqual(incremental, self.rollup())
+        self.assertEqual(incremental, {
+            (self.day, self.doctor.pk, 'completed', 1),
+            (self.day + datetime.timedelta(days=1), self.doctor.pk, 'completed', 1),
+            (self.day, self.colleague.pk, 'confirmed', 1),
+        })
+
+    def test_deleting_people_with_appointments(self):
+        self.book(self.student, self.doctor, '09:00 AM')
+        self.book(self.other, self.doctor, '10:00 AM', status='confirmed')
+        self.book(self.student, self.colleague, '09:00 AM')
+        self.book(self.other, self.colleague, '10:00 AM')
+
+        self.doctor.delete()
+        self.student.delete()
+        # Deferred foreign keys are only checked at commit otherwise
+        connection.check_constraints()
+        self.assertEqual(set(AppointmentDailyStat.objects.values_list(
+            'date', 'doctor_id', 'status', 'count')), {(self.day, self.colleague.pk, 'pending', 1)})
+
+    def test_each_role_sees_its_own_counts(self):
+        self.book(self.student, self.doctor, '09:00 AM')
+        self.book(self.other, self.doctor, '10:00 AM', status='confirmed')
+        self.book(self.student, self.colleague, '09:00 AM', status='cancelled')
+        self.book(self.student, self.doctor, '09:00 AM', day=datetime.date(2030, 3, 1))
+
+        staff = self.stats(self.doctor).json()
+        self.assertEqual(staff['total'], 2)
+        self.assertEqual(staff['by_doctor'], [
+            {'doctor_id': 'DOC1', 'doctor_name': 'Rina Das', 'total': 2}])
+        self.assertEqual(staff['by_day'], [
+            {'date': '2030-01-06', 'total': 2, 'pending': 1, 'confirmed': 1,
+             'completed': 0, 'cancelled': 0}])
+
+        student = self.stats(self.student).json()
+        self.assertEqual(student['by_status'],
+                         {'pending': 1, 'confirmed': 0, 'completed': 0, 'cancelled': 1})
+        self.assertEqual(self.stats(self.admin).json()['total'], 3)
+
+    def test_bad_ranges(self):
+        self.assertEqual(self.stats(self.admin, to='2029-12-01').status_code, 400)
+        self.assertEqual(self.stats(self.admin, **{'from': '06/01/2030'}).status_code, 400)
+        self.assertEqual(self.stats(self.admin, to='2031-06-01').status_code, 400)
+
+
+class ExportTests(TestCase):
+    """
+    Exports stream the rows the list would show, in the serializers' shape,
+    as NDJSON or CSV.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = User.objects.create_user(username='0111', uiu_id='0111', role='STUDENT',
+                                               first_name='Ana', last_name='Rahman')
+        cls.other = User.objects.create_user(username='0112', uiu_id='0112', role='STUDENT')
+        cls.doctor = User.objects.create_user(username='DOC1', uiu_id='DOC1', role='STAFF')
+        cls.admin = User.objects.create_user(username='ADMIN1', uiu_id='ADMIN1', role='ADMIN')
+        day = datetime.date(2030, 1, 6)
+        cls.mine = Appointment.objects.create(patient=cls.student, doctor=cls.doctor, date=day,
+                                              time='09:00 AM', reason='Fever, "high"\nsince Monday')
+        Appointment.objects.create(patient=cls.other, doctor=cls.doctor, date=day,
+                                   time='10:00 AM', reason='Checkup')
+
+    def export(self, user, url, **params):
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.get(url, params)
+        if not response.streaming:
+            return response, response.content
+        return response, b''.join(response.streaming_content)
+
+    def test_appointments_as_ndjson(self):
+        response, body = self.export(self.student, '/api/appointments/export/')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="appointments.ndjson"')
+        rows = [json.loads(line) for line in body.decode().splitlines()]
+        client = APIClient()
+        client.force_authenticate(self.student)
+        self.assertEqual(rows, [client.get(f'/api/appointments/{self.mine.pk}/').json()])
+
+    def test_appointments_as_csv(self):
+        response, body = self.export(self.doctor, '/api/appointments/export/', format='csv')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        rows = list(csv.reader(StringIO(body.decode())))
+        self.assertEqual(tuple(rows[0]), APPOINTMENT_COLUMNS)
+        self.assertEqual(len(rows), 3)
+        mine = next(row for row in rows[1:] if row[0] == str(self.mine.pk))
+        self.assertEqual(mine[1:5], ['0111', 'Ana Rahman', 'DOC1', 'DOC1'])
+        self.assertEqual(mine[8], self.mine.reason)
+
+    def test_users_for_admins_only(self):
+        self.assertEqual(self.export(self.student, '/api/users/export/')[0].status_code, 403)
+        response, body = self.export(self.admin, '/api/users/export/', format='csv', role='STUDENT')
+        rows = list(csv.reader(StringIO(body.decode())))
+        self.assertEqual([row[1:3] for row in rows[1:]], [['0111', 'Ana Rahman'], ['0112', '0112']])
+
+
+class DatabaseRoutingTests(TestCase):
+    """
+    SQLite connections get the configured pragmas, and list and detail
+    reads go to the read-only alias when it points at its own database.
+    """
+    databases = {'default', 'readonly'}
+
+    def pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_pragmas(self):
+        self.assertEqual(self.pragma('journal_mode'), 'wal')
+        self.assertEqual(self.pragma('synchronous'), 1)
+        self.assertEqual(self.pragma('busy_timeout'), 5000)
+        self.assertEqual(self.pragma('foreign_keys'), 1)
+        self.assertEqual(self.pragma('temp_store'), 2)
+
+    def test_read_only_uri_refuses_writes(self):
+        # How the readonly alias opens the database file
+        path = connection.settings_dict['NAME']
+        reader = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+        try:
+            reader.execute('SELECT COUNT(*) FROM api_user').fetchone()
+            with self.assertRaises(sqlite3.OperationalError):
+                reader.execute('DELETE FROM api_user')
+        finally:
+            reader.close()
+
+    @mock.patch.object(ReadOnlyRouter, 'read_only_available', return_value=True)
+    def test_reads_inside_read_only(self, available):
+        self.assertEqual(Appointment.objects.all().db, 'default')
+        with read_only():
+            self.assertEqual(Appointment.objects.all().db, 'readonly')
+            self.assertEqual(ReadOnlyRouter().db_for_write(Appointment), 'default')
+        self.assertEqual(Appointment.objects.all().db, 'default')
+
+    @mock.patch.object(ReadOnlyRouter, 'read_only_available', return_value=True)
+    def test_list_views_read_from_the_alias(self, available):
+        user = User.objects.create_user(username='0111', uiu_id='0111', role='STUDENT')
+        client = APIClient()
+        client.force_authenticate(user)
+        aliases = []
+
+        def list_(view, request, *args, **kwargs):
+            aliases.append(view.get_queryset().db)
+            return Response([])
+
+        with mock.patch.object(AppointmentListView, 'list', list_):
+            self.assertEqual(client.get('/api/appointments/').status_code, 200)
+        self.assertEqual(aliases, ['readonly'])
+
+    @mock.patch.object(ReadOnlyRouter, 'read_only_available', return_value=True)
+    def test_exports_stream_from_the_alias(self, available):
+        user = User.objects.create_user(username='0111', uiu_id='0111', role='STUDENT')
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.get('/api/appointments/export/')
+        # The test database's mirror can't see this test's rows, but the
+        # query has to run there once the body is read
+        with CaptureQueriesContext(connections['readonly']) as queries:
+            b''.join(response.streaming_content)
+        self.assertTrue([query for query in queries if 'api_appointment' in query['sql']])
+
+    def test_test_mirror_stays_on_default(self):
+        with read_only():
+            self.assertEqual(Appointment.objects.all().db, 'default')
+
+
+class UserImportTests(TestCase):
+    """
+    Bulk imports create every valid row, report the rest by CSV line, and
+    leave users as sign-up would have created them.
+    """
+    csv = (
+        'uiu_id,name,email,password,phone\n'
+        '011221001,Ana Rahman,ana@example.edu,Str0ng!pass99,01700000000\n'
+        'DOC7,Rina Das,rina@example.edu,Str0ng!pass99,\n'
+        '011221001,Ana Again,ana2@example.edu,Str0ng!pass99,\n'
+        '0111,Taken,taken@example.edu,Str0ng!pass99,\n'
+        '011221002,Bad Email,not-an-email,Str0ng!pass99,\n'
+        '011221003,Weak Password,weak@example.edu,12345678,\n'
+        ',No Id,noid@example.edu,Str0ng!pass99,\n'
+    )
+
+    def setUp(self):
+        User.objects.create_user(username='0111', uiu_id='0111')
+
+    def run_import(self, **kwargs):
+        return import_users(read_csv(self.csv.encode()), workers=1, **kwargs)
+
+    def test_valid_rows_are_created(self):
+        result = self.run_import()
+        self.assertEqual((result.rows, result.created), (7, 2))
+        self.assertEqual([error.line for error in result.errors], [4, 5, 6, 7, 8])
+        self.assertIn('already registered', result.errors[0].message)
+        self.assertIn('email', result.errors[2].message)
+        ana = User.objects.get(uiu_id='011221001')
+        self.assertEqual((ana.username, ana.first_name, ana.last_name, ana.role, ana.phone),
+                         ('011221001', 'Ana', 'Rahman', 'STUDENT', '01700000000'))
+        self.assertTrue(ana.check_password('Str0ng!pass99'))
+        self.assertEqual(User.objects.get(uiu_id='DOC7').role, 'STAFF')
+
+    def test_dry_run_creates_nobody(self):
+        result = self.run_import(dry_run=True)
+        # Passwords aren't checked without hashing, so the weak one counts
+        self.assertEqual(result.created, 3)
+        self.assertEqual(User.objects.count(), 1)
+
+    def test_missing_columns(self):
+        with self.assertRaisesMessage(ValueError, 'missing columns: email, password'):
+            read_csv(b'uiu_id,name\n011221001,Ana\n')
+
+    def test_clash_after_validation_skips_only_that_row(self):
+        hash_passwords = provisioning.hash_passwords
+
+        def registered_meanwhile(items, workers=None):
+            User.objects.create_user(username='DOC7', uiu_id='DOC7')
+            return hash_passwords(items, workers)
+
+        with mock.patch.object(provisioning, 'hash_passwords', registered_meanwhile):
+            result = self.run_import()
+        self.assertEqual(result.created, 1)
+        self.assertEqual([error.line for error in result.errors], [3, 4, 5, 6, 7, 8])
+        self.assertTrue(User.objects.filter(uiu_id='011221001').exists())
+
+    def test_command(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as file:
+            file.write(self.csv)
+        self.addCleanup(Path(file.name).unlink)
+        out, err = StringIO(), StringIO()
+        call_command('import_users', file.name, '--workers', '1', stdout=out, stderr=err)
+        self.assertIn('Created 2 of 7 users, 5 rows rejected', out.getvalue())
+        self.assertIn('line 4 (011221001)', err.getvalue())
+
+
+class SeedCampusTests(TestCase):
+    """
+    The synthetic campus is reproducible from its seed and consistent with
+    what the app itself would have written.
+    """
+
+    @mock.patch('django.utils.timezone.now',
+                return_value=datetime.datetime(2030, 1, 6, 8, tzinfo=datetime.timezone.utc))
+    def test_same_seed_same_rows(self, now):
+        def rows(seed):
+            return list(seeding.appointment_rows(random.Random(seed), [1, 2, 3], [10, 11], 200,
+                                                 7, datetime.date(2030, 1, 6)))
+        self.assertEqual(rows(1), rows(1))
+        self.assertNotEqual(rows(1), rows(2))
+
+    def test_seeded_campus(self):
+        out = StringIO()
+        call_command('seed_campus', students=40, staff=4, appointments=300, stdout=out)
+        self.assertIn('Seeded 40 students, 3 doctors, 1 other staff, 3 admins and 300 appointments',
+                      out.getvalue())
+
+        self.assertEqual(Appointment.objects.count(), 300)
+        self.assertFalse(Appointment.objects.values('doctor', 'date', 'time')
+                         .annotate(n=Count('id')).filter(n__gt=1).exists())
+        days = set(Appointment.objects.values_list('date', flat=True).distinct().order_by())
+        self.assertTrue(all(day.weekday() in seeding.WORKDAYS for day in days))
+        rollup = set(AppointmentDailyStat.objects.values_list('date', 'doctor_id', 'status', 'count'))
+        call_command('rebuild_stats', stdout=StringIO())
+        self.assertEqual(rollup, set(AppointmentDailyStat.objects.values_list(
+            'date', 'doctor_id', 'status', 'count')))
+        self.assertTrue(User.objects.get(uiu_id='DOC001').check_password(seeding.DEFAULT_PASSWORD))
+
+        # A second run would clash with the people already there
+        with self.assertRaisesMessage(CommandError, 'seed an empty database'):
+            call_command('seed_campus', students=40, staff=4, appointments=10, stdout=StringIO())
+
+
+class AppointmentSyncTests(TestCase):
+    """
+    Delta sync hands each change and deletion over once, and answers bad
+    watermarks with 400 and stale ones with 410 rather than failing.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = User.objects.create_user(username='0111', uiu_id='0111', role='STUDENT')
+        cls.other = User.objects.create_user(username='0112', uiu_id='0112', role='STUDENT')
+        cls.doctor = User.objects.create_user(username='DOC1', uiu_id='DOC1', role='STAFF')
+        cls.appointments = [
+            Appointment.objects.create(patient=patient, doctor=cls.doctor,
+                                       date=datetime.date(2025, 1, 1 + i), time='09:00 AM',
+                                       reason='Checkup')
+            for i, patient in enumerate([cls.student, cls.student, cls.other])]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.student)
+
+    def changes(self, since=None, **params):
+        return self.client.get('/api/appointments/changes/',
+                               {'since': since, **params} if since else params)
+
+    @mock.patch.object(sync, 'SETTLE_SECONDS', 0)
+    def test_round_trip(self):
+        first = self.changes(limit=1).json()
+        self.assertEqual([row['id'] for row in first['changed']], [self.appointments[0].pk])
+        self.assertTrue(first['has_more'])
+        second = self.changes(first['watermark'], limit=1).json()
+        self.assertEqual([row['id'] for row in second['changed']], [self.appointments[1].pk])
+        self.assertFalse(second['has_more'])
+
+        edited, removed = self.appointments[0], self.appointments[1].pk
+        edited.status = 'confirmed'
+        edited.save()
+        Appointment.objects.get(pk=removed).delete()
+        self.appointments[2].delete()  # Another patient's, not to be reported
+
+        third = self.changes(second['watermark']).json()
+        self.assertEqual([(row['id'], row['status']) for row in third['changed']],
+                         [(edited.pk, 'confirmed')])
+        self.assertEqual(third['deleted'], [removed])
+        fourth = self.changes(third['watermark']).json()
+        self.assertEqual((fourth['changed'], fourth['deleted']), ([], []))
+
+    def test_malformed_watermarks(self):
+        for token in ('not a watermark', urlsafe_b64encode(b'[1, 2]').decode(),
+                      urlsafe_b64encode(b'{"c": ["yesterday", 1], "d": null}').decode()):
+            response = self.changes(token)
+            self.assertEqual(response.status_code, 400, token)
+            self.assertEqual(response.json(), {'error': 'Invalid watermark'})
+
+    def test_naive_watermark(self):
+        naive = json.dumps({'c': ['2030-01-01T00:00:00', 1], 'd': None}).encode()
+        response = self.changes(urlsafe_b64encode(naive).decode())
+        self.assertEqual(response.status_code, 400)
+
+    def test_expired_watermark(self):
+        stale = timezone.now() - datetime.timedelta(days=sync.TOMBSTONE_RETENTION_DAYS + 1)
+        for watermark in (sync.encode_watermark((stale, 1), None),
+                          sync.encode_watermark((timezone.now(), 1), (stale, 1))):
+            self.assertEqual(self.changes(watermark).status_code, 410)
+
+
+class AppointmentEventTests(TestCase):
+    """
+    Status changes published to the broker reach the user's open event
+    stream; the stream is refused outside ASGI.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = User.objects.create_user(username='0111', uiu_id='0111', role='STUDENT')
+        cls.token = str(RefreshToken.for_user(cls.student).access_token)
+
+    async def test_published_event_reaches_the_stream(self):
+        response = await self.async_client.get('/api/events/', {'token': self.token})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        frames = aiter(response.streaming_content)
+        try:
+            self.assertEqual(await anext(frames), b'retry: 5000\n\n')
+            event = {'type': 'appointment.status', 'id': 7, 'status': 'confirmed'}
+            broker.publish([self.student.pk + 1], {**event, 'id': 8})
+            broker.publish([self.student.pk], event)
+            frame = await asyncio.wait_for(anext(frames), 5)
+            self.assertEqual(frame, format_sse(event).encode())
+        finally:
+            await frames.aclose()
+
+    async def test_stream_needs_a_token(self):
+        response = await self.async_client.get('/api/events/')
+        self.assertEqual(response.status_code, 401)
+
+    def test_stream_is_refused_under_wsgi(self):
+        response = self.client.get('/api/events/', {'token': self.token})
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(response.streaming)
+
+
+class MetricsAccessTests(TestCase):
+    """
+    /api/metrics/ is for admins and scrapers holding the metrics token; the
+    client address alone only counts when an allow-list is configured.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = User.objects.create_user(username='0111', uiu_id='0111', role='STUDENT')
+        cls.admin = User.objects.create_user(username='ADMIN1', uiu_id='ADMIN1', role='ADMIN')
+
+    def get(self, user=None, **extra):
+        client = APIClient()
+        if user is not None:
+            client.force_authenticate(user)
+        return client.get('/api/metrics/', **extra)
+
+    def test_unauthenticated_local_request_is_rejected(self):
+        response = self.get(REMOTE_ADDR='127.0.0.1')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(self.get(self.student).status_code, 403)
+        self.assertEqual(self.get(self.admin).status_code, 200)
+
+    @override_settings(METRICS={'TOKEN': 'scrape-me', 'ALLOWED_IPS': []})
+    def test_scraper_token(self):
+        response = self.get(HTTP_AUTHORIZATION='Bearer scrape-me')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        self.assertEqual(self.get(HTTP_AUTHORIZATION='Bearer scrape-you').status_code, 401)
+
+    @override_settings(METRICS={'ALLOWED_IPS': ['10.0.0.9']})
+    def test_allow_list_is_opt_in(self):
+        self.assertEqual(self.get(REMOTE_ADDR='10.0.0.9').status_code, 200)
+        self.assertEqual(self.get(REMOTE_ADDR='127.0.0.1').status_code, 401)
+
+
+class TokenBlacklistTests(TestCase):
+    """
+    Revoked refresh tokens are refused, a Bloom filter miss skips the
+    blacklist query, and a false positive falls back to the database.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = User.objects.create_user(username='0111', uiu_id='0111', role='STUDENT')
+
+    def setUp(self):
+        blacklist_filter.reset()
+        self.addCleanup(blacklist_filter.reset)
+        self.client = APIClient()
+
+    def refresh(self, token):
+        return self.client.post('/api/token/refresh/', {'refresh': str(token)}, format='json')
+
+    def test_revoked_tokens_are_refused(self):
+        rotated, revoked = RefreshToken.for_user(self.student), RefreshToken.for_user(self.student)
+        blacklist_filter.warm()
+        self.assertEqual(self.refresh(rotated).status_code, 200)
+        # Rotation blacklisted it, and this process's filter knows at once
+        self.assertEqual(self.refresh(rotated).status_code, 401)
+
+        # Blacklisted by another worker: picked up by the next sync
+        BlacklistedToken.objects.create(token=OutstandingToken.objects.get(jti=revoked['jti']))
+        blacklist_filter.synced_at = 0.0
+        self.assertEqual(self.refresh(revoked).status_code, 401)
+
+    def test_filter_miss_skips_the_database(self):
+        token = RefreshToken.for_user(self.student)
+        blacklist_filter.warm()
+        with mock.patch.object(BaseRefreshToken, 'check_blacklist') as check:
+            self.assertEqual(self.refresh(token).status_code, 200)
+        check.assert_not_called()
+
+    def test_false_positive_falls_back_to_the_database(self):
+        token = RefreshToken.for_user(self.student)
+        blacklist_filter.warm()
+        with mock.patch.object(blacklist_filter.bloom, 'might_contain', return_value=True), \
+                mock.patch.object(BaseRefreshToken, 'check_blacklist', autospec=True,
+                                  side_effect=BaseRefreshToken.check_blacklist) as check:
+            self.assertEqual(self.refresh(token).status_code, 200)
+        check.assert_called_once()
+
+    def test_prune_expired_tokens(self):
+        tokens = [RefreshToken.for_user(self.student) for _ in range(3)]
+        for token in tokens[:2]:
+            token.blacklist()
+        OutstandingToken.objects.filter(jti__in=[tokens[0]['jti'], tokens[2]['jti']]).update(
+            expires_at=timezone.now() - datetime.timedelta(seconds=1))
+        call_command('prune_tokens', batch_size=1, stdout=StringIO())
+        self.assertEqual(list(OutstandingToken.objects.values_list('jti', flat=True)),
+                         [tokens[1]['jti']])
+        self.assertEqual(BlacklistedToken.objects.count(), 1)
+
+    def test_unbuilt_filter_defers_to_the_database(self):
+        with mock.patch.object(blacklist_filter, 'warm_in_background') as warm:
+            self.assertTrue(blacklist_filter.might_contain('any-jti'))
+        warm.assert_called_once_with()
+
+
+class AdminChangelistTests(TestCase):
+    """
+    The appointment and user changelists load users in the same query,
+    never count a whole table and cache the date hierarchy.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            username='ADMIN1', uiu_id='ADMIN1', role='ADMIN', password='x')
+        students = User.objects.bulk_create(
+            User(username=f'0111{i}', uiu_id=f'0111{i}', role='STUDENT') for i in range(20))
+        doctor = User.objects.create_user(username='DOC1', uiu_id='DOC1', role='STAFF')
+        Appointment.objects.bulk_create(
+            Appointment(patient=student, doctor=doctor, date=datetime.date(2025, 1, 1 + i),
+                        time='09:00 AM', reason='Checkup')
+            for i, student in enumerate(students))
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.admin)
+
+    def changelist_queries(self, url, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return [query['sql'] for query in queries]
+
+    def assertNoFullCount(self, queries):
+        for sql in queries:
+            if 'COUNT(' in sql:
+                self.assertIn('LIMIT', sql, f'Unbounded count: {sql}')
+
+    def test_appointment_changelist(self):
+        queries = self.changelist_queries('/admin/api/appointment/')
+        self.assertNoFullCount(queries)
+        self.assertEqual(len([sql for sql in queries if 'FROM "api_user"' in sql]), 1)
+        # The date hierarchy comes from the cache the second time
+        again = self.changelist_queries('/admin/api/appointment/')
+        self.assertLess(len(again), len(queries))
+
+    def test_filtered_appointment_changelist(self):
+        self.assertNoFullCount(self.changelist_queries(
+            '/admin/api/appointment/', status='pending', date__year='2025'))
+
+    def test_user_changelist_search_keeps_partial_matches(self):
+        # '01111' is a user of its own and part of '011110' to '011119'
+        response = self.client.get('/admin/api/user/', {'q': '01111'})
+        self.assertCountEqual([user.uiu_id for user in response.context['cl'].result_list],
+                              ['01111', *(f'01111{i}' for i in range(10))])
+        self.assertNoFullCount(self.changelist_queries('/admin/api/user/', q='01111'))
+
+    def test_row_estimate_ignores_partial_indexes(self):
+        patient, doctor = User.objects.filter(role='STUDENT')[:2]
+        Appointment.objects.bulk_create(
+            Appointment(patient=patient, doctor=doctor, date=datetime.date(2025, 3, 1),
+                        time=f'{i}', reason='Checkup', emergency=i % 50 == 0)
+            for i in range(480))
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        # appt_emergency_idx holds only the ten emergencies
+        self.assertEqual(estimated_row_count(Appointment.objects.all()), 500)
+        response = self.client.get('/admin/api/appointment/')
+        self.assertEqual(response.context['cl'].result_count, 500)
+
+
+class MedicalRecordUploadTests(TestCase):
+    """
+    Uploads resume from where they stopped, identical files are stored
+    once, finishing can be retried after a failure, and downloads honour
+    Range requests.
+    """
+    content = b'0123456789abcdef'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = User.objects.create_user(username='0111', uiu_id='0111', role='STUDENT')
+
+    def setUp(self):
+        storage = tempfile.TemporaryDirectory()
+        self.addCleanup(storage.cleanup)
+        patcher = mock.patch.object(records, 'STORAGE_ROOT', Path(storage.name))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = APIClient()
+        self.client.force_authenticate(self.student)
+
+    def start(self, content=None):
+        response = self.client.post('/api/records/uploads/', {
+            'title': 'Blood test', 'file_name': 'blood.pdf', 'content_type': 'application/pdf',
+            'size': len(content or self.content)}, format='json')
+        self.assertEqual(response.status_code, 201)
+        return f"/api/records/uploads/{response.json()['id']}/"
+
+    def put(self, url, start, end, content=None):
+        content = content or self.content
+        return self.client.put(url, content[start:end + 1], content_type='application/octet-stream',
+                               HTTP_CONTENT_RANGE=f'bytes {start}-{end}/{len(content)}')
+
+    def upload(self, content=None):
+        url = self.start(content)
+        response = self.put(url, 0, len(content or self.content) - 1, content)
+        self.assertEqual(response.status_code, 201)
+        return response.json()
+
+    def test_resume_after_offset(self):
+        url = self.start()
+        self.assertEqual(self.put(url, 0, 5).json()['offset'], 6)
+        self.assertEqual(self.client.get(url).json()['offset'], 6)
+        # A chunk that doesn't start where the upload stopped is refused
+        response = self.put(url, 0, 9)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['offset'], 6)
+        response = self.put(url, 6, 15)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['sha256'], hashlib.sha256(self.content).hexdigest())
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_identical_content_is_stored_once(self):
+        first, second = self.upload(), self.upload()
+        self.assertNotEqual(first['id'], second['id'])
+        self.assertEqual(RecordBlob.objects.count(), 1)
+        self.assertEqual([path.name for path in records.STORAGE_ROOT.glob('blobs/*/*')],
+                         [first['sha256']])
+        self.assertFalse(list(records.STORAGE_ROOT.glob('uploads/*')))
+
+    def test_blob_created_by_a_concurrent_finish(self):
+        existing = RecordBlob.objects.create(sha256='a' * 64, size=3)
+        with mock.patch.object(RecordBlob.objects, 'get_or_create', side_effect=IntegrityError):
+            self.assertEqual(records._get_blob('a' * 64, 3), existing)
+
+    def test_finish_retried_after_failure(self):
+        url = self.start()
+        with mock.patch.object(records, '_get_blob', side_effect=RuntimeError('database went away')):
+            with self.assertRaises(RuntimeError):
+                self.put(url, 0, 15)
+        # The part file was already moved into blob storage
+        self.assertFalse(list(records.STORAGE_ROOT.glob('uploads/*')))
+        response = self.client.put(url, b'', content_type='application/octet-stream')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['sha256'], hashlib.sha256(self.content).hexdigest())
+        self.assertEqual(MedicalRecord.objects.count(), 1)
+
+    def test_ranged_download(self):
+        record = self.upload()
+        url = f"/api/records/{record['id']}/download/"
+
+        response = self.client.get(url, HTTP_RANGE='bytes=2-5')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), b'2345')
+        self.assertEqual(response['Content-Range'], 'bytes 2-5/16')
+
+        response = self.client.get(url, HTTP_RANGE='bytes=-3')
+        self.assertEqual(b''.join(response.streaming_content), b'def')
+
+        response = self.client.get(url, HTTP_RANGE='bytes=16-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */16')
+
+        # A stale If-Range gets the whole file
+        response = self.client.get(url, HTTP_RANGE='bytes=2-5', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+
+class RecordUploadRaceTests(TransactionTestCase):
+    """
+    Retries racing to finish one upload create a single record; the others
+    are told it was already finished.
+    """
+
+    def setUp(self):
+        storage = tempfile.TemporaryDirectory()
+        self.addCleanup(storage.cleanup)
+        patcher = mock.patch.object(records, 'STORAGE_ROOT', Path(storage.name))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def received_upload(self, student, content):
+        upload = RecordUpload.objects.create(
+            patient=student, uploaded_by=student, title='Blood test', file_name='blood.pdf',
+            content_type='application/pdf', size=len(content), received=len(content))
+        part = records.part_path(upload)
+        part.parent.mkdir(parents=True, exist_ok=True)
+        part.write_bytes(content)
+        return upload, part
+
+    def test_finisher_loaded_before_the_hash_was_noted(self):
+        student = User.objects.create_user(username='0111', uiu_id='0111', role='STUDENT')
+        upload, part = self.received_upload(student, b'0123456789abcdef')
+        stale = RecordUpload.objects.get(pk=upload.pk)
+        records.finish_upload(upload)
+        # Its part file is gone by the time it hashes
+        with self.assertRaises(records.UploadConflict):
+            records.finish_upload(stale)
+        self.assertEqual(MedicalRecord.objects.count(), 1)
+
+    def test_parallel_finishes(self):
+        student = User.objects.create_user(username='0111', uiu_id='0111', role='STUDENT')
+        content = b'0123456789abcdef'
+        upload, part = self.received_upload(student, content)
+
+        # Every finisher sees the part file before any of them moves it
+        replace, moving = os.replace, threading.Barrier(4)
+
+        def replace_together(source, target):
+            moving.wait(timeout=5)
+            replace(source, target)
+
+        barrier = threading.Barrier(4)
+        statuses = []
+
+        def finish():
+            client = APIClient()
+            client.force_authenticate(student)
+            try:
+                barrier.wait()
+                statuses.append(client.put(f'/api/records/uploads/{upload.pk}/', b'',
+                                           content_type='application/octet-stream').status_code)
+            finally:
+                connections.close_all()
+
+        with mock.patch.object(records.os, 'replace', replace_together):
+            threads = [threading.Thread(target=finish) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(sorted(statuses), [201, 409, 409, 409])
+        self.assertEqual(MedicalRecord.objects.count(), 1)
+        self.assertEqual(RecordBlob.objects.count(), 1)
+        self.assertFalse(RecordUpload.objects.exists())
+        self.assertFalse(part.exists())
+        self.assertEqual(records.blob_path(hashlib.sha256(content).hexdigest()).read_bytes(), content)
+
+
+class OrderStockContentionTests(TransactionTestCase):
+    """
+    Orders racing for the last units of a medicine must never oversell:
+    exactly as many succeed as there are units and the rest are refused.
+    """
+
+    def test_parallel_orders_for_last_units(self):
+        today = timezone.localdate()
+        medicine = Medicine.objects.create(name='Paracetamol', unit_price=Decimal('2.50'))
+        StockBatch.objects.create(medicine=medicine, batch_number='A', quantity=3,
+                                  expiry_date=today + datetime.timedelta(days=30))
+        StockBatch.objects.create(medicine=medicine, batch_number='B', quantity=2,
+                                  expiry_date=today + datetime.timedelta(days=60))
+        StockBatch.objects.create(medicine=medicine, batch_number='EXPIRED', quantity=50,
+                                  expiry_date=today)
+        patients = [User.objects.create_user(username=f'0112{i:02d}', uiu_id=f'0112{i:02d}')
+                    for i in range(12)]
+
+        barrier = threading.Barrier(len(patients))
+        outcomes = []
+
+        def order(patient):
+            try:
+                barrier.wait()
+                place_order(patient, {medicine.pk: 1})
+                outcomes.append('placed')
+            except InsufficientStock:
+                outcomes.append('refused')
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=order, args=(patient,)) for patient in patients]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(outcomes.count('placed'), 5)
+        self.assertEqual(outcomes.count('refused'), 7)
+        self.assertEqual(
+            dict(StockBatch.objects.values_list('batch_number', 'quantity')),
+            {'A': 0, 'B': 0, 'EXPIRED': 50})
+        self.assertEqual(OrderItem.objects.aggregate(total=Sum('quantity'))['total'], 5)
+        self.assertEqual(MedicineDailySales.objects.get(medicine=medicine).quantity, 5)
+
+
+@override_settings(RATE_LIMITS={})
+class BookingTests(TransactionTestCase):
+    """
+    Of several patients racing for one slot exactly one gets it, and slots
+    that have already started can be neither listed nor booked.
+    """
+
+    def setUp(self):
+        self.doctor = User.objects.create_user(username='DOC1', uiu_id='DOC1', role='STAFF')
+        self.students = [User.objects.create_user(username=f'0111{i}', uiu_id=f'0111{i}')
+                         for i in range(4)]
+
+    def book(self, student, date, time='09:00 AM'):
+        client = APIClient()
+        client.force_authenticate(student)
+        try:
+            return client.post('/api/appointments/book/', {
+                'doctor_id': 'DOC1', 'date': date.isoformat(), 'time': time, 'reason': 'Fever',
+            }, format='json')
+        finally:
+            connections.close_all()
+
+    def test_racing_bookings_for_one_slot(self):
+        day = timezone.localdate() + datetime.timedelta(days=7)
+        barrier = threading.Barrier(len(self.students))
+        responses = []
+
+        def book(student):
+            barrier.wait()
+            responses.append(self.book(student, day))
+
+        threads = [threading.Thread(target=book, args=(student,)) for student in self.students]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        codes = sorted(response.status_code for response in responses)
+        self.assertEqual(codes, [201, 400, 400, 400])
+        for response in responses:
+            if response.status_code == 400:
+                self.assertEqual(response.json(), {'time': ['This slot has already been booked.']})
+        self.assertEqual(Appointment.objects.filter(doctor=self.doctor, date=day).count(), 1)
+
+    def test_past_slots_are_neither_listed_nor_bookable(self):
+        now = timezone.localtime()
+        yesterday = now.date() - datetime.timedelta(days=1)
+        response = self.book(self.students[0], yesterday)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('date', response.json())
+
+        for weekday in range(7):
+            DoctorSchedule.objects.create(doctor=self.doctor, weekday=weekday,
+                                          start_time='00:00', end_time='23:59', slot_minutes=60)
+        client = APIClient()
+        client.force_authenticate(self.students[0])
+        slots = client.get('/api/doctors/DOC1/availability/', {
+            'from': yesterday.isoformat(), 'to': now.date().isoformat()}).json()['slots']
+        self.assertTrue(all(slot['date'] == now.date().isoformat() for slot in slots))
+        if now.hour:
+            # Today's midnight slot has started: hidden and refused alike
+            self.assertNotIn('00:00', [slot['start'] for slot in slots])
+            self.assertEqual(self.book(self.students[0], now.date(), '00:00').status_code, 400)
+
+
+class TriageClaimTests(TransactionTestCase):
+    """
+    Staff claiming from the triage queue at the same time each get a
+    different case, and a case taken mid-claim is never handed out twice.
+    """
+
+    def setUp(self):
+        self.staff = [User.objects.create_user(username=f'DOC{i}', uiu_id=f'DOC{i}', role='STAFF')
+                      for i in range(6)]
+        patient = User.objects.create_user(username='0111', uiu_id='0111')
+        today = timezone.localdate()
+        self.cases = [
+            Appointment.objects.create(patient=patient, doctor=self.staff[0], date=today,
+                                       time=f'{9 + i}:00', reason='Walk-in', emergency=i == 3)
+            for i in range(4)]
+
+    def test_concurrent_claims_get_different_cases(self):
+        barrier = threading.Barrier(len(self.staff))
+        claims = {}
+
+        def claim(user):
+            try:
+                barrier.wait()
+                appointment = claim_next(user)
+                claims[user.pk] = appointment.pk if appointment else None
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=claim, args=(user,)) for user in self.staff]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        claimed = [pk for pk in claims.values() if pk is not None]
+        self.assertEqual(len(claims), 6)
+        self.assertCountEqual(claimed, [case.pk for case in self.cases])
+        self.assertEqual(
+            dict(Appointment.objects.values_list('pk', 'claimed_by')),
+            {pk: user_pk for user_pk, pk in claims.items() if pk is not None})
+        self.assertFalse(waiting().exists())
+
+    def test_case_taken_mid_claim_is_skipped(self):
+        first, second = self.staff[:2]
+        update = QuerySet.update
+
+        def racing_update(queryset, **kwargs):
+            # Someone else claims the head of the queue between claim_next
+            # picking it and its UPDATE
+            if kwargs.get('claimed_by') == first and not racing_update.raced:
+                racing_update.raced = True
+                update(Appointment.objects.filter(pk=waiting().first().pk),
+                       claimed_by=second, claimed_at=timezone.now())
+            return update(queryset, **kwargs)
+        racing_update.raced = False
+
+        emergency = self.cases[3]
+        with mock.patch.object(QuerySet, 'update', racing_update):
+            claimed = claim_next(first)
+        emergency.refresh_from_db()
+        self.assertEqual(emergency.claimed_by, second)
+        self.assertEqual(claimed.pk, self.cases[0].pk)
+        self.assertEqual(claimed.claimed_by, first)
+
+
+class LastLoginRecorderTests(TransactionTestCase):
+    """
+    Buffered last_login timestamps reach the database within the flush
+    interval even when no further sign-in arrives.
+    """
+
+    def test_quiet_period_is_flushed_by_the_timer(self):
+        user = User.objects.create_user(username='0113', uiu_id='0113')
+        recorder = LastLoginRecorder(interval=0.05)
+        recorder.record(user)
+        deadline = time.monotonic() + 5
+        while User.objects.get(pk=user.pk).last_login is None and time.monotonic() < deadline:
+            time.sleep(0.02)
+        self.assertEqual(User.objects.get(pk=user.pk).last_login, user.last_login)
+        self.assertIsNone(recorder._timer)
+
+    def test_full_buffer_is_flushed_at_once(self):
+        users = [User.objects.create_user(username=f'0114{i}', uiu_id=f'0114{i}') for i in range(2)]
+        recorder = LastLoginRecorder(interval=60, max_pending=2)
+        recorder.record(users[0])
+        self.assertIsNotNone(recorder._timer)
+        recorder.record(users[1])
+        self.assertIsNone(recorder._timer)
+        self.assertEqual(User.objects.filter(last_login__isnull=False).count(), 2)
+
+
+class IdempotencyKeyTests(TransactionTestCase):
+    """
+    Retried bookings and registrations with the same Idempotency-Key get
+    the first response back instead of running again.
+    """
+
+    def setUp(self):
+        self.student = User.objects.create_user(username='0111', uiu_id='0111', role='STUDENT')
+        User.objects.create_user(username='DOC1', uiu_id='DOC1', role='STAFF')
+        self.booking = {'doctor_id': 'DOC1', 'date': '2030-01-06', 'time': '09:00 AM',
+                        'reason': 'Fever'}
+
+    def book(self, data, key='retry-1'):
+        client = APIClient()
+        client.force_authenticate(self.student)
+        try:
+            return client.post('/api/appointments/book/', data, format='json',
+                               HTTP_IDEMPOTENCY_KEY=key)
+        finally:
+            connections.close_all()
+
+    def test_retry_replays_the_response(self):
+        first = self.book(self.booking)
+        with CaptureQueriesContext(connection) as queries:
+            retry = self.book(self.booking)
+        self.assertEqual((first.status_code, retry.status_code), (201, 201))
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertFalse([query for query in queries if 'api_appointment' in query['sql']])
+        self.assertEqual(Appointment.objects.count(), 1)
+
+    def test_key_reused_for_a_different_request(self):
+        self.book(self.booking)
+        response = self.book({**self.booking, 'time': '10:00 AM'})
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Appointment.objects.count(), 1)
+
+    def test_client_error_is_replayed(self):
+        self.assertEqual(self.book({**self.booking, 'time': 'noon'}).status_code, 400)
+        retry = self.book({**self.booking, 'time': 'noon'})
+        self.assertEqual(retry.status_code, 400)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertFalse(IdempotencyKey.objects.filter(status_code__isnull=True).exists())
+        self.assertEqual(self.book(self.booking, key='retry-2').status_code, 201)
+
+    def test_server_error_frees_the_key(self):
+        unavailable = Response({'error': 'Try again'}, status=503)
+        with mock.patch.object(BookAppointmentView, 'create', return_value=unavailable):
+            self.assertEqual(self.book(self.booking).status_code, 503)
+        self.assertFalse(IdempotencyKey.objects.exists())
+        retry = self.book(self.booking)
+        self.assertEqual(retry.status_code, 201)
+        self.assertFalse(retry.has_header('Idempotent-Replayed'))
+
+    def test_exception_frees_the_key(self):
+        with mock.patch.object(BookAppointmentView, 'create', side_effect=RuntimeError('boom')):
+            with self.assertRaises(RuntimeError):
+                self.book(self.booking)
+        self.assertFalse(IdempotencyKey.objects.exists())
+        self.assertEqual(self.book(self.booking).status_code, 201)
+        self.assertEqual(Appointment.objects.count(), 1)
+
+    def test_concurrent_duplicates_wait_for_the_first(self):
+        create = BookAppointmentView.create
+
+        def slow_create(view, request, *args, **kwargs):
+            time.sleep(0.3)
+            return create(view, request, *args, **kwargs)
+
+        barrier = threading.Barrier(3)
+        responses = []
+
+        def book():
+            barrier.wait()
+            responses.append(self.book(self.booking))
+
+        with mock.patch.object(BookAppointmentView, 'create', slow_create):
+            threads = [threading.Thread(target=book) for _ in range(3)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual([response.status_code for response in responses], [201] * 3)
+        self.assertEqual(len({response.json()['id'] for response in responses}), 1)
+        self.assertEqual(sum(response.has_header('Idempotent-Replayed') for response in responses), 2)
+        self.assertEqual(Appointment.objects.count(), 1)
+
+    def test_registration_retry(self):
+        data = {'uiu_id': '011221234', 'name': 'Ana Rahman', 'email': 'ana@example.edu',
+                'password': 'Str0ng!pass99', 'confirmPassword': 'Str0ng!pass99'}
+        client = APIClient()
+        first = client.post('/api/register/', data, format='json', HTTP_IDEMPOTENCY_KEY='signup')
+        retry = client.post('/api/register/', data, format='json', HTTP_IDEMPOTENCY_KEY='signup')
+        self.assertEqual((first.status_code, retry.status_code), (201, 201))
+        self.assertEqual(Job.objects.filter(kind='email.verify').count(), 1)
+
+        # The tokens aren't kept with the key; the replay gets its own pair
+        stored = IdempotencyKey.objects.get().response
+        self.assertEqual(stored, {key: value for key, value in first.json().items() if key != 'tokens'})
+        self.assertEqual({**retry.json(), 'tokens': None}, {**first.json(), 'tokens': None})
+        self.assertNotEqual(retry.json()['tokens']['refresh'], first.json()['tokens']['refresh'])
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {retry.json()['tokens']['access']}")
+        self.assertEqual(client.get('/api/appointments/').status_code, 200)
+
+
+class RateLimitTests(TestCase):
+    """
+    Sign-in, sign-up, booking and mail requests are limited per client IP
+    and per account, and throttled clients are told when to come back.
+    """
+
+    def setUp(self):
+        throttling.store.clear()
+        # Other tests sign up and book from the same address
+        self.addCleanup(throttling.store.clear)
+
+    def test_login_budget_per_account_across_addresses(self):
+        client = APIClient()
+        # No password, so nothing is hashed; the attempt still counts
+        for i in range(10):
+            response = client.post('/api/login/', {'uiuId': '0111'}, format='json',
+                                   REMOTE_ADDR=f'10.0.0.{i}')
+            self.assertEqual(response.status_code, 400)
+        response = client.post('/api/login/', {'uiuId': ' 0111 '}, format='json',
+                               REMOTE_ADDR='10.0.1.1')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '6')
+        response = client.post('/api/login/', {'uiuId': '0112'}, format='json',
+                               REMOTE_ADDR='10.0.1.1')
+        self.assertEqual(response.status_code, 400)
+
+    def test_register_budget_per_address(self):
+        client = APIClient()
+        for i in range(10):
+            response = client.post('/api/register/', {'uiu_id': f'01122{i}'}, format='json')
+            self.assertEqual(response.status_code, 400)
+        response = client.post('/api/register/', {'uiu_id': '011229'}, format='json')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '360')
+        response = client.post('/api/register/', {'uiu_id': '011229'}, format='json',
+                               REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(response.status_code, 400)
+
+    def test_mail_budget_per_mailbox_across_views(self):
+        client = APIClient()
+        for i, url in enumerate(('/api/password-reset/', '/api/verify-email/resend/',
+                                 '/api/password-reset/')):
+            response = client.post(url, {'email': 'ana@example.edu'}, format='json',
+                                   REMOTE_ADDR=f'10.0.0.{i}')
+            self.assertEqual(response.status_code, 200)
+        response = client.post('/api/verify-email/resend/', {'email': 'ANA@example.edu'},
+                               format='json', REMOTE_ADDR='10.0.1.1')
+        self.assertEqual(response.status_code, 429)
+        response = client.post('/api/password-reset/', {'email': 'rina@example.edu'},
+                               format='json', REMOTE_ADDR='10.0.1.1')
+        self.assertEqual(response.status_code, 200)
+
+    def test_mail_budget_per_address(self):
+        client = APIClient()
+        for i in range(10):
+            response = client.post('/api/password-reset/', {'email': f'user{i}@example.edu'},
+                                   format='json')
+            self.assertEqual(response.status_code, 200)
+        response = client.post('/api/password-reset/', {'email': 'user10@example.edu'},
+                               format='json')
+        self.assertEqual(response.status_code, 429)
+
+    def test_buckets_refill(self):
+        now = [0.0]
+        for store in (throttling.MemoryBucketStore(stripes=4, timer=lambda: now[0]),
+                      throttling.CacheBucketStore(timer=lambda: now[0])):
+            now[0] = 1000.0
+            self.assertEqual([store.consume('k', 2, 1.0) for _ in range(3)], [0, 0, 1.0])
+            now[0] += 0.5
+            self.assertEqual(store.consume('k', 2, 1.0), 0.5)
+            now[0] += 1
+            self.assertEqual(store.consume('k', 2, 1.0), 0)
+            self.assertEqual(store.consume('other', 2, 1.0), 0)
+        cache.clear()
+
+    def test_memory_store_stays_bounded(self):
+        store = throttling.MemoryBucketStore(stripes=4, max_buckets=40)
+        for i in range(1000):
+            store.consume(f'client-{i}', 5, 1.0)
+        self.assertLessEqual(sum(len(buckets) for _, buckets in store._stripes), 40)
+
+
+class JobQueueTests(TestCase):
+    """
+    Side effects are queued as jobs in the request's transaction and sent
+    by the worker, retried with backoff when they fail.
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_registration_email_is_sent_by_worker(self):
+        response = self.client.post('/api/register/', {
+            'uiu_id': '011221234', 'name': 'Ana Rahman', 'email': 'ana@example.edu',
+            'password': 'Str0ng!pass99', 'confirmPassword': 'Str0ng!pass99',
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(list(Job.objects.values_list('kind', flat=True)), ['email.verify'])
+
+        with MailSink() as sink, override_settings(
+                EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+                EMAIL_HOST=sink.host, EMAIL_PORT=sink.port):
+            self.assertEqual(jobs.run_due('test-worker', 10), 1)
+
+        self.assertFalse(Job.objects.exists())
+        [message] = sink.messages
+        self.assertEqual(message['To'], 'ana@example.edu')
+        link = next(line for line in message.get_content().splitlines() if '/verify-email?' in line)
+        token = parse_qs(urlsplit(link).query)['token'][0]
+
+        response = self.client.post('/api/verify-email/', {'token': token}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(User.objects.get(uiu_id='011221234').email_verified)
+
+    def test_failing_job_backs_off_then_fails(self):
+        failing = mock.Mock(side_effect=ConnectionError('SMTP down'))
+        with mock.patch.dict(jobs.handlers, {'test.flaky': failing}):
+            job = jobs.enqueue('test.flaky', max_attempts=2, user_id=1)
+
+            with self.assertLogs('api.jobs', 'WARNING'):
+                self.assertEqual(jobs.run_due('test-worker', 10), 1)
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.attempts), ('queued', 1))
+            self.assertIn('SMTP down', job.last_error)
+            self.assertGreater(job.run_at, timezone.now())
+            # Not due again until the backoff has passed
+            self.assertEqual(jobs.run_due('test-worker', 10), 0)
+
+            Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+            with self.assertLogs('api.jobs', 'ERROR'):
+                self.assertEqual(jobs.run_due('test-worker', 10), 1)
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.attempts), ('failed', 2))
+        failing.assert_called_with(user_id=1)
+
+    def test_claims_are_exclusive_until_the_lease_lapses(self):
+        with mock.patch.dict(jobs.handlers, {'test.noop': lambda: None}):
+            jobs.enqueue_many('test.noop', [{}] * 3)
+            first = jobs.claim('worker-a', 2)
+            second = jobs.claim('worker-b', 10)
+            self.assertEqual(len(first), 2)
+            self.assertEqual(len(second), 1)
+            self.assertFalse({job.pk for job in first} & {job.pk for job in second})
+            self.assertEqual(jobs.claim('worker-c', 10), [])
+
+            # worker-a dies holding its jobs; they come back once the lease lapses
+            Job.objects.filter(locked_by='worker-a').update(
+                locked_until=timezone.now() - datetime.timedelta(seconds=1))
+            reclaimed = jobs.claim('worker-c', 10)
+            self.assertEqual({job.pk for job in reclaimed}, {job.pk for job in first})
+            # The old holder can no longer finish or fail them
+            self.assertFalse(jobs.run(first[0]))
+            self.assertTrue(jobs.run(reclaimed[0]))
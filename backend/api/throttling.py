@@ -0,0 +1,156 @@
+import math
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+from rest_framework.throttling import BaseThrottle
+
+_options = getattr(settings, 'RATE_LIMITS', {})
+
+_periods = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """'10/min' -> (10, 60), as DRF reads rates; None -> (None, None)."""
+    if rate is None:
+        return None, None
+    count, period = rate.split('/')
+    return int(count), _periods[period[0]]
+
+
+class MemoryBucketStore:
+    """
+    Token buckets in process memory. Keys are spread over `stripes`
+    independently locked LRU maps, so concurrent requests rarely contend
+    for a lock; the least recently used buckets are dropped past
+    `max_buckets` (a dropped bucket comes back full).
+    """
+
+    def __init__(self, stripes=_options.get('STRIPES', 64),
+                 max_buckets=_options.get('MAX_BUCKETS', 100000), timer=time.monotonic):
+        self.timer = timer
+        self.stripe_size = max(1, max_buckets // stripes)
+        self._stripes = [(threading.Lock(), OrderedDict()) for _ in range(stripes)]
+
+    def consume(self, key, capacity, rate):
+        """
+        Take a token from the bucket for `key`, which holds up to `capacity`
+        tokens and regains `rate` per second. Returns 0 when a token was
+        taken, otherwise the seconds until one will be available.
+        """
+        lock, buckets = self._stripes[zlib.crc32(key.encode()) % len(self._stripes)]
+        now = self.timer()
+        with lock:
+            tokens, updated = buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            if tokens < 1:
+                buckets[key] = (tokens, now)
+                buckets.move_to_end(key)
+                return (1 - tokens) / rate
+            buckets[key] = (tokens - 1, now)
+            buckets.move_to_end(key)
+            if len(buckets) > self.stripe_size:
+                buckets.popitem(last=False)
+        return 0
+
+    def clear(self):
+        for lock, buckets in self._stripes:
+            with lock:
+                buckets.clear()
+
+
+class CacheBucketStore:
+    """
+    Token buckets in a Django cache, shared by every worker using it. The
+    read and write are not atomic, so requests racing on one key may get
+    a few more tokens than the bucket holds.
+    """
+
+    def __init__(self, cache_alias=_options.get('CACHE_ALIAS', 'default'), timer=time.time):
+        self.cache_alias = cache_alias
+        self.timer = timer
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def consume(self, key, capacity, rate):
+        key = f'api:throttle:{key}'
+        now = self.timer()
+        tokens, updated = self.cache.get(key) or (capacity, now)
+        tokens = min(capacity, tokens + (now - updated) * rate)
+        if tokens < 1:
+            wait = (1 - tokens) / rate
+        else:
+            tokens, wait = tokens - 1, 0
+        # A bucket left alone long enough is full again, same as a missing one
+        self.cache.set(key, (tokens, now), math.ceil((capacity - tokens) / rate) + 1)
+        return wait
+
+
+store = import_string(_options.get('BACKEND', 'api.throttling.MemoryBucketStore'))()
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    DRF throttle backed by `store`. The view's `throttle_scope` picks its
+    budget from RATE_LIMITS['RATES'][scope][kind], a DRF rate such as
+    '10/min': a bucket of 10 tokens refilled over a minute, so bursts up
+    to the full budget are allowed. Unconfigured scopes aren't limited.
+    """
+    kind = None
+
+    def get_ident_key(self, request, view):
+        """What to count requests by, or None to let the request through."""
+        raise NotImplementedError
+
+    def get_rate(self, view):
+        # Read per request, so override_settings can lift the limits
+        rates = getattr(settings, 'RATE_LIMITS', {}).get('RATES', {})
+        rates = rates.get(getattr(view, 'throttle_scope', None), {})
+        return parse_rate(rates.get(self.kind))
+
+    def allow_request(self, request, view):
+        capacity, period = self.get_rate(view)
+        if capacity is None:
+            return True
+        ident = self.get_ident_key(request, view)
+        if ident is None:
+            return True
+        self.wait_seconds = store.consume(
+            f'{view.throttle_scope}:{self.kind}:{ident}', capacity, capacity / period)
+        return self.wait_seconds == 0
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class IPThrottle(TokenBucketThrottle):
+    # Client address as DRF sees it, honouring NUM_PROXIES
+    kind = 'ip'
+
+    def get_ident_key(self, request, view):
+        return self.get_ident(request)
+
+
+class AccountThrottle(TokenBucketThrottle):
+    """
+    Per UIU ID: the signed-in user's, or for sign-in and sign-up the one
+    named in the body field given by the view's `throttle_account_field`,
+    so guessing one account's password from many addresses is limited too.
+    The mail-sending views name the email address instead.
+    """
+    kind = 'account'
+
+    def get_ident_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            return request.user.uiu_id.lower()
+        field = getattr(view, 'throttle_account_field', None)
+        value = request.data.get(field) if field and hasattr(request.data, 'get') else None
+        if not isinstance(value, str) or not value.strip():
+            return None
+        return value.strip().lower()
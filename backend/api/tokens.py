@@ -0,0 +1,147 @@
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+from rest_framework_simplejwt.tokens import RefreshToken as BaseRefreshToken
+
+from .caching import BloomFilter
+
+logger = logging.getLogger('api.tokens')
+
+
+class BlacklistFilter:
+    """
+    In-process Bloom filter over the JTIs of unexpired blacklisted tokens.
+
+    A negative answer means the token is not blacklisted, so the database is
+    only consulted for the rare positive. Tokens blacklisted by this process
+    are added immediately; rows written by other workers are picked up by an
+    incremental `id > last_id` sync at most every `sync_interval` seconds,
+    which bounds how long a token revoked elsewhere can still be accepted.
+    The filter is rebuilt from scratch every `rebuild_interval` seconds so
+    bits of pruned tokens do not accumulate.
+
+    Building it scans the blacklist, so that happens on a background thread,
+    started with the server (see backend/wsgi.py) and again for each
+    rebuild. Until the first build is done every check goes to the database.
+    """
+
+    def __init__(self, capacity=1_000_000, error_rate=0.01,
+                 sync_interval=1.0, rebuild_interval=3600):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.sync_interval = sync_interval
+        self.rebuild_interval = rebuild_interval
+        self.bloom = None
+        self.last_id = 0
+        self.synced_at = 0.0
+        self.built_at = 0.0
+        self._lock = threading.Lock()
+        self._warming = False
+
+    def warm(self):
+        """Rebuild the filter from every unexpired blacklisted token."""
+        # Rows blacklisted after this point are caught by the next sync
+        last_id = BlacklistedToken.objects.order_by('-id').values_list('id', flat=True).first()
+        rows = (
+            BlacklistedToken.objects
+            .filter(id__lte=last_id or 0, token__expires_at__gt=timezone.now())
+            .values_list('token__jti', flat=True)
+        )
+        bloom = BloomFilter(max(self.capacity, rows.count() * 2), self.error_rate)
+        for jti in rows.iterator(chunk_size=10000):
+            bloom.add(jti)
+        with self._lock:
+            self.bloom = bloom
+            self.last_id = last_id or 0
+            self.built_at = time.monotonic()
+            # Catch up on rows written while building at the next check
+            self.synced_at = 0.0
+
+    def warm_in_background(self):
+        """Start warm() on a daemon thread unless one is already running."""
+        with self._lock:
+            if self._warming:
+                return
+            self._warming = True
+        threading.Thread(target=self._warm, name='blacklist-filter', daemon=True).start()
+
+    def _warm(self):
+        try:
+            self.warm()
+        except Exception:
+            logger.exception('Building the refresh token blacklist filter failed')
+        finally:
+            self._warming = False
+            connections.close_all()
+
+    def sync(self):
+        now = time.monotonic()
+        if self.bloom is None or now - self.built_at >= self.rebuild_interval:
+            self.warm_in_background()
+        if self.bloom is None or now - self.synced_at < self.sync_interval:
+            return
+        with self._lock:
+            if now - self.synced_at < self.sync_interval:
+                return
+            rows = (
+                BlacklistedToken.objects
+                .filter(id__gt=self.last_id)
+                .order_by('id')
+                .values_list('id', 'token__jti')
+            )
+            for row_id, jti in rows:
+                self.bloom.add(jti)
+                self.last_id = row_id
+            self.synced_at = now
+
+    def might_contain(self, jti):
+        self.sync()
+        bloom = self.bloom
+        # Not built yet: let the database answer
+        return bloom is None or bloom.might_contain(jti)
+
+    def add(self, jti):
+        if self.bloom is not None:
+            self.bloom.add(jti)
+
+    def reset(self):
+        with self._lock:
+            self.bloom = None
+            self.last_id = 0
+
+
+_options = getattr(settings, 'TOKEN_BLACKLIST_FILTER', {})
+blacklist_filter = BlacklistFilter(
+    capacity=_options.get('CAPACITY', 1_000_000),
+    error_rate=_options.get('ERROR_RATE', 0.01),
+    sync_interval=_options.get('SYNC_INTERVAL', 1.0),
+    rebuild_interval=_options.get('REBUILD_INTERVAL', 3600),
+)
+
+
+class RefreshToken(BaseRefreshToken):
+    """
+    Refresh token whose blacklist check consults `blacklist_filter` before
+    querying the token_blacklist tables.
+    """
+
+    def check_blacklist(self):
+        jti = self.payload[api_settings.JTI_CLAIM]
+        if blacklist_filter.might_contain(jti):
+            super().check_blacklist()
+
+    def blacklist(self):
+        result = super().blacklist()
+        blacklist_filter.add(self.payload[api_settings.JTI_CLAIM])
+        return result
+
+
+class FilteredTokenRefreshSerializer(TokenRefreshSerializer):
+    token_class = RefreshToken
@@ -0,0 +1,50 @@
+from django.db import transaction
+from django.utils import timezone
+
+from .models import QUEUE_STATUSES, Appointment
+
+
+def waiting(date=None):
+    """
+    Appointments still waiting on `date` (today by default) in triage order:
+    emergencies first, then by how long they have been waiting and their
+    slot. The order matches appt_triage_queue_idx, so no rows are sorted.
+    """
+    return (Appointment.objects
+            .filter(date=date or timezone.localdate(), triage_rank__isnull=False)
+            .order_by('triage_rank', 'created_at', 'slot_start', 'id'))
+
+
+def claim_next(user, date=None):
+    """
+    Give `user` the case at the head of the queue and return it, or None
+    when nobody is waiting. The claim is a conditional UPDATE on a still
+    unclaimed row, so two staff members can never take the same case; the
+    loser of a race moves on to the next one.
+
+    The queue is the whole clinic's rather than the booked doctor's: walk-in
+    and emergency cases go to whichever staff member is free, which is why
+    claimed_by is kept apart from doctor.
+    """
+    queue = waiting(date)
+    while True:
+        with transaction.atomic():
+            pk = (queue.select_for_update(skip_locked=True)
+                  .values_list('pk', flat=True).first())
+            if pk is None:
+                return None
+            now = timezone.now()
+            if queue.filter(pk=pk).update(claimed_by=user, claimed_at=now, updated_at=now):
+                return Appointment.objects.with_users().get(pk=pk)
+
+
+def release(pk, user):
+    """
+    Put a claimed case that hasn't been seen to yet back in the queue.
+    Admins can release anyone's; staff only their own.
+    """
+    claimed = Appointment.objects.filter(
+        pk=pk, claimed_by__isnull=False, status__in=QUEUE_STATUSES)
+    if user.role != 'ADMIN':
+        claimed = claimed.filter(claimed_by=user)
+    return bool(claimed.update(claimed_by=None, claimed_at=None, updated_at=timezone.now()))
@@ -1,11 +1,15 @@
 from django.urls import path
 from rest_framework_simplejwt.views import TokenRefreshView
-from .views import RegisterView, LoginView, LogoutView, UserProfileView, BookAppointmentView, AppointmentDetailView, UpdateAppointmentStatusView, CancelAppointmentView, DoctorListView, AppointmentListView
+from .views import RegisterView, LoginView, LogoutView, VerifyEmailView, ResendVerificationView, PasswordResetView, PasswordResetConfirmView, UserProfileView, BookAppointmentView, AppointmentDetailView, UpdateAppointmentStatusView, CancelAppointmentView, BulkAppointmentStatusView, DoctorListView, DoctorAvailabilityView, AppointmentExportView, AppointmentChangesView, UserExportView, appointment_events, StatsView, AppointmentListView, AppointmentSearchView, MetricsView, MedicalRecordListView, MedicalRecordDetailView, MedicalRecordDownloadView, RecordUploadView, RecordUploadDetailView, MedicineListView, StockBatchListView, OrderListView, CancelOrderView, PharmacySalesView, TriageQueueView, ClaimNextView, ReleaseClaimView
 
 urlpatterns = [
     path('register/', RegisterView.as_view(), name='register'),
     path('login/', LoginView.as_view(), name='login'),
     path('logout/', LogoutView.as_view(), name='logout'),
+    path('verify-email/', VerifyEmailView.as_view(), name='verify-email'),
+    path('verify-email/resend/', ResendVerificationView.as_view(), name='resend-verification'),
+    path('password-reset/', PasswordResetView.as_view(), name='password-reset'),
+    path('password-reset/confirm/', PasswordResetConfirmView.as_view(), name='password-reset-confirm'),
     path('profile/', UserProfileView.as_view(), name='profile'),
     path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('book/', BookAppointmentView.as_view(), name='book-appointment'),
@@ -13,7 +17,29 @@ urlpatterns = [
     path('<int:pk>/status/', UpdateAppointmentStatusView.as_view(), name='update-status'),
     path('<int:pk>/cancel/', CancelAppointmentView.as_view(), name='cancel-appointment'),
     path('doctors/', DoctorListView.as_view(), name='doctor-list'),
+    path('doctors/<str:doctor_id>/availability/', DoctorAvailabilityView.as_view(), name='doctor-availability'),
+    path('users/export/', UserExportView.as_view(), name='user-export'),
+    path('events/', appointment_events, name='appointment-events'),
+    path('stats/', StatsView.as_view(), name='stats'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
     path('appointments/', AppointmentListView.as_view(), name='appointment-list'),
+    path('appointments/export/', AppointmentExportView.as_view(), name='appointment-export'),
+    path('appointments/search/', AppointmentSearchView.as_view(), name='appointment-search'),
+    path('appointments/changes/', AppointmentChangesView.as_view(), name='appointment-changes'),
+    path('appointments/bulk-status/', BulkAppointmentStatusView.as_view(), name='bulk-status'),
+    path('records/', MedicalRecordListView.as_view(), name='record-list'),
+    path('records/uploads/', RecordUploadView.as_view(), name='record-upload'),
+    path('records/uploads/<uuid:upload_id>/', RecordUploadDetailView.as_view(), name='record-upload-detail'),
+    path('records/<int:pk>/', MedicalRecordDetailView.as_view(), name='record-detail'),
+    path('records/<int:pk>/download/', MedicalRecordDownloadView.as_view(), name='record-download'),
+    path('queue/', TriageQueueView.as_view(), name='triage-queue'),
+    path('queue/claim/', ClaimNextView.as_view(), name='triage-claim'),
+    path('queue/<int:pk>/release/', ReleaseClaimView.as_view(), name='triage-release'),
+    path('pharmacy/medicines/', MedicineListView.as_view(), name='medicine-list'),
+    path('pharmacy/medicines/<int:pk>/batches/', StockBatchListView.as_view(), name='stock-batch-list'),
+    path('pharmacy/orders/', OrderListView.as_view(), name='order-list'),
+    path('pharmacy/orders/<int:pk>/cancel/', CancelOrderView.as_view(), name='cancel-order'),
+    path('pharmacy/sales/', PharmacySalesView.as_view(), name='pharmacy-sales'),
     path('appointments/book/', BookAppointmentView.as_view(), name='book-appointment'),
     path('appointments/<int:pk>/', AppointmentDetailView.as_view(), name='appointment-detail'),
     path('appointments/<int:pk>/status/', UpdateAppointmentStatusView.as_view(), name='update-status'),
@@ -1,39 +1,138 @@
+import datetime
+
 from rest_framework import status, generics
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.renderers import BrowsableAPIRenderer
+from rest_framework.exceptions import NotFound
 from rest_framework.views import APIView
-from rest_framework_simplejwt.tokens import RefreshToken
+from asgiref.sync import sync_to_async
 from django.contrib.auth import authenticate
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.db import IntegrityError, transaction
+from django.db.models import Prefetch
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header
 from django_filters.rest_framework import DjangoFilterBackend
-from .serializers import RegisterSerializer, UserSerializer, AppointmentSerializer, BookAppointmentSerializer, UpdateAppointmentStatusSerializer
-from .models import User, Appointment
-
-
-class RegisterView(generics.CreateAPIView):
+from .serializers import RegisterSerializer, UserSerializer, PasswordResetRequestSerializer, PasswordResetConfirmSerializer, VerifyEmailSerializer, AppointmentSerializer, BookAppointmentSerializer, UpdateAppointmentStatusSerializer, BulkAppointmentStatusSerializer, MedicalRecordSerializer, RecordUploadSerializer, MedicineSerializer, StockBatchSerializer, OrderSerializer, PlaceOrderSerializer
+from .authentication import CachedJWTAuthentication, MetricsTokenAuthentication, authenticate_stream_request
+from .availability import format_slot, get_free_slots
+from .conditional import (ConditionalGetMixin, collection_validators, conditional_response,
+                          doctor_list, page_validators)
+from .events import HEARTBEAT_SECONDS, broker, format_sse
+from .exports import (APPOINTMENT_COLUMNS, APPOINTMENT_VALUES, USER_COLUMNS, appointment_row,
+                      appointment_rows, stream_export, user_rows)
+from .idempotency import IdempotentPostMixin
+from .jobs import enqueue, enqueue_many
+from .login import last_login_recorder, login_executor, run_in_pool
+from .metrics import render_metrics
+from .models import User, Appointment, MedicalRecord, RecordUpload, Medicine, StockBatch, Order, OrderItem
+from .notifications import check_verification_token
+from .pagination import AppointmentCursorPagination, MedicalRecordCursorPagination, OrderCursorPagination
+from .pharmacy import InsufficientStock, OrderError, cancel_order, get_sales, place_order, with_stock
+from .permissions import CanViewMetrics, IsAdminRole, IsStaffRole, can_update_appointment
+from .records import (RangeNotSatisfiable, UploadConflict, UploadError, blob_path, discard_upload,
+                      finish_upload, iter_range, parse_content_range, parse_range, upload_status,
+                      write_chunk)
+from .renderers import CSVRenderer, FastJSONRenderer, NDJSONRenderer
+from .routers import read_only
+from .search import search
+from .signals import appointment_status_changed, status_change
+from .stats import apply_stat_changes, get_stats
+from .sync import WatermarkError, WatermarkExpired, get_changes
+from .triage import claim_next, release, waiting
+from .throttling import AccountThrottle, IPThrottle
+from .tokens import RefreshToken
+
+
+# Appointment payloads include the patient's and doctor's names
+APPOINTMENT_STAMPS = ('updated_at', 'patient__updated_at', 'doctor__updated_at')
+# Columns fetched with each list row for its page's ETag
+APPOINTMENT_PAGE_VALUES = APPOINTMENT_VALUES + APPOINTMENT_STAMPS[1:]
+
+
+def parse_date_range(params, default_from, default_days, max_days):
+    """
+    Read `from`/`to` query params as ISO dates. Raises ValueError with a
+    client-facing message when they are malformed or out of range.
+    """
+    try:
+        date_from = datetime.date.fromisoformat(params['from']) if params.get('from') else default_from
+        date_to = (datetime.date.fromisoformat(params['to']) if params.get('to')
+                   else date_from + datetime.timedelta(days=default_days - 1))
+    except ValueError:
+        raise ValueError('Dates must be in YYYY-MM-DD format')
+    if date_to < date_from or (date_to - date_from).days >= max_days:
+        raise ValueError(f'Date range must be between 1 and {max_days} days')
+    return date_from, date_to
+
+
+def issue_tokens(user):
+    """A new refresh and access token pair for `user`."""
+    refresh = RefreshToken.for_user(user)
+    return {'refresh': str(refresh), 'access': str(refresh.access_token)}
+
+
+class ReadOnlyDatabaseMixin:
+    """Serve GET and HEAD requests from the read-only database alias."""
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return super().dispatch(request, *args, **kwargs)
+        with read_only():
+            return super().dispatch(request, *args, **kwargs)
+
+
+class RegisterView(IdempotentPostMixin, generics.CreateAPIView):
     queryset = User.objects.all()
     permission_classes = (AllowAny,)
     serializer_class = RegisterSerializer
+    throttle_classes = [IPThrottle, AccountThrottle]
+    throttle_scope = 'register'
+    throttle_account_field = 'uiu_id'
+    idempotency_scope = 'register'
 
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        user = serializer.save()
-
-        # Generate JWT tokens
-        refresh = RefreshToken.for_user(user)
+        with transaction.atomic():
+            user = serializer.save()
+            enqueue('email.verify', user_id=user.pk)
 
         return Response({
             'user': UserSerializer(user).data,
-            'tokens': {
-                'refresh': str(refresh),
-                'access': str(refresh.access_token),
-            },
+            'tokens': issue_tokens(user),
             'message': 'Registration successful! Please check your email for verification.'
         }, status=status.HTTP_201_CREATED)
 
+    def get_stored_data(self, data):
+        # Tokens are credentials, so they aren't kept with the key; a
+        # replay gets a new pair instead
+        return {name: value for name, value in data.items() if name != 'tokens'}
+
+    def replay(self, record):
+        response = super().replay(record)
+        if record.status_code == status.HTTP_201_CREATED:
+            user = User.objects.filter(pk=record.response['user']['id'], is_active=True).first()
+            if user is not None:
+                response.data = {'user': record.response['user'], 'tokens': issue_tokens(user),
+                                 'message': record.response['message']}
+        return response
+
 
 class LoginView(APIView):
     permission_classes = (AllowAny,)
+    throttle_classes = [IPThrottle, AccountThrottle]
+    throttle_scope = 'login'
+    throttle_account_field = 'uiuId'
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        # Password hashing runs in a bounded pool so a burst of sign-ins
+        # can't tie up every worker thread
+        return run_in_pool(super().as_view(**initkwargs), login_executor)
 
     def post(self, request):
         uiu_id = request.data.get('uiuId')
@@ -44,21 +143,8 @@ class LoginView(APIView):
                 'error': 'Please provide both UIU ID and password'
             }, status=status.HTTP_400_BAD_REQUEST)
 
-        try:
-            user = User.objects.get(uiu_id=uiu_id)
-            authenticated_user = authenticate(
-                username=user.username,
-                password=password
-            )
-
-            if authenticated_user is None:
-                return Response({
-                    'error': 'Invalid credentials'
-                }, status=status.HTTP_401_UNAUTHORIZED)
-
-            user = authenticated_user
-
-        except User.DoesNotExist:
+        user = authenticate(request, uiu_id=uiu_id, password=password)
+        if user is None:
             return Response({
                 'error': 'Invalid credentials'
             }, status=status.HTTP_401_UNAUTHORIZED)
@@ -68,19 +154,85 @@ class LoginView(APIView):
                 'error': 'Account is deactivated'
             }, status=status.HTTP_403_FORBIDDEN)
 
-        # Generate JWT tokens
-        refresh = RefreshToken.for_user(user)
+        last_login_recorder.record(user)
 
         return Response({
             'user': UserSerializer(user).data,
-            'tokens': {
-                'refresh': str(refresh),
-                'access': str(refresh.access_token),
-            },
+            'tokens': issue_tokens(user),
             'message': 'Login successful'
         }, status=status.HTTP_200_OK)
 
 
+class VerifyEmailView(APIView):
+    permission_classes = (AllowAny,)
+
+    def post(self, request):
+        serializer = VerifyEmailSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user = check_verification_token(serializer.validated_data['token'])
+        if user is None:
+            return Response({
+                'error': 'Invalid or expired verification token'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        if not user.email_verified:
+            user.email_verified = True
+            user.save(update_fields=['email_verified', 'updated_at'])
+        return Response({'message': 'Email verified'}, status=status.HTTP_200_OK)
+
+
+class ResendVerificationView(APIView):
+    permission_classes = (AllowAny,)
+    # Each request may send mail, so both views share one budget per
+    # address and per mailbox
+    throttle_classes = [IPThrottle, AccountThrottle]
+    throttle_scope = 'email'
+    throttle_account_field = 'email'
+
+    def post(self, request):
+        serializer = PasswordResetRequestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user_ids = User.objects.filter(
+            email__iexact=serializer.validated_data['email'], email_verified=False,
+            is_active=True).values_list('pk', flat=True)
+        enqueue_many('email.verify', [{'user_id': pk} for pk in user_ids])
+        # The same answer either way, so this can't be used to probe for accounts
+        return Response({
+            'message': 'If that address needs verifying, a new link is on its way.'
+        }, status=status.HTTP_200_OK)
+
+
+class PasswordResetView(APIView):
+    permission_classes = (AllowAny,)
+    # Each request may send mail, so both views share one budget per
+    # address and per mailbox
+    throttle_classes = [IPThrottle, AccountThrottle]
+    throttle_scope = 'email'
+    throttle_account_field = 'email'
+
+    def post(self, request):
+        serializer = PasswordResetRequestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user_ids = User.objects.filter(
+            email__iexact=serializer.validated_data['email'],
+            is_active=True).values_list('pk', flat=True)
+        enqueue_many('email.password_reset', [{'user_id': pk} for pk in user_ids])
+        return Response({
+            'message': 'If an account uses that address, a reset link is on its way.'
+        }, status=status.HTTP_200_OK)
+
+
+class PasswordResetConfirmView(APIView):
+    permission_classes = (AllowAny,)
+
+    def post(self, request):
+        serializer = PasswordResetConfirmSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user = serializer.validated_data['user']
+        user.set_password(serializer.validated_data['password'])
+        user.save(update_fields=['password', 'updated_at'])
+        return Response({'message': 'Password has been reset'}, status=status.HTTP_200_OK)
+
+
 class LogoutView(APIView):
     permission_classes = (AllowAny,)
 
@@ -111,33 +263,207 @@ class UserProfileView(generics.RetrieveUpdateAPIView):
         return self.request.user
 
 
-class DoctorListView(generics.ListAPIView):
+class DoctorListView(ConditionalGetMixin, ReadOnlyDatabaseMixin, generics.ListAPIView):
     permission_classes = (IsAuthenticated,)
     serializer_class = UserSerializer
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
 
     def get_queryset(self):
         return User.objects.filter(role='STAFF')
 
+    def get_validators(self, request):
+        return doctor_list.get()[:2]
+
+    def list(self, request, *args, **kwargs):
+        # Same shape as UserSerializer, cached until a user changes
+        return Response(doctor_list.get()[2])
+
+
+class DoctorAvailabilityView(APIView):
+    permission_classes = [IsAuthenticated]
+    max_days = 31
+
+    def get(self, request, doctor_id):
+        try:
+            doctor = User.objects.get(uiu_id=doctor_id, role='STAFF')
+        except User.DoesNotExist:
+            return Response(
+                {'error': 'Doctor not found'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        try:
+            date_from, date_to = parse_date_range(
+                request.query_params, timezone.localdate(), 7, self.max_days)
+        except ValueError as e:
+            return Response(
+                {'error': str(e)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        slots = get_free_slots(doctor, date_from, date_to)
+        return Response({
+            'doctor_id': doctor.uiu_id,
+            'from': date_from.isoformat(),
+            'to': date_to.isoformat(),
+            'slots': [format_slot(*slot) for slot in slots],
+        }, status=status.HTTP_200_OK)
+
 
-class AppointmentListView(generics.ListAPIView):
+class StatsView(APIView):
+    permission_classes = [IsAuthenticated]
+    max_days = 366
+
+    def get(self, request):
+        today = timezone.localdate()
+        try:
+            date_from, date_to = parse_date_range(
+                request.query_params, today - datetime.timedelta(days=29), 30, self.max_days)
+        except ValueError as e:
+            return Response(
+                {'error': str(e)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        return Response(get_stats(request.user, date_from, date_to),
+                        status=status.HTTP_200_OK)
+
+
+class AppointmentListView(ReadOnlyDatabaseMixin, generics.ListAPIView):
     serializer_class = AppointmentSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = AppointmentCursorPagination
+    pagination_columns = APPOINTMENT_PAGE_VALUES
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['status', 'date', 'emergency']
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
 
     def get_queryset(self):
-        user = self.request.user
-        if user.role == 'STUDENT':
-            return Appointment.objects.filter(patient=user)
-        elif user.role == 'STAFF':
-            return Appointment.objects.filter(doctor=user)
-        else:  # admin
-            return Appointment.objects.all()
+        return Appointment.objects.for_user(self.request.user).with_users()
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset()).values_list(*APPOINTMENT_PAGE_VALUES)
+        page = self.paginate_queryset(queryset)
+        # The ETag comes from the page itself rather than the whole filtered
+        # table, so a revalidation costs the same single range query
+        width = len(APPOINTMENT_VALUES)
+        updated_at = APPOINTMENT_VALUES.index('updated_at')
+        validators = page_validators(
+            [(values[0], values[updated_at], *values[width:]) for values in page],
+            request.user.pk, request.get_full_path(), self.paginator.has_next)
+
+        def respond():
+            # Same shape as AppointmentSerializer, built from column tuples
+            return self.get_paginated_response(
+                [dict(zip(APPOINTMENT_COLUMNS, appointment_row(values[:width]))) for values in page])
+
+        if validators is None:
+            return respond()
+        return conditional_response(request, validators, respond)
+
+
+class AppointmentExportView(AppointmentListView):
+    # ?format=csv or ?format=ndjson (the default), with the list filters
+    pagination_class = None
+    renderer_classes = [NDJSONRenderer, CSVRenderer]
+
+    def get(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        # The rows are read while the response streams, after dispatch has
+        # left read_only(), so pin the alias the router picks here
+        queryset = queryset.using(queryset.db)
+        return stream_export(request.accepted_renderer.format, 'appointments',
+                             APPOINTMENT_COLUMNS, appointment_rows(queryset))
+
+
+class AppointmentSearchView(ReadOnlyDatabaseMixin, generics.ListAPIView):
+    """
+    Appointments whose reason or notes match `q`, best matches first,
+    scoped and filtered like the appointment list.
+    """
+    permission_classes = [IsAuthenticated]
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = ['status', 'date', 'emergency']
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+    default_limit = 20
+    max_limit = 100
 
+    def get_queryset(self):
+        return Appointment.objects.for_user(self.request.user).with_users()
 
-class BookAppointmentView(generics.CreateAPIView):
+    def list(self, request, *args, **kwargs):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response(
+                {'error': 'Search query (q) is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            limit = min(int(request.query_params.get('limit', self.default_limit)), self.max_limit)
+        except ValueError:
+            limit = self.default_limit
+        limit = max(limit, 1)
+
+        queryset = search(self.filter_queryset(self.get_queryset()), query)
+        rows = queryset.values_list(*APPOINTMENT_VALUES)[:limit]
+        return Response({
+            'results': [dict(zip(APPOINTMENT_COLUMNS, appointment_row(values))) for values in rows],
+        })
+
+
+class UserExportView(generics.GenericAPIView):
+    queryset = User.objects.order_by('id')
+    permission_classes = [IsAdminRole]
+    renderer_classes = [NDJSONRenderer, CSVRenderer]
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = ['role', 'is_active', 'department']
+
+    def get(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        return stream_export(request.accepted_renderer.format, 'users',
+                             USER_COLUMNS, user_rows(queryset))
+
+
+class AppointmentChangesView(APIView):
+    """
+    Delta sync: appointments created, modified or deleted since the
+    `watermark` returned by the previous call. Omit `since` for a full
+    initial sync and keep polling while `has_more` is true.
+    """
+    permission_classes = [IsAuthenticated]
+    default_limit = 500
+    max_limit = 1000
+
+    def get(self, request):
+        try:
+            limit = min(int(request.query_params.get('limit', self.default_limit)), self.max_limit)
+        except ValueError:
+            limit = self.default_limit
+        limit = max(limit, 1)
+
+        try:
+            changes = get_changes(request.user, request.query_params.get('since'), limit)
+        except WatermarkExpired as e:
+            return Response(
+                {'error': str(e)},
+                status=status.HTTP_410_GONE
+            )
+        except WatermarkError as e:
+            return Response(
+                {'error': str(e)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        changes['changed'] = AppointmentSerializer(changes['changed'], many=True).data
+        return Response(changes, status=status.HTTP_200_OK)
+
+
+class BookAppointmentView(IdempotentPostMixin, generics.CreateAPIView):
     serializer_class = BookAppointmentSerializer
     permission_classes = [IsAuthenticated]
+    throttle_classes = [IPThrottle, AccountThrottle]
+    throttle_scope = 'book'
+    idempotency_scope = 'book-appointment'
 
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
@@ -150,18 +476,16 @@ class BookAppointmentView(generics.CreateAPIView):
         )
 
 
-class AppointmentDetailView(generics.RetrieveAPIView):
+class AppointmentDetailView(ConditionalGetMixin, ReadOnlyDatabaseMixin, generics.RetrieveAPIView):
     serializer_class = AppointmentSerializer
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        user = self.request.user
-        if user.role == 'STUDENT':
-            return Appointment.objects.filter(patient=user)
-        elif user.role == 'STAFF':
-            return Appointment.objects.filter(doctor=user)
-        else:
-            return Appointment.objects.all()
+        return Appointment.objects.for_user(self.request.user).with_users()
+
+    def get_validators(self, request):
+        return collection_validators(
+            self.get_queryset().filter(pk=self.kwargs['pk']), APPOINTMENT_STAMPS, request.user.pk)
 
 
 class UpdateAppointmentStatusView(APIView):
@@ -172,13 +496,8 @@ class UpdateAppointmentStatusView(APIView):
             appointment = Appointment.objects.get(pk=pk)
 
             # Check permissions
-            user = request.user
-            if user.role == 'STUDENT' and appointment.patient != user:
-                return Response(
-                    {'error': 'You do not have permission to update this appointment'},
-                    status=status.HTTP_403_FORBIDDEN
-                )
-            elif user.role == 'STAFF' and appointment.doctor != user:
+            if not can_update_appointment(request.user, appointment.patient_id,
+                                          appointment.doctor_id, appointment.claimed_by_id):
                 return Response(
                     {'error': 'You do not have permission to update this appointment'},
                     status=status.HTTP_403_FORBIDDEN
@@ -187,8 +506,19 @@ class UpdateAppointmentStatusView(APIView):
             serializer = UpdateAppointmentStatusSerializer(data=request.data)
             serializer.is_valid(raise_exception=True)
 
+            previous_status = appointment.status
             appointment.status = serializer.validated_data['status']
-            appointment.save()
+            try:
+                # The queued notification commits or rolls back with the change
+                with transaction.atomic():
+                    appointment.save()
+                    self.notify(appointment, previous_status)
+            except IntegrityError:
+                # Re-opening a cancelled booking whose slot was taken since
+                return Response(
+                    {'error': 'This slot has already been booked'},
+                    status=status.HTTP_409_CONFLICT
+                )
 
             return Response(
                 AppointmentSerializer(appointment).data,
@@ -200,6 +530,14 @@ class UpdateAppointmentStatusView(APIView):
                 status=status.HTTP_404_NOT_FOUND
             )
 
+    @staticmethod
+    def notify(appointment, previous_status):
+        if appointment.status == previous_status:
+            return
+        appointment_status_changed.send(sender=Appointment, changes=[status_change(
+            appointment.pk, appointment.patient_id, appointment.doctor_id,
+            appointment.date, appointment.time, appointment.status, previous_status)])
+
 
 class CancelAppointmentView(APIView):
     permission_classes = [IsAuthenticated]
@@ -209,14 +547,17 @@ class CancelAppointmentView(APIView):
             appointment = Appointment.objects.get(pk=pk)
 
             # Only patient can cancel
-            if request.user != appointment.patient:
+            if appointment.patient_id != request.user.id:
                 return Response(
                     {'error': 'Only the patient can cancel this appointment'},
                     status=status.HTTP_403_FORBIDDEN
                 )
 
+            previous_status = appointment.status
             appointment.status = 'cancelled'
-            appointment.save()
+            with transaction.atomic():
+                appointment.save()
+                UpdateAppointmentStatusView.notify(appointment, previous_status)
 
             return Response(
                 AppointmentSerializer(appointment).data,
@@ -227,3 +568,389 @@ class CancelAppointmentView(APIView):
                 {'error': 'Appointment not found'},
                 status=status.HTTP_404_NOT_FOUND
             )
+
+
+class BulkAppointmentStatusView(APIView):
+    """
+    Move many appointments to one status in a single UPDATE, e.g. cancelling
+    a doctor's day. Permissions follow UpdateAppointmentStatusView and every
+    requested id gets its own result.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        serializer = BulkAppointmentStatusSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = list(dict.fromkeys(serializer.validated_data['ids']))
+        new_status = serializer.validated_data['status']
+        user = request.user
+
+        results = {}
+        with transaction.atomic():
+            # One query loads everything the permission checks and the
+            # rollup need
+            rows = (Appointment.objects.select_for_update()
+                    .filter(pk__in=ids).order_by()
+                    .values_list('id', 'patient_id', 'doctor_id', 'claimed_by_id', 'date', 'time',
+                                 'status'))
+            changes = {}
+            notifications = {}
+            for pk, patient_id, doctor_id, claimed_by_id, date, time, old_status in rows:
+                if not can_update_appointment(user, patient_id, doctor_id, claimed_by_id):
+                    results[pk] = 'forbidden'
+                elif old_status == new_status:
+                    results[pk] = 'unchanged'
+                else:
+                    changes[pk] = ((date, doctor_id, old_status), (date, doctor_id, new_status))
+                    notifications[pk] = status_change(
+                        pk, patient_id, doctor_id, date, time, new_status, old_status)
+
+            updated = self.apply(changes, new_status)
+            for pk in changes:
+                results[pk] = 'updated' if pk in updated else 'conflict'
+            apply_stat_changes(changes[pk] for pk in updated)
+            if updated:
+                appointment_status_changed.send(
+                    sender=Appointment, changes=[notifications[pk] for pk in updated])
+
+        return Response({
+            'status': new_status,
+            'updated': len(updated),
+            'results': [{'id': pk, 'result': results.get(pk, 'not_found')} for pk in ids],
+        }, status=status.HTTP_200_OK)
+
+    @staticmethod
+    def apply(changes, new_status):
+        """Update the rows in `changes` and return the ids that were updated."""
+        if not changes:
+            return set()
+        now = timezone.now()
+        try:
+            with transaction.atomic():
+                Appointment.objects.filter(pk__in=changes).update(
+                    status=new_status, updated_at=now)
+            return set(changes)
+        except IntegrityError:
+            pass
+
+        # Some re-opened bookings collide with slots taken since they were
+        # cancelled; retry row by row so only those are left out
+        updated = set()
+        for pk in changes:
+            try:
+                with transaction.atomic():
+                    Appointment.objects.filter(pk=pk).update(
+                        status=new_status, updated_at=now)
+                updated.add(pk)
+            except IntegrityError:
+                continue
+        return updated
+
+
+class TriageQueueView(APIView):
+    """Today's waiting patients for staff, emergencies first."""
+    permission_classes = [IsStaffRole]
+    default_limit = 50
+    max_limit = 200
+
+    def get(self, request):
+        try:
+            limit = min(int(request.query_params.get('limit', self.default_limit)), self.max_limit)
+        except ValueError:
+            return Response({'error': 'limit must be a number'}, status=status.HTTP_400_BAD_REQUEST)
+        queue = waiting()
+        results = AppointmentSerializer(queue.with_users()[:max(limit, 0)], many=True).data
+        for position, row in enumerate(results, 1):
+            row['position'] = position
+        return Response({'count': queue.count(), 'results': results})
+
+
+class ClaimNextView(APIView):
+    permission_classes = [IsStaffRole]
+
+    def post(self, request):
+        appointment = claim_next(request.user)
+        if appointment is None:
+            return Response({'error': 'No patients are waiting'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(AppointmentSerializer(appointment).data, status=status.HTTP_200_OK)
+
+
+class ReleaseClaimView(APIView):
+    permission_classes = [IsStaffRole]
+
+    def post(self, request, pk):
+        if not release(pk, request.user):
+            return Response({'error': 'You have no open claim on this appointment'},
+                            status=status.HTTP_404_NOT_FOUND)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+async def appointment_events(request):
+    """
+    Server-sent event stream of status changes to the caller's appointments.
+    Served as an async view so idle streams hold no worker thread under
+    ASGI. EventSource cannot set headers, so the access token may also be
+    passed as ?token=.
+    """
+    if not isinstance(request, ASGIRequest):
+        # A WSGI server would drain the endless stream before sending
+        # anything, pinning a worker for good
+        return JsonResponse(
+            {'error': 'Event streams are only available when served over ASGI'},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE
+        )
+
+    user = await sync_to_async(authenticate_stream_request)(request)
+    if user is None:
+        return JsonResponse(
+            {'detail': 'Authentication credentials were not provided or are invalid.'},
+            status=status.HTTP_401_UNAUTHORIZED
+        )
+
+    subscription = broker.subscribe(user.pk)
+
+    async def stream():
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                event = await subscription.get(timeout=HEARTBEAT_SECONDS)
+                yield format_sse(event) if event is not None else ': keep-alive\n\n'
+        finally:
+            subscription.close()
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+class MetricsView(APIView):
+    authentication_classes = [MetricsTokenAuthentication, CachedJWTAuthentication]
+    permission_classes = [CanViewMetrics]
+
+    def get(self, request):
+        return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class MedicalRecordListView(ReadOnlyDatabaseMixin, generics.ListAPIView):
+    """Record metadata, newest first; ?patient=<uiu_id> narrows it to one patient."""
+    serializer_class = MedicalRecordSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = MedicalRecordCursorPagination
+
+    def get_queryset(self):
+        queryset = (MedicalRecord.objects.for_user(self.request.user)
+                    .select_related('patient', 'uploaded_by', 'blob'))
+        patient = self.request.query_params.get('patient')
+        if patient:
+            queryset = queryset.filter(patient__uiu_id=patient)
+        return queryset
+
+
+class MedicalRecordDetailView(ReadOnlyDatabaseMixin, generics.RetrieveAPIView):
+    serializer_class = MedicalRecordSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return (MedicalRecord.objects.for_user(self.request.user)
+                .select_related('patient', 'uploaded_by', 'blob'))
+
+
+class MedicalRecordDownloadView(APIView):
+    """Streams the stored file, honouring single `Range` requests."""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        try:
+            record = MedicalRecord.objects.for_user(request.user).select_related('blob').get(pk=pk)
+        except MedicalRecord.DoesNotExist:
+            return Response({'error': 'Record not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        # Stored content never changes, so its hash is a strong ETag
+        etag = f'"{record.blob.sha256}"'
+        response = get_conditional_response(request, etag=etag) or self.stream(request, record, etag)
+        response['ETag'] = etag
+        response['Accept-Ranges'] = 'bytes'
+        return response
+
+    def stream(self, request, record, etag):
+        path, size = blob_path(record.blob.sha256), record.blob.size
+        byte_range = None
+        # An If-Range naming other content asks for the whole file
+        if request.headers.get('If-Range', etag) == etag:
+            try:
+                byte_range = parse_range(request.headers.get('Range'), size)
+            except RangeNotSatisfiable:
+                response = Response({'error': 'Requested range not satisfiable'},
+                                    status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+                response['Content-Range'] = f'bytes */{size}'
+                return response
+
+        if byte_range is None:
+            return FileResponse(open(path, 'rb'), as_attachment=True, filename=record.file_name,
+                                content_type=record.content_type)
+        start, length = byte_range
+        response = StreamingHttpResponse(iter_range(path, start, length),
+                                         status=status.HTTP_206_PARTIAL_CONTENT,
+                                         content_type=record.content_type)
+        response['Content-Range'] = f'bytes {start}-{start + length - 1}/{size}'
+        response['Content-Length'] = str(length)
+        response['Content-Disposition'] = content_disposition_header(True, record.file_name)
+        return response
+
+
+class RecordUploadView(generics.CreateAPIView):
+    """
+    Start a resumable upload. The file is then sent to the returned upload
+    with PUT requests carrying `Content-Range: bytes start-end/size`.
+    """
+    serializer_class = RecordUploadSerializer
+    permission_classes = [IsAuthenticated]
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        upload = serializer.save()
+        return Response(upload_status(upload), status=status.HTTP_201_CREATED)
+
+
+class RecordUploadDetailView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get_upload(self, request, upload_id):
+        return RecordUpload.objects.filter(pk=upload_id, uploaded_by=request.user).first()
+
+    def get(self, request, upload_id):
+        # Where to resume an interrupted upload from
+        upload = self.get_upload(request, upload_id)
+        if upload is None:
+            return Response({'error': 'Upload not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(upload_status(upload))
+
+    def put(self, request, upload_id):
+        upload = self.get_upload(request, upload_id)
+        if upload is None:
+            return Response({'error': 'Upload not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        try:
+            # Once every byte is in, a repeated PUT retries finishing it
+            if upload.received < upload.size:
+                start, length = parse_content_range(request.headers.get('Content-Range'), upload.size)
+                if int(request.META.get('CONTENT_LENGTH') or 0) != length:
+                    raise UploadError('Content-Length must match Content-Range')
+                # The body is copied to disk as it is read, never held whole
+                write_chunk(upload, request.stream, start, length)
+                if upload.received < upload.size:
+                    return Response(upload_status(upload))
+            record = finish_upload(upload)
+        except UploadConflict as exc:
+            return Response({'error': str(exc), 'offset': exc.offset},
+                            status=status.HTTP_409_CONFLICT)
+        except UploadError as exc:
+            return Response({'error': str(exc), 'offset': upload.received},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return Response(MedicalRecordSerializer(record).data, status=status.HTTP_201_CREATED)
+
+    def delete(self, request, upload_id):
+        upload = self.get_upload(request, upload_id)
+        if upload is None:
+            return Response({'error': 'Upload not found'}, status=status.HTTP_404_NOT_FOUND)
+        discard_upload(upload)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class MedicineListView(generics.ListCreateAPIView):
+    """Medicines with the units left in unexpired batches; staff add new ones."""
+    serializer_class = MedicineSerializer
+
+    def get_permissions(self):
+        if self.request.method == 'POST':
+            return [IsStaffRole()]
+        return [IsAuthenticated()]
+
+    def get_queryset(self):
+        queryset = Medicine.objects.all()
+        if self.request.user.role == 'STUDENT':
+            queryset = queryset.filter(is_active=True)
+        return with_stock(queryset)
+
+
+class StockBatchListView(generics.ListCreateAPIView):
+    serializer_class = StockBatchSerializer
+    permission_classes = [IsStaffRole]
+
+    def get_medicine(self):
+        try:
+            return Medicine.objects.get(pk=self.kwargs['pk'])
+        except Medicine.DoesNotExist:
+            raise NotFound('Medicine not found')
+
+    def get_queryset(self):
+        return StockBatch.objects.filter(medicine=self.get_medicine())
+
+    def perform_create(self, serializer):
+        serializer.save(medicine=self.get_medicine())
+
+
+class OrderListView(generics.ListCreateAPIView):
+    serializer_class = OrderSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = OrderCursorPagination
+
+    def get_queryset(self):
+        queryset = Order.objects.select_related('patient').prefetch_related(
+            Prefetch('items', queryset=OrderItem.objects.select_related('medicine', 'batch')))
+        if self.request.user.role == 'STUDENT':
+            queryset = queryset.filter(patient=self.request.user)
+        return queryset
+
+    def create(self, request, *args, **kwargs):
+        serializer = PlaceOrderSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            order = place_order(request.user, serializer.validated_data['items'])
+        except InsufficientStock as e:
+            return Response({
+                'error': str(e),
+                'medicine_id': e.medicine.pk,
+                'available': e.available,
+            }, status=status.HTTP_409_CONFLICT)
+        except OrderError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(OrderSerializer(self.get_queryset().get(pk=order.pk)).data,
+                        status=status.HTTP_201_CREATED)
+
+
+class CancelOrderView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, pk):
+        orders = Order.objects.all()
+        if request.user.role == 'STUDENT':
+            orders = orders.filter(patient=request.user)
+        try:
+            order = orders.get(pk=pk)
+        except Order.DoesNotExist:
+            return Response({'error': 'Order not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        try:
+            cancel_order(order)
+        except OrderError as e:
+            return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
+        return Response({'id': order.pk, 'status': order.status})
+
+
+class PharmacySalesView(APIView):
+    """Daily and per-medicine sales for the pharmacy chart, from the rollup."""
+    permission_classes = [IsStaffRole]
+    max_days = 366
+
+    def get(self, request):
+        today = timezone.localdate()
+        try:
+            date_from, date_to = parse_date_range(
+                request.query_params, today - datetime.timedelta(days=29), 30, self.max_days)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(get_sales(date_from, date_to))
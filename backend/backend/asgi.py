@@ -3,6 +3,9 @@ ASGI config for backend project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Serve through an ASGI server (e.g. ``uvicorn backend.asgi:application``) so
+the /api/events/ streams run as async views instead of pinning a thread each.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
@@ -14,3 +17,9 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
 application = get_asgi_application()
+
+# Build the refresh token blacklist filter now, on a background thread,
+# rather than inside the first refresh request (see api.tokens)
+from api.tokens import blacklist_filter  # noqa: E402
+
+blacklist_filter.warm_in_background()
@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 
+from corsheaders.defaults import default_headers
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -50,6 +52,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -83,17 +86,76 @@ WSGI_APPLICATION = 'backend.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Run on every new SQLite connection. WAL lets readers carry on while a
+# write is in progress, and busy_timeout makes writers wait for the lock
+# instead of failing with "database is locked".
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,  # ms
+    'mmap_size': 268435456,  # 256 MiB
+    'cache_size': -65536,  # 64 MiB
+    'temp_store': 'MEMORY',
+    'foreign_keys': 'ON',
+}
+SQLITE_OPTIONS = {
+    'init_command': ';'.join(f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items()),
+    # Take the write lock at BEGIN so concurrent transactions queue on
+    # busy_timeout rather than deadlocking when a read upgrades to a write
+    'transaction_mode': 'IMMEDIATE',
+}
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'OPTIONS': SQLITE_OPTIONS,
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        # A file rather than the in-memory default, so tests can run
+        # concurrent connections against it
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
+    },
+    # Same file opened read-only, for GET requests of the list and detail
+    # views (see api.routers)
+    'readonly': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': f"file:{BASE_DIR / 'db.sqlite3'}?mode=ro",
+        'OPTIONS': {
+            'init_command': ';'.join(f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items()
+                                     if name != 'journal_mode'),
+        },
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'TEST': {'MIRROR': 'default'},
+    },
 }
 
+DATABASE_ROUTERS = ['api.routers.ReadOnlyRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
+AUTHENTICATION_BACKENDS = [
+    'api.backends.UIUIDBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+
+# New and re-hashed passwords use the first hasher; the others still verify
+# existing hashes. Argon2 is used when argon2-cffi is installed.
+PASSWORD_HASHERS = [
+    'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+try:
+    import argon2  # noqa: F401
+except ImportError:
+    pass
+else:
+    PASSWORD_HASHERS.insert(0, 'api.hashers.TunedArgon2PasswordHasher')
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -134,7 +196,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'api.authentication.CachedJWTAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
@@ -149,9 +211,158 @@ SIMPLE_JWT = {
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
     'ROTATE_REFRESH_TOKENS': True,
     'BLACKLIST_AFTER_ROTATION': True,
-    'UPDATE_LAST_LOGIN': True,
+    # LoginView records last_login through api.login.last_login_recorder,
+    # which batches the writes
+    'UPDATE_LAST_LOGIN': False,
     'ALGORITHM': 'HS256',
     'AUTH_HEADER_TYPES': ('Bearer',),
+    'TOKEN_REFRESH_SERIALIZER': 'api.tokens.FilteredTokenRefreshSerializer',
+}
+
+# In-process Bloom filter over blacklisted refresh tokens (see api.tokens)
+TOKEN_BLACKLIST_FILTER = {
+    'CAPACITY': 1_000_000,
+    'ERROR_RATE': 0.01,
+    # Upper bound, in seconds, on how long a token blacklisted by another
+    # worker can go unnoticed here
+    'SYNC_INTERVAL': 1.0,
+    'REBUILD_INTERVAL': 3600,
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# Server-side response caches, e.g. the doctor list (see api.conditional)
+RESPONSE_CACHE = {
+    'CACHE_ALIAS': 'default',
+    # Upper bound on staleness for changes made without model signals
+    'TIMEOUT': 300,
+}
+
+# Changelists of the large admin tables (see api.admin)
+ADMIN_CHANGELIST = {
+    'CACHE_ALIAS': 'default',
+    # Filtered changelists count at most this many rows
+    'COUNT_LIMIT': 10000,
+    'DATE_HIERARCHY_TIMEOUT': 300,
+}
+
+# Authenticated user cache (see api.authentication.UserCache)
+AUTH_USER_CACHE = {
+    'MAX_SIZE': 10000,
+    'TIMEOUT': 60,
+    # Name a CACHES alias here to share entries between worker processes
+    'CACHE_ALIAS': None,
+}
+
+# Appointment delta sync (see api.sync)
+APPOINTMENT_SYNC = {
+    'SETTLE_SECONDS': 5,
+    'TOMBSTONE_RETENTION_DAYS': 30,
+}
+
+# Appointment event streams (see api.events)
+EVENTS = {
+    # api.events.RedisBroker fans out across worker processes
+    'BACKEND': 'api.events.InProcessBroker',
+    'HEARTBEAT_SECONDS': 15,
+    'QUEUE_SIZE': 100,
+}
+
+# Password work factor and login concurrency (see api.hashers, api.login)
+PASSWORD_HASHING = {
+    'ARGON2_TIME_COST': 2,
+    'ARGON2_MEMORY_COST': 19456,  # KiB
+    'ARGON2_PARALLELISM': 1,
+}
+LOGIN_THROTTLING = {
+    # Logins hashing at once per process; roughly the number of cores
+    'HASH_WORKERS': 4,
+    'LAST_LOGIN_FLUSH_SECONDS': 5.0,
+    'LAST_LOGIN_MAX_PENDING': 500,
+}
+
+# Token-bucket rate limits for sign-in, sign-up and booking (see api.throttling)
+RATE_LIMITS = {
+    # api.throttling.CacheBucketStore shares buckets between worker
+    # processes through CACHE_ALIAS
+    'BACKEND': 'api.throttling.MemoryBucketStore',
+    'CACHE_ALIAS': 'default',
+    'STRIPES': 64,
+    'MAX_BUCKETS': 100000,
+    # Per view scope: a budget per client IP and per UIU ID (per email
+    # address for 'email'). A bucket holds the full budget, so short
+    # bursts up to it go through.
+    'RATES': {
+        'login': {'ip': '30/min', 'account': '10/min'},
+        'register': {'ip': '10/hour', 'account': '5/hour'},
+        'book': {'ip': '60/min', 'account': '20/min'},
+        # Verification and password reset mail
+        'email': {'ip': '10/hour', 'account': '3/hour'},
+    },
+}
+
+# Medical record files (see api.records). Content is stored once per
+# SHA-256 under ROOT/blobs; uploads in progress live under ROOT/uploads.
+MEDICAL_RECORDS = {
+    'ROOT': BASE_DIR / 'media' / 'records',
+    'MAX_FILE_BYTES': 200 * 1024 * 1024,
+    'MAX_CHUNK_BYTES': 8 * 1024 * 1024,
+    'LOCK_SECONDS': 120,
+    # Unfinished uploads older than this are removed by prune_uploads
+    'UPLOAD_EXPIRY_HOURS': 24,
+}
+
+# Background jobs (see api.jobs); run workers with `manage.py run_jobs`
+JOBS = {
+    'LEASE_SECONDS': 60,
+    'MAX_ATTEMPTS': 5,
+    # Retry n waits BACKOFF_SECONDS * 2**(n-1), up to MAX_BACKOFF_SECONDS
+    'BACKOFF_SECONDS': 30,
+    'MAX_BACKOFF_SECONDS': 3600,
+}
+
+# Outgoing email. `manage.py mailsink` runs a local stand-in on this port
+# that prints messages instead of delivering them.
+EMAIL_HOST = 'localhost'
+EMAIL_PORT = 1025
+DEFAULT_FROM_EMAIL = 'UIU Healthcare <no-reply@uiu.ac.bd>'
+
+# Links in account emails (see api.notifications)
+ACCOUNT_EMAILS = {
+    'FRONTEND_URL': 'http://localhost:5173',
+    'VERIFICATION_MAX_AGE_DAYS': 3,
+}
+
+# Idempotency-Key support for booking and registration (see api.idempotency)
+IDEMPOTENCY = {
+    # Retries with the same key get the stored response for this long;
+    # `manage.py prune_idempotency_keys` deletes expired keys
+    'TTL_HOURS': 24,
+    # How long a duplicate waits for the first request before a 409
+    'WAIT_SECONDS': 10,
+    # A request holding a key for longer is presumed dead and can be retried
+    'LOCK_SECONDS': 30,
+}
+
+# Per-view request metrics, served at /api/metrics/ (see api.middleware)
+METRICS = {
+    'ENABLED': True,
+    # Scrapers send `Authorization: Bearer <TOKEN>`; admins can always read it
+    'TOKEN': None,
+    # Addresses that may read /api/metrics/ without authenticating. Leave
+    # empty behind a local proxy, where every request comes from 127.0.0.1.
+    'ALLOWED_IPS': [],
+    # Log a warning when a request to the named URL runs more queries
+    'DEFAULT_QUERY_BUDGET': 20,
+    'QUERY_BUDGETS': {
+        'appointment-list': 4,
+        'appointment-detail': 3,
+        'doctor-list': 3,
+    },
 }
 
 # CORS settings
@@ -161,3 +372,6 @@ CORS_ALLOWED_ORIGINS = [
 ]
 
 CORS_ALLOW_CREDENTIALS = True
+
+CORS_ALLOW_HEADERS = (*default_headers, 'idempotency-key')
+CORS_EXPOSE_HEADERS = ['Idempotent-Replayed']
@@ -14,3 +14,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
 application = get_wsgi_application()
+
+# Build the refresh token blacklist filter now, on a background thread,
+# rather than inside the first refresh request (see api.tokens)
+from api.tokens import blacklist_filter  # noqa: E402
+
+blacklist_filter.warm_in_background()
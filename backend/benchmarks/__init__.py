@@ -0,0 +1,7 @@
+"""
+Benchmarks for the api app.
+
+Run from the backend directory, e.g. ``python -m benchmarks.auth_cache``.
+Each benchmark builds a throwaway test database, so it never touches
+db.sqlite3.
+"""
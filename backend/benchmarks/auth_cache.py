@@ -0,0 +1,41 @@
+"""
+Per-request cost of resolving the JWT user, with and without the cache.
+
+    python -m benchmarks.auth_cache [--iterations N]
+"""
+import argparse
+
+from benchmarks.utils import measure, report, test_database
+
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from api.authentication import CachedJWTAuthentication, user_cache
+from api.models import User
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--iterations', type=int, default=5000)
+    args = parser.parse_args()
+
+    with test_database():
+        user = User.objects.create_user(
+            username='011221001', uiu_id='011221001', password='benchmark-pass')
+        token = str(RefreshToken.for_user(user).access_token)
+        request = APIRequestFactory().get(
+            '/api/profile/', HTTP_AUTHORIZATION=f'Bearer {token}')
+
+        rows = {}
+        for name, authenticator in (('JWTAuthentication', JWTAuthentication()),
+                                    ('CachedJWTAuthentication', CachedJWTAuthentication())):
+            user_cache.clear()
+            authenticator.authenticate(request)  # warm up
+            rows[name] = measure(lambda: authenticator.authenticate(request), args.iterations)
+
+        report(f'JWT user resolution ({args.iterations} requests)', rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+"""
+Mixed booking and list-read throughput against a file-backed SQLite
+database, with the stock connection settings and with the tuned profile
+from settings.DATABASES (WAL pragmas, IMMEDIATE transactions, persistent
+connections and the read-only alias).
+
+    python -m benchmarks.db_concurrency [--threads N] [--ops N] [--write-ratio F]
+"""
+import argparse
+import copy
+import datetime
+import os
+import random
+import tempfile
+import threading
+import time
+
+from benchmarks.utils import report, summarize, test_database
+
+from django.db import connections
+from django.test import Client, override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api.authentication import user_cache
+from api.models import Appointment, User
+
+
+def worker(index, args, token, doctors, results, errors, barrier):
+    client = Client(raise_request_exception=False, HTTP_AUTHORIZATION=f'Bearer {token}')
+    rng = random.Random(index)
+    base = datetime.date(2030, 1, 1)
+    barrier.wait()
+    for op in range(args.ops):
+        start = time.perf_counter()
+        if rng.random() < args.write_ratio:
+            kind = 'bookings'
+            response = client.post('/api/appointments/book/', {
+                'doctor_id': doctors[op % len(doctors)],
+                'date': (base + datetime.timedelta(days=index * args.ops + op)).isoformat(),
+                'time': '09:00 AM',
+                'reason': 'Benchmark',
+            }, content_type='application/json')
+            ok = response.status_code == 201
+        else:
+            kind = 'reads'
+            ok = client.get('/api/appointments/').status_code == 200
+        results[kind].append(time.perf_counter() - start)
+        if not ok:
+            errors[kind] += 1
+    connections.close_all()
+
+
+def run(args, tokens, doctors):
+    results = {'reads': [], 'bookings': []}
+    errors = {'reads': 0, 'bookings': 0}
+    barrier = threading.Barrier(args.threads + 1)
+    threads = [threading.Thread(target=worker, args=(i, args, tokens[i], doctors, results, errors, barrier))
+               for i in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+    rows = {}
+    for kind, timings in results.items():
+        row = summarize(timings, errors=errors[kind])
+        row['ops_per_sec'] = len(timings) / wall
+        rows[kind] = row
+    return rows
+
+
+def configure(profile, path):
+    default, readonly = connections['default'].settings_dict, connections['readonly'].settings_dict
+    default.update(copy.deepcopy(profile['default']))
+    readonly.update(copy.deepcopy(profile['readonly']))
+    default['NAME'] = path
+    # Pointing the alias at the same name makes the router keep reads on default
+    readonly['NAME'] = f'file:{path}?mode=ro' if profile['use_readonly'] else path
+    connections.close_all()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--ops', type=int, default=200, help='Requests per thread')
+    parser.add_argument('--write-ratio', type=float, default=0.2)
+    parser.add_argument('--seed-appointments', type=int, default=2000)
+    args = parser.parse_args()
+
+    tuned = {
+        'default': {key: connections['default'].settings_dict[key]
+                    for key in ('OPTIONS', 'CONN_MAX_AGE', 'CONN_HEALTH_CHECKS')},
+        'readonly': {key: connections['readonly'].settings_dict[key]
+                     for key in ('OPTIONS', 'CONN_MAX_AGE', 'CONN_HEALTH_CHECKS')},
+        'use_readonly': True,
+    }
+    stock = {
+        'default': {'OPTIONS': {}, 'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': False},
+        'readonly': {'OPTIONS': {}, 'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': False},
+        'use_readonly': False,
+    }
+
+    path = os.path.join(tempfile.mkdtemp(), 'benchmark.sqlite3')
+    connections['default'].settings_dict['TEST']['NAME'] = path
+    configure(stock, path)
+    # Lift the rate limits, or most requests would measure a 429
+    with test_database(), override_settings(RATE_LIMITS={}):
+        doctors = User.objects.bulk_create(
+            User(username=f'D{i:03d}', uiu_id=f'D{i:03d}', role='STAFF') for i in range(20))
+        patients = User.objects.bulk_create(
+            User(username=f'0112{i:05d}', uiu_id=f'0112{i:05d}') for i in range(args.threads))
+        Appointment.objects.bulk_create(
+            Appointment(patient=patients[i % len(patients)], doctor=doctors[i % len(doctors)],
+                        date=datetime.date(2025, 1, 1) + datetime.timedelta(days=i // 50),
+                        time='10:00 AM', reason='Seed')
+            for i in range(args.seed_appointments))
+        tokens = [str(AccessToken.for_user(patient)) for patient in patients]
+        doctor_ids = [doctor.uiu_id for doctor in doctors]
+
+        rows = {}
+        for name, profile in (('stock', stock), ('tuned', tuned)):
+            configure(profile, path)
+            if name == 'stock':
+                with connections['default'].cursor() as cursor:
+                    cursor.execute('PRAGMA journal_mode=DELETE')
+            user_cache.clear()
+            Appointment.objects.filter(reason='Benchmark').delete()
+            for kind, row in run(args, tokens, doctor_ids).items():
+                rows[f'{name} {kind}'] = row
+        connections.close_all()
+
+    report(f'{args.threads} threads x {args.ops} requests, '
+           f'{args.write_ratio:.0%} bookings', rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""
+Fan-out latency of appointment status events through the real ASGI
+application: opens many idle /api/events/ streams on one event loop, then
+publishes events from another thread (as a sync view would) and measures
+how long each takes to reach every subscribed stream.
+
+    python -m benchmarks.event_fanout [--connections N] [--users N] [--events N]
+"""
+import argparse
+import asyncio
+import json
+import resource
+import threading
+import time
+
+from benchmarks.utils import report, summarize, test_database
+
+from django.core.asgi import get_asgi_application
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api.events import broker
+from api.models import User
+
+
+def make_scope(token):
+    return {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+        'method': 'GET', 'scheme': 'http', 'path': '/api/events/', 'raw_path': b'/api/events/',
+        'query_string': f'token={token}'.encode(), 'root_path': '',
+        'headers': [(b'host', b'testserver')],
+        'client': ('127.0.0.1', 50000), 'server': ('testserver', 80),
+    }
+
+
+async def run(args, tokens):
+    application = get_asgi_application()
+    latencies = []
+    delivered = streaming = 0
+    all_delivered = asyncio.Event()
+    expected = args.events * (args.connections // args.users)
+    disconnect = asyncio.Event()
+
+    def make_receive():
+        requested = False
+
+        async def receive():
+            nonlocal requested
+            if not requested:
+                requested = True
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+            await disconnect.wait()
+            return {'type': 'http.disconnect'}
+        return receive
+
+    async def send(message):
+        nonlocal delivered, streaming
+        if message['type'] != 'http.response.body':
+            return
+        now = time.perf_counter()
+        for block in message.get('body', b'').decode().split('\n\n'):
+            for line in block.splitlines():
+                if line.startswith('retry: '):
+                    streaming += 1
+                elif line.startswith('data: '):
+                    latencies.append(now - json.loads(line[6:])['sent_at'])
+                    delivered += 1
+        if delivered >= expected:
+            all_delivered.set()
+
+    start = time.perf_counter()
+    tasks = [asyncio.create_task(application(make_scope(tokens[i % len(tokens)]), make_receive(), send))
+             for i in range(args.connections)]
+    # Wait until every stream has its response headers and first chunk out
+    while streaming < args.connections:
+        await asyncio.sleep(0.05)
+    assert broker.connection_count() == args.connections
+    print(f'Opened {args.connections} streams in {time.perf_counter() - start:.2f}s, '
+          f'max RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MiB')
+
+    # Publish from a separate thread, cycling through the users
+    user_ids = args.user_ids
+
+    def publisher():
+        for sequence in range(args.events):
+            user_id = user_ids[sequence % len(user_ids)]
+            broker.publish([user_id], {'type': 'appointment.status', 'id': sequence,
+                                       'status': 'confirmed', 'sent_at': time.perf_counter()})
+            time.sleep(args.interval)
+
+    thread = threading.Thread(target=publisher)
+    thread.start()
+    try:
+        await asyncio.wait_for(all_delivered.wait(), timeout=60)
+    finally:
+        thread.join()
+        disconnect.set()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--connections', type=int, default=5000)
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--events', type=int, default=500)
+    parser.add_argument('--interval', type=float, default=0.002,
+                        help='Seconds between published events')
+    args = parser.parse_args()
+
+    with test_database():
+        users = User.objects.bulk_create(
+            User(username=f'0112{i:05d}', uiu_id=f'0112{i:05d}') for i in range(args.users))
+        args.user_ids = [user.pk for user in users]
+        tokens = [str(AccessToken.for_user(user)) for user in users]
+        latencies = asyncio.run(run(args, tokens))
+
+    report(f'Event fan-out: {args.connections} streams, {args.users} users, '
+           f'{args.events} events', {'delivery latency': summarize(latencies)})
+
+
+if __name__ == '__main__':
+    main()
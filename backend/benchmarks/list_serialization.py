@@ -0,0 +1,77 @@
+"""
+Serializing 10k appointments and 10k users through the DRF serializers
+and JSONRenderer versus the values_list() fast path and FastJSONRenderer
+used by the list views. Also checks both paths produce the same JSON.
+
+    python -m benchmarks.list_serialization [--rows N] [--iterations N]
+"""
+import argparse
+import datetime
+import json
+
+from benchmarks.utils import measure, report, test_database
+
+from rest_framework.renderers import JSONRenderer
+
+from api.exports import (APPOINTMENT_COLUMNS, APPOINTMENT_VALUES, USER_COLUMNS, appointment_row,
+                         user_rows)
+from api.models import Appointment, User
+from api.renderers import FastJSONRenderer
+from api.serializers import AppointmentSerializer, UserSerializer
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--iterations', type=int, default=5)
+    args = parser.parse_args()
+
+    with test_database():
+        doctors = User.objects.bulk_create(
+            User(username=f'D{i:05d}', uiu_id=f'D{i:05d}', role='STAFF',
+                 first_name='Doctor', last_name=str(i), email=f'd{i}@uiu.ac.bd')
+            for i in range(args.rows))
+        patients = User.objects.bulk_create(
+            User(username=f'0112{i:05d}', uiu_id=f'0112{i:05d}') for i in range(100))
+        Appointment.objects.bulk_create(
+            Appointment(patient=patients[i % len(patients)], doctor=doctors[i % 50],
+                        date=datetime.date(2025, 1, 1) + datetime.timedelta(days=i // 40),
+                        time='10:00 AM', reason=f'Reason {i}', notes=None if i % 2 else 'Note')
+            for i in range(args.rows))
+
+        appointments = Appointment.objects.with_users().order_by('-date', '-time', 'id')
+        staff = User.objects.filter(role='STAFF')
+        slow, fast = JSONRenderer(), FastJSONRenderer()
+
+        def appointments_serializer():
+            return slow.render(AppointmentSerializer(appointments.all(), many=True).data)
+
+        def appointments_fast_path():
+            return fast.render([dict(zip(APPOINTMENT_COLUMNS, appointment_row(values)))
+                                for values in appointments.values_list(*APPOINTMENT_VALUES)])
+
+        def users_serializer():
+            return slow.render(UserSerializer(staff.all(), many=True).data)
+
+        def users_fast_path():
+            return fast.render([dict(zip(USER_COLUMNS, row)) for row in user_rows(staff.all())])
+
+        for before, after in ((appointments_serializer, appointments_fast_path),
+                              (users_serializer, users_fast_path)):
+            expected, actual = before(), after()
+            assert json.loads(expected) == json.loads(actual), f'{after.__name__} output differs'
+            print(f'{after.__name__}: output identical '
+                  f'({"byte-for-byte" if expected == actual else "after parsing"})')
+
+        rows = {
+            'appointments: DRF': measure(appointments_serializer, args.iterations),
+            'appointments: fast': measure(appointments_fast_path, args.iterations),
+            'users: DRF': measure(users_serializer, args.iterations),
+            'users: fast': measure(users_fast_path, args.iterations),
+        }
+
+    report(f'List serialization ({args.rows} rows)', rows)
+
+
+if __name__ == '__main__':
+    main()
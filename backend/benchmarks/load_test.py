@@ -0,0 +1,275 @@
+"""
+Load test of the main API routes against a seeded synthetic campus (see
+api.seeding). Concurrent clients drive the real URL routes through the
+full middleware stack and every scenario reports p50/p95/p99 latency,
+throughput and queries per request.
+
+Results are written as JSON. Pass an earlier file as --baseline to compare
+against it; the run exits non-zero when a scenario's p50, p95 or throughput
+got worse by more than --threshold percent, or it runs more queries per request.
+
+    python -m benchmarks.load_test [--appointments N] [--clients N] [--requests N]
+        [--scenario NAME ...] [--reuse-db] [--output FILE] [--baseline FILE]
+
+Seeding the full campus takes a few minutes; --reuse-db keeps the seeded
+test database between runs.
+"""
+import argparse
+import datetime
+import itertools
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+
+from benchmarks.utils import report, summarize, test_database
+
+import django
+from django.db import connection, connections
+from django.test import Client, override_settings
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api.models import Appointment, User
+from api.seeding import DEFAULT_PASSWORD, WORKDAYS, day_slots, seed_campus
+
+RESULTS_DIR = Path(__file__).resolve().parent / 'results'
+# Compared against the baseline. p99 is reported but too noisy at these
+# request counts to fail a run on.
+LATENCY_METRICS = ('p50_ms', 'p95_ms', 'p99_ms')
+GATED_METRICS = ('p50_ms', 'p95_ms')
+# Cache hits make query counts vary a little between runs
+QUERY_TOLERANCE = 0.5
+
+
+@dataclass
+class Scenario:
+    name: str
+    role: str
+    method: str
+    path: str
+    expected: int = 200
+    # Share of --requests this scenario runs, for the expensive ones
+    weight: float = 1.0
+
+
+SCENARIOS = [
+    Scenario('appointments:student', 'STUDENT', 'GET', '/api/appointments/'),
+    Scenario('appointments:doctor', 'DOCTOR', 'GET', '/api/appointments/'),
+    Scenario('appointments:admin', 'ADMIN', 'GET', '/api/appointments/'),
+    Scenario('appointments:emergency', 'ADMIN', 'GET', '/api/appointments/?emergency=true'),
+    Scenario('appointment-detail', 'STUDENT', 'GET', '/api/appointments/{appointment}/'),
+    Scenario('doctors', 'STUDENT', 'GET', '/api/doctors/'),
+    Scenario('stats:admin', 'ADMIN', 'GET', '/api/stats/'),
+    Scenario('book', 'STUDENT', 'POST', '/api/appointments/book/', expected=201),
+    # Each login pays for a full password hash
+    Scenario('login', 'STUDENT', 'POST', '/api/login/', weight=0.05),
+]
+
+
+class Campus:
+    """Who can be signed in as, and what they can ask for."""
+
+    def __init__(self, future_days, seed):
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        users = {
+            'STUDENT': User.objects.filter(role='STUDENT', patient_appointments__isnull=False)
+                                   .distinct().order_by('pk')[:500],
+            'DOCTOR': User.objects.filter(uiu_id__startswith='DOC').order_by('pk'),
+            'ADMIN': User.objects.filter(role='ADMIN').order_by('pk'),
+        }
+        self.users = {role: list(queryset) for role, queryset in users.items()}
+        self.tokens = {user.pk: str(AccessToken.for_user(user))
+                       for role_users in self.users.values() for user in role_users}
+        self.appointments = {
+            user.pk: list(Appointment.objects.filter(patient=user).values_list('pk', flat=True)[:20])
+            for user in self.users['STUDENT']}
+        # Free slots after the seeded horizon, handed out one per booking
+        first_day = timezone.localdate() + datetime.timedelta(days=future_days + 1)
+        days = (first_day + datetime.timedelta(days=offset) for offset in itertools.count())
+        self.free_slots = (
+            (doctor.uiu_id, day.isoformat(), slot.strftime('%I:%M %p'))
+            for day in days if day.weekday() in WORKDAYS
+            for doctor in self.users['DOCTOR'] for slot in day_slots())
+
+    def pick(self, role):
+        with self.lock:
+            return self.rng.choice(self.users[role])
+
+    def request(self, scenario):
+        """(user, path, body) for one request of `scenario`."""
+        user = self.pick(scenario.role)
+        path, body = scenario.path, None
+        if '{appointment}' in path:
+            with self.lock:
+                path = path.format(appointment=self.rng.choice(self.appointments[user.pk]))
+        if scenario.name == 'book':
+            with self.lock:
+                doctor_id, day, slot = next(self.free_slots)
+            body = {'doctor_id': doctor_id, 'date': day, 'time': slot, 'reason': 'Load test'}
+        elif scenario.name == 'login':
+            body = {'uiuId': user.uiu_id, 'password': DEFAULT_PASSWORD}
+        return user, path, body
+
+
+def run_scenario(campus, scenario, requests, clients, warmup):
+    timings, queries, failures = [], [], []
+
+    def client_loop(count, record):
+        client = Client()
+        executed = [0]
+
+        def count_query(execute, sql, params, many, context):
+            executed[0] += 1
+            return execute(sql, params, many, context)
+
+        try:
+            with connection.execute_wrapper(count_query):
+                for _ in range(count):
+                    user, path, body = campus.request(scenario)
+                    headers = {'HTTP_AUTHORIZATION': f'Bearer {campus.tokens[user.pk]}'}
+                    before = executed[0]
+                    start = time.perf_counter()
+                    if scenario.method == 'GET':
+                        response = client.get(path, **headers)
+                    else:
+                        response = client.post(path, body, content_type='application/json', **headers)
+                    elapsed = time.perf_counter() - start
+                    if not record:
+                        continue
+                    timings.append(elapsed)
+                    queries.append(executed[0] - before)
+                    if response.status_code != scenario.expected:
+                        failures.append(response.status_code)
+        finally:
+            connections.close_all()
+
+    def spread(total):
+        return [total // clients + (1 if i < total % clients else 0) for i in range(clients)]
+
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        list(pool.map(lambda count: client_loop(count, False), spread(warmup)))
+        start = time.perf_counter()
+        list(pool.map(lambda count: client_loop(count, True), spread(requests)))
+        wall = time.perf_counter() - start
+
+    row = summarize(timings, queries=sum(queries))
+    row['ops_per_sec'] = len(timings) / wall
+    row['max_queries'] = max(queries, default=0)
+    row['errors'] = len(failures)
+    if failures:
+        print(f'{scenario.name}: {len(failures)} unexpected responses, e.g. {failures[:5]}')
+    return row
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, threshold):
+    """Print the change against `baseline` and return the regressed scenarios."""
+    rows, regressed = {}, []
+    for name, row in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        change = {metric: (row[metric] - before[metric]) / before[metric] * 100 if before[metric] else 0.0
+                  for metric in (*LATENCY_METRICS, 'ops_per_sec')}
+        change['queries_per_op'] = row['queries_per_op'] - before['queries_per_op']
+        if (any(change[metric] > threshold for metric in GATED_METRICS) or
+                change['ops_per_sec'] < -threshold or change['queries_per_op'] >= QUERY_TOLERANCE):
+            regressed.append(name)
+        rows[name] = {f'{metric} %' if metric != 'queries_per_op' else 'queries +': value
+                      for metric, value in change.items()}
+    report(f'Change against baseline (regression: p50, p95 or throughput off by more than '
+           f'{threshold:g}%, or {QUERY_TOLERANCE:g}+ more queries per request)', rows)
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--students', type=int, default=30000)
+    parser.add_argument('--staff', type=int, default=200)
+    parser.add_argument('--appointments', type=int, default=2_000_000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--future-days', type=int, default=14)
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=1000, help='Measured requests per scenario')
+    parser.add_argument('--warmup', type=int, default=50)
+    parser.add_argument('--scenario', action='append', choices=[s.name for s in SCENARIOS],
+                        help='Run only these scenarios (repeatable)')
+    parser.add_argument('--reuse-db', action='store_true',
+                        help='Keep the seeded test database and reuse it on the next run')
+    parser.add_argument('--output', type=Path)
+    parser.add_argument('--baseline', type=Path)
+    parser.add_argument('--threshold', type=float, default=10.0)
+    args = parser.parse_args()
+
+    scenarios = [s for s in SCENARIOS if not args.scenario or s.name in args.scenario]
+    results = {}
+    # Lift the rate limits, or most requests would measure a 429
+    with test_database(keepdb=args.reuse_db), override_settings(RATE_LIMITS={}):
+        if not Appointment.objects.exists():
+            start = time.perf_counter()
+            seed_campus(args.students, args.staff, args.appointments, args.seed, args.future_days)
+            print(f'Seeded the campus in {time.perf_counter() - start:.0f}s')
+        else:
+            # A reused database may hold bookings from the last run
+            Appointment.objects.filter(reason='Load test').delete()
+        dataset = {
+            'students': User.objects.filter(role='STUDENT').count(),
+            'staff': User.objects.filter(role='STAFF').count(),
+            'appointments': Appointment.objects.count(),
+        }
+        campus = Campus(args.future_days, args.seed)
+        for scenario in scenarios:
+            requests = max(1, round(args.requests * scenario.weight))
+            warmup = min(args.warmup, requests)
+            results[scenario.name] = run_scenario(campus, scenario, requests, args.clients, warmup)
+        if args.reuse_db:
+            Appointment.objects.filter(reason='Load test').delete()
+
+    report(f'Load test: {args.clients} clients, {dataset["appointments"]} appointments', results)
+
+    output = args.output or RESULTS_DIR / f'load_test-{datetime.datetime.now():%Y%m%d-%H%M%S}.json'
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps({
+        'meta': {
+            'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'cpus': os.cpu_count(),
+            'clients': args.clients,
+            'requests': args.requests,
+            'seed': args.seed,
+            'dataset': dataset,
+        },
+        'scenarios': results,
+    }, indent=2))
+    print(f'\nResults written to {output}')
+
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text())['scenarios']
+        regressed = compare(results, baseline, args.threshold)
+        if regressed:
+            print(f'Regressed: {", ".join(regressed)}')
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
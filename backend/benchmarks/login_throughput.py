@@ -0,0 +1,124 @@
+"""
+Login throughput through the real ASGI application with many clients
+signing in at once, and the latency of other (sync) requests made while the
+burst is in flight.
+
+    python -m benchmarks.login_throughput [--logins N] [--concurrency 1,8,32]
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from benchmarks.utils import report, summarize, test_database
+
+from django.contrib.auth import authenticate
+from django.contrib.auth.hashers import get_hasher
+from django.core.asgi import get_asgi_application
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api.login import last_login_recorder
+from api.models import User
+
+PASSWORD = 'benchmark-pass'
+
+
+def make_scope(method, path, body, token):
+    headers = [(b'host', b'testserver'), (b'content-type', b'application/json'),
+               (b'content-length', str(len(body)).encode())]
+    if token:
+        headers.append((b'authorization', f'Bearer {token}'.encode()))
+    return {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+        'method': method, 'scheme': 'http', 'path': path, 'raw_path': path.encode(),
+        'query_string': b'', 'root_path': '',
+        'headers': headers,
+        'client': ('127.0.0.1', 50000), 'server': ('testserver', 80),
+    }
+
+
+async def request(application, method, path, body=b'', token=None):
+    sent = False
+    status = None
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+        await asyncio.Event().wait()
+
+    async def send(message):
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+
+    start = time.perf_counter()
+    await application(make_scope(method, path, body, token), receive, send)
+    return status, time.perf_counter() - start
+
+
+async def burst(application, uiu_ids, concurrency, token):
+    semaphore = asyncio.Semaphore(concurrency)
+    logins, probes = [], []
+    done = asyncio.Event()
+
+    async def login(uiu_id):
+        async with semaphore:
+            body = json.dumps({'uiuId': uiu_id, 'password': PASSWORD}).encode()
+            status, elapsed = await request(application, 'POST', '/api/login/', body)
+            assert status == 200, status
+            logins.append(elapsed)
+
+    async def probe():
+        while not done.is_set():
+            status, elapsed = await request(application, 'GET', '/api/doctors/', token=token)
+            assert status == 200, status
+            probes.append(elapsed)
+            await asyncio.sleep(0.01)
+
+    prober = asyncio.create_task(probe())
+    start = time.perf_counter()
+    await asyncio.gather(*(login(uiu_id) for uiu_id in uiu_ids))
+    wall = time.perf_counter() - start
+    done.set()
+    await prober
+    return logins, probes, wall
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--logins', type=int, default=64)
+    parser.add_argument('--concurrency', default='1,8,32')
+    args = parser.parse_args()
+
+    # Lift the rate limits, or most requests would measure a 429
+    with test_database(), override_settings(RATE_LIMITS={}):
+        template = User()
+        template.set_password(PASSWORD)
+        uiu_ids = [f'0112{i:05d}' for i in range(args.logins)]
+        User.objects.bulk_create(
+            User(username=uiu_id, uiu_id=uiu_id, password=template.password) for uiu_id in uiu_ids)
+
+        with CaptureQueriesContext(connection) as queries:
+            authenticate(uiu_id=uiu_ids[0], password=PASSWORD)
+        print(f'Hasher: {get_hasher().algorithm}; queries per authenticate(): {len(queries)}')
+
+        token = str(AccessToken.for_user(User.objects.get(uiu_id=uiu_ids[0])))
+        application = get_asgi_application()
+        rows = {}
+        for level in (int(value) for value in args.concurrency.split(',')):
+            logins, probes, wall = asyncio.run(burst(application, uiu_ids, level, token))
+            row = summarize(logins)
+            row['ops_per_sec'] = len(logins) / wall
+            rows[f'login x{level}'] = row
+            rows[f'  doctors during x{level}'] = summarize(probes)
+        last_login_recorder.flush()
+
+    report(f'Login burst ({args.logins} sign-ins per level)', rows)
+
+
+if __name__ == '__main__':
+    main()
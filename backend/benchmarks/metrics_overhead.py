@@ -0,0 +1,55 @@
+"""
+Per-request cost of MetricsMiddleware around a trivial view, and of the
+query recorder around a single query.
+
+    python -m benchmarks.metrics_overhead [--iterations N]
+"""
+import argparse
+
+from benchmarks.utils import measure, report, test_database
+
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory
+from django.urls import resolve
+
+from api.metrics import QueryStats, current_queries, record_query, reset_metrics
+from api.middleware import MetricsMiddleware
+from api.models import User
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--iterations', type=int, default=4000)
+    args = parser.parse_args()
+
+    request = RequestFactory().get('/api/appointments/')
+    request.resolver_match = resolve('/api/appointments/')
+    response = HttpResponse(b'{}' * 512)
+
+    def view(request):
+        return response
+
+    middleware = MetricsMiddleware(view)
+    rows = {
+        'bare view': measure(lambda: view(request), args.iterations),
+        'with middleware': measure(lambda: middleware(request), args.iterations),
+    }
+
+    with test_database():
+        User.objects.create(username='011221001', uiu_id='011221001')
+        assert record_query in connection.execute_wrappers
+        query = User.objects.filter(uiu_id='011221001')
+        rows['query'] = measure(lambda: query.exists(), args.iterations)
+        token = current_queries.set(QueryStats())
+        try:
+            rows['query, recorded'] = measure(lambda: query.exists(), args.iterations)
+        finally:
+            current_queries.reset(token)
+    reset_metrics()
+
+    report(f'Metrics overhead ({args.iterations} iterations)', rows)
+
+
+if __name__ == '__main__':
+    main()
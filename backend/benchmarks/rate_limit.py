@@ -0,0 +1,61 @@
+"""
+Cost of one rate-limit check: the in-memory token-bucket store with one
+lock or striped, from one thread or several, and the cache-backed store.
+
+    python -m benchmarks.rate_limit [--checks N] [--threads N] [--clients N]
+"""
+import argparse
+import threading
+import time
+
+from benchmarks.utils import report, summarize
+
+from api.throttling import CacheBucketStore, MemoryBucketStore
+
+
+def run(store, checks, threads, clients):
+    """Per-check latencies and overall checks per second across `threads`."""
+    timings = []
+    barrier = threading.Barrier(threads + 1)
+
+    def worker(index):
+        local = []
+        keys = [f'login:ip:10.0.{index}.{i}' for i in range(clients)]
+        barrier.wait()
+        for n in range(checks):
+            start = time.perf_counter()
+            store.consume(keys[n % clients], 30, 0.5)
+            local.append(time.perf_counter() - start)
+        timings.extend(local)
+
+    workers = [threading.Thread(target=worker, args=(index,)) for index in range(threads)]
+    for thread in workers:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in workers:
+        thread.join()
+    row = summarize(timings)
+    row['ops_per_sec'] = len(timings) / (time.perf_counter() - start)
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--checks', type=int, default=100000, help='Checks per run, split across the threads')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--clients', type=int, default=1000, help='Distinct keys per thread')
+    args = parser.parse_args()
+
+    rows = {}
+    for threads in (1, args.threads):
+        for name, store in (('memory, 1 lock', MemoryBucketStore(stripes=1)),
+                            ('memory, 64 stripes', MemoryBucketStore(stripes=64)),
+                            ('locmem cache', CacheBucketStore())):
+            rows[f'{name} x{threads}'] = run(store, args.checks // threads, threads, args.clients)
+
+    report(f'Rate-limit checks ({args.checks} per run)', rows)
+
+
+if __name__ == '__main__':
+    main()
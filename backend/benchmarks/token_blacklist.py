@@ -0,0 +1,94 @@
+"""
+Blacklist check cost against a large token_blacklist table, with and
+without the in-process Bloom filter, plus warm-up and prune timings.
+
+    python -m benchmarks.token_blacklist [--rows N] [--iterations N]
+"""
+import argparse
+import datetime
+import time
+import uuid
+
+from benchmarks.utils import measure, report, test_database
+
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken as BaseRefreshToken
+
+from api.tokens import RefreshToken, blacklist_filter
+
+
+def populate(rows, expired_fraction=0.5):
+    """Blacklist `rows` random JTIs; the oldest `expired_fraction` are expired."""
+    now = timezone.now()
+    expired_until = int(rows * expired_fraction)
+    outstanding_table = OutstandingToken._meta.db_table
+    blacklisted_table = BlacklistedToken._meta.db_table
+    batch = 50000
+    with transaction.atomic(), connection.cursor() as cursor:
+        for start in range(0, rows, batch):
+            outstanding, blacklisted = [], []
+            for row_id in range(start + 1, min(rows, start + batch) + 1):
+                expires = now + datetime.timedelta(days=-1 if row_id <= expired_until else 7)
+                stamp = expires.strftime('%Y-%m-%d %H:%M:%S')
+                outstanding.append((row_id, uuid.uuid4().hex, '', stamp, stamp))
+                blacklisted.append((row_id, row_id, stamp))
+            cursor.executemany(
+                f'INSERT INTO {outstanding_table} (id, jti, token, created_at, expires_at) '
+                f'VALUES (%s, %s, %s, %s, %s)', outstanding)
+            cursor.executemany(
+                f'INSERT INTO {blacklisted_table} (id, token_id, blacklisted_at) '
+                f'VALUES (%s, %s, %s)', blacklisted)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--iterations', type=int, default=5000)
+    args = parser.parse_args()
+
+    with test_database():
+        start = time.perf_counter()
+        populate(args.rows)
+        print(f'Inserted {args.rows} blacklisted tokens in {time.perf_counter() - start:.1f}s')
+
+        start = time.perf_counter()
+        blacklist_filter.warm()
+        print(f'Warmed filter in {time.perf_counter() - start:.2f}s: '
+              f'{blacklist_filter.bloom.count} entries, '
+              f'{blacklist_filter.bloom.size_in_bytes / 1024 / 1024:.2f} MiB, '
+              f'{blacklist_filter.bloom.num_hashes} hashes')
+
+        # Fresh tokens are the common case on refresh: never blacklisted
+        fresh_base, fresh = BaseRefreshToken(), RefreshToken()
+        revoked_jti = OutstandingToken.objects.filter(
+            expires_at__gt=timezone.now()).values_list('jti', flat=True).first()
+        revoked = RefreshToken()
+        revoked.payload['jti'] = revoked_jti
+
+        def check_revoked():
+            try:
+                revoked.check_blacklist()
+            except Exception:
+                pass
+
+        rows = {
+            'db, fresh token': measure(fresh_base.check_blacklist, args.iterations),
+            'filter, fresh token': measure(fresh.check_blacklist, args.iterations),
+            'filter, revoked token': measure(check_revoked, args.iterations),
+        }
+        report(f'Blacklist check, {args.rows} rows ({args.iterations} checks)', rows)
+
+        false_positives = sum(blacklist_filter.bloom.might_contain(uuid.uuid4().hex)
+                              for _ in range(100000))
+        print(f'\nFalse positive rate: {false_positives / 100000:.4%}')
+
+        start = time.perf_counter()
+        call_command('prune_tokens', batch_size=10000)
+        print(f'prune_tokens took {time.perf_counter() - start:.1f}s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+Semester onboarding: creating an intake of users one registration at a time
+(RegisterSerializer, as RegisterView does) versus api.provisioning's CSV
+import, then password checks and hashing on their own, serially and in the process
+pool.
+
+The first part swaps in a fast hasher so it measures validation and
+inserts; at the default PBKDF2 cost hashing dominates both paths equally
+and is what the second part measures.
+
+    python -m benchmarks.user_import [--users N] [--registrations N] [--hash-sample N] [--workers N]
+"""
+import argparse
+import time
+
+from benchmarks.utils import report, summarize, test_database
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from api.models import User
+from api.provisioning import hash_passwords, import_users
+from api.serializers import RegisterSerializer
+
+FAST_HASHER = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+
+def make_rows(count, offset=0):
+    rows = []
+    for i in range(offset, offset + count):
+        uiu_id = f'0112{i:06d}' if i % 50 else f'DOC{i:06d}'
+        rows.append((i + 2, {
+            'uiu_id': uiu_id, 'name': f'Student {i}', 'email': f'{uiu_id}@example.edu',
+            'password': f'Onboard#{i:06d}xz', 'phone': '01700000000',
+        }))
+    return rows
+
+
+def register_one_by_one(rows):
+    timings = []
+    with CaptureQueriesContext(connection) as queries:
+        for _, row in rows:
+            start = time.perf_counter()
+            serializer = RegisterSerializer(data={**row, 'confirmPassword': row['password']})
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
+            timings.append(time.perf_counter() - start)
+    return timings, len(queries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=20000)
+    parser.add_argument('--registrations', type=int, default=2000,
+                        help='Users created through RegisterSerializer, for comparison')
+    parser.add_argument('--hash-sample', type=int, default=32)
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    rows = {}
+    with test_database(), override_settings(PASSWORD_HASHERS=FAST_HASHER):
+        # Existing users, so the uniqueness checks have something to find
+        User.objects.bulk_create(User(username=f'EXISTING{i}', uiu_id=f'EXISTING{i}')
+                                 for i in range(5000))
+
+        timings, queries = register_one_by_one(make_rows(args.registrations))
+        total = sum(timings)
+        rows['RegisterSerializer'] = summarize(timings, queries=queries,
+                                               users_per_sec=len(timings) / total)
+
+        intake = make_rows(args.users, offset=args.registrations)
+        # A duplicate and a bad email, to exercise the error report
+        intake.append((args.users + 2, dict(intake[0][1])))
+        intake.append((args.users + 3, {**intake[1][1], 'uiu_id': '0119999999', 'email': 'nope'}))
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            result = import_users(intake, workers=args.workers)
+            elapsed = time.perf_counter() - start
+        assert result.created == args.users and len(result.errors) == 2, result.errors
+        rows['import_users'] = summarize([elapsed], queries=len(captured),
+                                         users_per_sec=result.created / elapsed)
+
+    report(f'Creating {args.users} users (fast hasher; one-by-one on {args.registrations})', rows)
+
+    passwords = [(f'Onboard#{i:06d}xz', User(uiu_id=f'0112{i:06d}', email=f'0112{i:06d}@example.edu'))
+                 for i in range(args.hash_sample)]
+    rows = {}
+    start = time.perf_counter()
+    hash_passwords(passwords, workers=1)
+    serial = time.perf_counter() - start
+    rows['serial'] = {'seconds': serial, 'hashes_per_sec': len(passwords) / serial}
+    start = time.perf_counter()
+    hash_passwords(passwords, workers=args.workers)
+    pooled = time.perf_counter() - start
+    rows['process pool'] = {'seconds': pooled, 'hashes_per_sec': len(passwords) / pooled}
+    report(f'Checking and hashing {args.hash_sample} passwords with the default hasher '
+           f'({args.users} users at the pool rate: {args.users * pooled / len(passwords) / 60:.1f} min)', rows)
+
+
+if __name__ == '__main__':
+    main()
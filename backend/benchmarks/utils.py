@@ -0,0 +1,81 @@
+import os
+import statistics
+import time
+from contextlib import contextmanager
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+django.setup()
+
+from django.db import connection, connections  # noqa: E402
+from django.test.utils import (  # noqa: E402
+    CaptureQueriesContext, setup_test_environment, teardown_test_environment)
+
+
+@contextmanager
+def test_database(keepdb=False):
+    """
+    Run against a fresh test database. With keepdb, an existing one is reused
+    and left in place afterwards, so expensive fixtures survive between runs.
+    """
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=keepdb)
+    # Point mirrors such as the read-only alias at it, as the test runner does
+    for alias in connections:
+        mirror = connections[alias].settings_dict['TEST'].get('MIRROR')
+        if mirror:
+            connections[alias].creation.set_as_test_mirror(connections[mirror].settings_dict)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=keepdb)
+        teardown_test_environment()
+
+
+def measure(fn, iterations):
+    """Call `fn` repeatedly and return latency percentiles and query counts."""
+    timings = []
+    with CaptureQueriesContext(connection) as queries:
+        for _ in range(iterations):
+            start = time.perf_counter()
+            fn()
+            timings.append(time.perf_counter() - start)
+    return summarize(timings, queries=len(queries))
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(timings, **extra):
+    ordered = sorted(timings)
+    total = sum(ordered)
+    result = {
+        'count': len(ordered),
+        'mean_ms': statistics.fmean(ordered) * 1000 if ordered else 0.0,
+        'p50_ms': percentile(ordered, 0.50) * 1000,
+        'p95_ms': percentile(ordered, 0.95) * 1000,
+        'p99_ms': percentile(ordered, 0.99) * 1000,
+        'ops_per_sec': len(ordered) / total if total else 0.0,
+    }
+    if 'queries' in extra:
+        extra['queries_per_op'] = extra['queries'] / len(ordered) if ordered else 0.0
+    result.update(extra)
+    return result
+
+
+def report(title, rows):
+    print(f'\n{title}')
+    if not rows:
+        return
+    columns = list(next(iter(rows.values())).keys())
+    print(f"{'':<24}" + ''.join(f'{column:>16}' for column in columns))
+    for name, row in rows.items():
+        cells = ''.join(
+            f'{value:>16.3f}' if isinstance(value, float) else f'{value:>16}'
+            for value in row.values())
+        print(f'{name:<24}{cells}')
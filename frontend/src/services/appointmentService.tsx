@@ -32,18 +32,22 @@ export const appointmentService = {
     // Get all appointments for the logged-in user
     getAppointments: async (filters?: { status?: string; date?: string; emergency?: boolean }): Promise<Appointment[]> => {
         try {
-            const params = new URLSearchParams();
+            const params = new URLSearchParams({ page_size: '500' });
             if (filters?.status) params.append('status', filters.status);
             if (filters?.date) params.append('date', filters.date);
             if (filters?.emergency !== undefined) params.append('emergency', String(filters.emergency));
 
-            const queryString = params.toString();
-            const url = queryString ? `/appointments/?${queryString}` : '/appointments/';
-
-            const response = await api.get(url);
+            // The list is cursor-paginated; follow `next` until the last page
+            const results: any[] = [];
+            let url: string | null = `/appointments/?${params.toString()}`;
+            while (url) {
+                const response = await api.get(url);
+                results.push(...response.data.results);
+                url = response.data.next;
+            }
 
             // Transform backend response to frontend format
-            return response.data.map((apt: any) => ({
+            return results.map((apt: any) => ({
                 id: apt.id,
                 patientId: apt.patient_id,
                 patientName: apt.patient_name,